@@ -0,0 +1,272 @@
+import numpy
+
+from jamesql.columns import date_column_value
+
+# the number of buckets returned by a terms aggregation when "size" is not set
+DEFAULT_TERMS_SIZE = 10
+
+# the percentiles returned by a percentiles aggregation when "percents" is not set
+DEFAULT_PERCENTS = (1, 5, 25, 50, 75, 95, 99)
+
+# the NumPy datetime unit that the buckets of each date_histogram interval start on
+# weeks and quarters are not NumPy units, so they are rounded down from days and months
+DATE_HISTOGRAM_UNITS = {
+    "minute": "m",
+    "hour": "h",
+    "day": "D",
+    "week": "D",
+    "month": "M",
+    "quarter": "M",
+    "year": "Y",
+}
+
+# aggregations that count the documents in each key of a FLAT, NUMERIC or DATE GSI
+# every other aggregation is computed over the values in a NUMERIC or DATE column
+GSI_AGGREGATIONS = {"terms", "cardinality"}
+
+
+def format_value(value, dates: bool):
+    """
+    Returns a value computed from a column as a Python value. Dates are returned as
+    ISO 8601 strings.
+    """
+    if value is None:
+        return None
+
+    if dates:
+        return str(numpy.datetime64(int(round(float(value))), "s"))
+
+    return float(value)
+
+
+def bucket_counts(gsi, mask: numpy.ndarray = None) -> list:
+    """
+    Returns a (key, document count) tuple for every key in a GSI that has at least one
+    document.
+
+    If `mask` is set, only the documents whose doc id is True in the mask are counted.
+    """
+    counts = []
+
+    for key, doc_ids in gsi.items():
+        if mask is None:
+            count = len(doc_ids)
+        else:
+            doc_ids = numpy.asarray(doc_ids)
+            count = int(numpy.count_nonzero(mask[doc_ids[doc_ids < len(mask)]]))
+
+        if count:
+            counts.append((key, count))
+
+    return counts
+
+
+def terms(counts: list, options: dict) -> dict:
+    """
+    Returns the `size` keys with the most documents, in decreasing order of document count.
+    Keys with the same count are returned in the order of the GSI.
+    """
+    size = options.get("size", DEFAULT_TERMS_SIZE)
+
+    if not isinstance(size, int) or size < 0:
+        raise ValueError("The size of a terms aggregation must be a positive integer.")
+
+    counts = sorted(counts, key=lambda item: item[1], reverse=True)
+
+    return {
+        "buckets": [{"key": key, "doc_count": count} for key, count in counts[:size]]
+    }
+
+
+def cardinality(counts: list, options: dict) -> dict:
+    return {"value": len(counts)}
+
+
+def histogram(values: numpy.ndarray, options: dict, dates: bool) -> dict:
+    """
+    Returns the number of values in each bucket of `interval` width, starting at `offset`.
+
+    Buckets with no values are not returned.
+    """
+    if dates:
+        raise ValueError("Use a date_histogram aggregation to bucket DATE fields.")
+
+    interval = options.get("interval")
+    offset = options.get("offset", 0)
+
+    if not isinstance(interval, (int, float)) or interval <= 0:
+        raise ValueError("The interval of a histogram must be a positive number.")
+
+    keys = numpy.floor((values - offset) / interval) * interval + offset
+    keys, counts = numpy.unique(keys, return_counts=True)
+
+    return {
+        "buckets": [
+            {"key": float(key), "doc_count": int(count)}
+            for key, count in zip(keys, counts)
+        ]
+    }
+
+
+def date_histogram(values: numpy.ndarray, options: dict, dates: bool) -> dict:
+    """
+    Returns the number of dates in each calendar `interval`, such as "day" or "month".
+
+    Weeks start on a Monday. Buckets with no values are not returned.
+    """
+    if not dates:
+        raise ValueError("date_histogram aggregations can only be used on DATE fields.")
+
+    interval = options.get("interval")
+
+    if interval not in DATE_HISTOGRAM_UNITS:
+        raise ValueError(
+            "Invalid date_histogram interval. Must be one of: "
+            + ", ".join(DATE_HISTOGRAM_UNITS)
+            + "."
+        )
+
+    unit = DATE_HISTOGRAM_UNITS[interval]
+    starts = values.astype("datetime64[s]").astype(f"datetime64[{unit}]")
+
+    if interval == "week":
+        # 1970-01-01, the first day, was a Thursday
+        days = starts.astype(numpy.int64)
+        starts = (days - (days + 3) % 7).astype("datetime64[D]")
+    elif interval == "quarter":
+        months = starts.astype(numpy.int64)
+        starts = (months - months % 3).astype("datetime64[M]")
+
+    keys, counts = numpy.unique(starts, return_counts=True)
+
+    # buckets of a day or longer are keyed by the date they start on
+    key_unit = "s" if interval in ("minute", "hour") else "D"
+
+    return {
+        "buckets": [
+            {"key": str(key.astype(f"datetime64[{key_unit}]")), "doc_count": int(count)}
+            for key, count in zip(keys, counts)
+        ]
+    }
+
+
+def value_range(values: numpy.ndarray, options: dict, dates: bool) -> dict:
+    """
+    Returns the number of values in each of `ranges`. Each range includes its "from" value
+    and excludes its "to" value. Either value can be omitted.
+    """
+    ranges = options.get("ranges")
+
+    if not isinstance(ranges, list):
+        raise ValueError("A range aggregation must have a list of ranges.")
+
+    buckets = []
+
+    for bucket_range in ranges:
+        matches = numpy.ones(len(values), dtype=bool)
+        bucket = {}
+
+        for bound in ("from", "to"):
+            if bucket_range.get(bound) is None:
+                continue
+
+            value = bucket_range[bound]
+            bucket[bound] = value
+
+            if dates:
+                value = date_column_value(value)
+
+                if value is None:
+                    raise ValueError(f"{bucket_range[bound]} is not a valid date.")
+            elif not isinstance(value, (int, float)):
+                raise ValueError(f"{value} is not a number.")
+
+            if bound == "from":
+                matches &= values >= value
+            else:
+                matches &= values < value
+
+        bucket["doc_count"] = int(numpy.count_nonzero(matches))
+        buckets.append(bucket)
+
+    return {"buckets": buckets}
+
+
+def stats(values: numpy.ndarray, options: dict, dates: bool) -> dict:
+    """
+    Returns the number of values, and their minimum, maximum, average and sum.
+
+    The sum of dates is not meaningful, so it is not returned for DATE fields.
+    """
+    result = {
+        "count": len(values),
+        "min": min_value(values, options, dates)["value"],
+        "max": max_value(values, options, dates)["value"],
+        "avg": avg_value(values, options, dates)["value"],
+    }
+
+    if not dates:
+        result["sum"] = sum_value(values, options, dates)["value"]
+
+    return result
+
+
+def min_value(values: numpy.ndarray, options: dict, dates: bool) -> dict:
+    return {"value": format_value(values.min() if len(values) else None, dates)}
+
+
+def max_value(values: numpy.ndarray, options: dict, dates: bool) -> dict:
+    return {"value": format_value(values.max() if len(values) else None, dates)}
+
+
+def avg_value(values: numpy.ndarray, options: dict, dates: bool) -> dict:
+    return {"value": format_value(values.mean() if len(values) else None, dates)}
+
+
+def sum_value(values: numpy.ndarray, options: dict, dates: bool) -> dict:
+    if dates:
+        raise ValueError("sum aggregations can only be used on NUMERIC fields.")
+
+    return {"value": float(values.sum())}
+
+
+def percentiles(values: numpy.ndarray, options: dict, dates: bool) -> dict:
+    """
+    Returns the value below which each of `percents` percent of the values fall.
+
+    Percentiles are interpolated linearly between the two closest values.
+    """
+    percents = options.get("percents", DEFAULT_PERCENTS)
+
+    if not isinstance(percents, (list, tuple)) or not all(
+        isinstance(percent, (int, float)) and 0 <= percent <= 100
+        for percent in percents
+    ):
+        raise ValueError("percents must be a list of numbers between 0 and 100.")
+
+    if len(values) and len(percents):
+        results = numpy.percentile(values, percents)
+    else:
+        results = [None] * len(percents)
+
+    return {
+        "values": {
+            str(float(percent)): format_value(result, dates)
+            for percent, result in zip(percents, results)
+        }
+    }
+
+
+AGGREGATION_METHODS = {
+    "terms": terms,
+    "cardinality": cardinality,
+    "histogram": histogram,
+    "date_histogram": date_histogram,
+    "range": value_range,
+    "stats": stats,
+    "min": min_value,
+    "max": max_value,
+    "avg": avg_value,
+    "sum": sum_value,
+    "percentiles": percentiles,
+}
@@ -0,0 +1,124 @@
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+
+class LRUCache:
+    """
+    A thread-safe mapping that holds at most `maxsize` items.
+
+    When the cache is full, the least recently used item is evicted to make room for a new one.
+    If `ttl` is set, items also expire `ttl` seconds after they were added.
+
+    Items can be tagged with the data they were computed from, so that every item that depends
+    on a piece of data can be invalidated when it changes.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = None) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # each item is stored as a (value, expiry time, tags) tuple
+        self.items = OrderedDict()
+        self.keys_by_tag = defaultdict(set)
+        self.lock = threading.Lock()
+        # incremented on every invalidation, so that a value computed from data that changed
+        # while it was being computed is not added to the cache
+        self.generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __contains__(self, key) -> bool:
+        return key in self.items
+
+    def get(self, key, default=None):
+        with self.lock:
+            item = self.items.get(key)
+
+            if item is None:
+                self.misses += 1
+                return default
+
+            value, expires_at, _ = item
+
+            if expires_at is not None and expires_at <= time.monotonic():
+                self._remove(key)
+                self.evictions += 1
+                self.misses += 1
+                return default
+
+            self.items.move_to_end(key)
+            self.hits += 1
+
+            return value
+
+    def put(self, key, value, tags=(), generation: int = None) -> None:
+        """
+        Adds an item to the cache.
+
+        If `generation` is given and the cache has been invalidated since it was read, the
+        item is not added, because it may have been computed from data that has changed.
+        """
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+
+            if key in self.items:
+                self._remove(key)
+
+            if self.maxsize <= 0:
+                return
+
+            expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+            tags = frozenset(tags)
+
+            self.items[key] = (value, expires_at, tags)
+
+            for tag in tags:
+                self.keys_by_tag[tag].add(key)
+
+            while len(self.items) > self.maxsize:
+                self._remove(next(iter(self.items)))
+                self.evictions += 1
+
+    def invalidate(self, tags) -> None:
+        """
+        Removes every item that is tagged with one of `tags`.
+        """
+        with self.lock:
+            self.generation += 1
+
+            for tag in tags:
+                for key in list(self.keys_by_tag.get(tag, ())):
+                    self._remove(key)
+                    self.invalidations += 1
+
+    def clear(self) -> None:
+        with self.lock:
+            self.generation += 1
+            self.items.clear()
+            self.keys_by_tag.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self.items),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+    def _remove(self, key) -> None:
+        _, _, tags = self.items.pop(key)
+
+        for tag in tags:
+            keys = self.keys_by_tag[tag]
+            keys.discard(key)
+
+            if not keys:
+                del self.keys_by_tag[tag]
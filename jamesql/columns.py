@@ -0,0 +1,157 @@
+import datetime
+
+import numpy
+
+# numeric values are stored as floats, and dates as the number of seconds since the Unix epoch
+NUMERIC_COLUMN_DTYPE = numpy.float64
+DATE_COLUMN_DTYPE = numpy.int64
+
+# the minimum number of doc ids that a column grows by when a document is added
+COLUMN_GROWTH = 1024
+
+
+def numeric_column_value(value):
+    """
+    Returns the value of a NUMERIC field as it is stored in a column, or None if it cannot be
+    stored.
+
+    Only numbers are stored. Lists and numeric strings are sorted differently from numbers, so
+    documents with those values are read from the document instead.
+    """
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+
+    return float(value)
+
+
+def date_column_value(value):
+    """
+    Returns the value of a DATE field as it is stored in a column, or None if it cannot be
+    stored.
+
+    Dates can be ISO 8601 strings, such as "2024-01-01" or "2024-01-01T12:00:00", or
+    `datetime` objects.
+    """
+    if not isinstance(value, (str, datetime.date)):
+        return None
+
+    try:
+        timestamp = numpy.datetime64(value, "s")
+    except (TypeError, ValueError):
+        return None
+
+    if numpy.isnat(timestamp):
+        return None
+
+    return int(timestamp.astype(DATE_COLUMN_DTYPE))
+
+
+class Column:
+    """
+    The values of a NUMERIC or DATE field for every document, indexed by doc id.
+
+    Columns let searches sort and score documents with vectorized NumPy operations instead of
+    reading a value from every document.
+    """
+
+    def __init__(self, dates: bool = False) -> None:
+        self.dates = dates
+        self.dtype = DATE_COLUMN_DTYPE if dates else NUMERIC_COLUMN_DTYPE
+        self.values = numpy.zeros(0, dtype=self.dtype)
+        # whether each doc id has a value in the column
+        self.present = numpy.zeros(0, dtype=bool)
+
+    @classmethod
+    def from_arrays(cls, values, present, dates: bool = False) -> "Column":
+        """
+        Creates a read-only column from existing arrays, such as views of a segment.
+        """
+        column = cls(dates)
+        column.values = values
+        column.present = present
+
+        return column
+
+    def __len__(self) -> int:
+        return int(numpy.count_nonzero(self.present))
+
+    def set(self, doc_id: int, value) -> None:
+        """
+        Stores the value of a field for a document. Values that cannot be stored are recorded
+        as missing.
+        """
+        if doc_id >= len(self.values):
+            size = max(doc_id + 1, len(self.values) * 2, COLUMN_GROWTH)
+
+            # arrays are replaced rather than resized, so concurrent searches never read an
+            # array while it is being resized
+            values = numpy.zeros(size, dtype=self.dtype)
+            values[: len(self.values)] = self.values
+            present = numpy.zeros(size, dtype=bool)
+            present[: len(self.present)] = self.present
+
+            self.values, self.present = values, present
+
+        value = date_column_value(value) if self.dates else numeric_column_value(value)
+
+        if value is None:
+            self.present[doc_id] = False
+        else:
+            self.values[doc_id] = value
+            self.present[doc_id] = True
+
+    def remove(self, doc_id: int) -> None:
+        if doc_id < len(self.present):
+            self.present[doc_id] = False
+
+    def compact(self, doc_ids: numpy.ndarray) -> "Column":
+        """
+        Returns a column that holds the value of the i-th doc id in a sorted array of doc
+        ids at doc id i.
+        """
+        values, present = self.values, self.present
+
+        doc_ids = doc_ids[doc_ids < min(len(values), len(present))]
+
+        return Column.from_arrays(values[doc_ids], present[doc_ids], self.dates)
+
+    def take(self, doc_ids: numpy.ndarray):
+        """
+        Returns the values of a field for `doc_ids`, in the same order, or None if any of the
+        documents does not have a value in the column.
+        """
+        values, present = self.values, self.present
+
+        if len(doc_ids) and doc_ids.max() >= min(len(values), len(present)):
+            return None
+
+        if not present[doc_ids].all():
+            return None
+
+        return values[doc_ids]
+
+    def present_values(self, doc_ids: numpy.ndarray) -> numpy.ndarray:
+        """
+        Returns the values of a field for the documents in `doc_ids` that have a value in the
+        column. Documents without a value are skipped.
+        """
+        values, present = self.values, self.present
+
+        doc_ids = doc_ids[doc_ids < min(len(values), len(present))]
+
+        return values[doc_ids[present[doc_ids]]]
+
+    def argsort(self, doc_ids: numpy.ndarray, reverse: bool = False):
+        """
+        Returns `doc_ids` in order of their values, or None if any of the documents does not
+        have a value in the column.
+
+        The sort is stable, so documents with the same value stay in the order of `doc_ids`,
+        whether the values are sorted in increasing or decreasing order.
+        """
+        values = self.take(doc_ids)
+
+        if values is None:
+            return None
+
+        return doc_ids[numpy.argsort(-values if reverse else values, kind="stable")]
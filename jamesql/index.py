@@ -1,13 +1,19 @@
+import copy
 import hashlib
+import heapq
+import itertools
 import json
 import math
 import os
 import gc
-import string
+import pickle
+import struct
 import threading
 import time
 import uuid
-from collections import defaultdict
+import zlib
+from array import array
+from collections import Counter, defaultdict
 from enum import Enum
 from functools import lru_cache
 from operator import itemgetter
@@ -15,19 +21,64 @@ from typing import Dict, List
 
 import orjson
 import numpy
-import pybmoore
 import pygtrie
 from BTrees.OOBTree import OOBTree
 import datetime
 from lark import Lark
 from nltk import download
 from nltk.corpus import stopwords
-from sortedcontainers import SortedDict
 
-from jamesql.rewriter import grammar as rewriter_grammar
-from jamesql.rewriter import string_query_to_jamesql
-
-from .script_lang import JameSQLScriptTransformer, grammar
+from jamesql.aggregations import AGGREGATION_METHODS, GSI_AGGREGATIONS, bucket_counts
+from jamesql.cache import LRUCache
+from jamesql.columns import Column
+from jamesql.planner import (
+    QUERY_PLAN_CACHE_SIZE,
+    BooleanQuery,
+    EmptyQuery,
+    QueryPlan,
+    TermQuery,
+    plan_expands_terms,
+    plan_fields,
+    plan_negates,
+    query_cache_key,
+    search_cache_key,
+)
+from jamesql.postings import (
+    DOC_ID_DTYPE,
+    EMPTY_DOC_IDS,
+    EMPTY_POSITION_KEYS,
+    POSITION_BITS,
+    POSTING_LIST_COMPRESSION,
+    PostingList,
+    VarintPostingList,
+    difference,
+    doc_id_array,
+    insert_doc_id,
+    intersect,
+    intersect_posting_lists,
+    remove_doc_id,
+    to_numpy,
+    union,
+)
+from jamesql.proximity import (
+    DEFAULT_PROXIMITY_DISTANCE,
+    PROXIMITY_METHODS,
+    key_doc_ids,
+)
+from jamesql.ranking import max_score_top_k
+from jamesql.rewriter import STRING_QUERY_PARSER, string_query_to_jamesql
+from jamesql.segment import Segment, write_segment
+from jamesql.sketches import (
+    HYPERLOGLOG_PRECISION,
+    MAXIMUM_HYPERLOGLOG_PRECISION,
+    MINIMUM_HYPERLOGLOG_PRECISION,
+    HyperLogLog,
+    add_document_to_sketches,
+    document_sketches,
+)
+from jamesql.term_index import DeletionIndex, KGramIndex
+
+from .script_lang import JameSQLScriptCompiler, grammar
 
 if not os.path.exists(os.path.expanduser("~") + "/nltk_data"):
     download("stopwords")
@@ -35,6 +86,41 @@ if not os.path.exists(os.path.expanduser("~") + "/nltk_data"):
 INDEX_STORE = os.path.join(os.path.expanduser("~"), ".jamesql")
 JOURNAL_FILE = os.path.join(os.getcwd(), "journal.jamesql")
 INDEX_DATA_FILE = os.path.join(os.getcwd(), "index.jamesql")
+INDEX_SNAPSHOT_FILE = os.path.join(os.getcwd(), "snapshot.jamesql")
+INDEX_SEGMENT_FILE = os.path.join(os.getcwd(), "segment.jamesql")
+
+# snapshots start with a fixed header:
+# magic bytes, format version, payload length, and a CRC32 of the payload
+SNAPSHOT_MAGIC = b"JAMESQL\x00"
+SNAPSHOT_VERSION = 5
+SNAPSHOT_HEADER = struct.Struct("<8sHQI")
+
+# every attribute that holds index state and is written to a snapshot
+SNAPSHOT_ATTRIBUTES = [
+    "global_index",
+    "uuids_to_position_in_global_index",
+    "doc_uuids",
+    "gsis",
+    "autosuggest_index",
+    "autosuggest_on",
+    "doc_lengths",
+    "document_length_columns",
+    "document_length_words",
+    "columns",
+    "field_sketches",
+    "stale_sketches",
+    "sketch_precision",
+    "word_counts",
+    "document_frequencies",
+    "field_document_counts",
+    "field_lengths",
+    "max_term_counts",
+    "field_min_lengths",
+    "k1",
+    "b",
+    "enable_experimental_bm25_ranker",
+    "match_limit_for_large_result_pages",
+]
 
 END_OF_SENTENCE_TOKEN = "eos"
 
@@ -43,14 +129,48 @@ if not os.path.exists(INDEX_STORE):
 
 KEYW0RDS = ["and", "or", "not"]
 
-METHODS = {"and": set.intersection, "or": set.union, "not": set.difference}
+# query results are sorted arrays of doc ids, so boolean operators are merges
+METHODS = {"and": intersect, "or": union, "not": difference}
 
-RESERVED_QUERY_TERMS = ["strict", "boost", "highlight", "highlight_stride"]
+RESERVED_QUERY_TERMS = [
+    "strict",
+    "boost",
+    "highlight",
+    "highlight_stride",
+    "slop",
+    "distance",
+]
 
 # this is the maximum number of individual sub-queries
 # that can be run in a single query
 MAXIMUM_QUERY_STATEMENTS = 20
 
+# results are read in order from a NUMERIC or DATE GSI, instead of being sorted, when at
+# least this fraction of the documents in the index match the query
+SORT_BY_INDEX_MIN_RESULTS = 0.25
+
+# the number of groups returned by a group_by when "size" is not set
+DEFAULT_GROUP_SIZE = 10
+
+# the number of search responses cached for each index
+RESULT_CACHE_SIZE = 1024
+
+# the number of spelling corrections cached for each index
+SPELLING_CACHE_SIZE = 4096
+
+# the maximum number of phrases that a strict or highlighted wildcard query is expanded to
+# when several of its words match many terms
+MAXIMUM_WILDCARD_PHRASES = 1024
+
+# cached responses are tagged with the fields and documents they were computed from
+# responses that can change when any document is written, such as "*" queries, are tagged
+# with ALL_DOCUMENTS_TAG
+ALL_DOCUMENTS_TAG = ("documents",)
+
+# compiled plans whose terms were expanded from the words in the index, such as fuzzy
+# queries, are tagged with VOCABULARY_TAG and recompiled when a new word is indexed
+VOCABULARY_TAG = ("vocabulary",)
+
 stop_words = set(stopwords.words("english"))
 
 
@@ -65,6 +185,16 @@ class GSI_INDEX_STRATEGIES(Enum):
     TRIGRAM_CODE = "trigram_code"
 
 
+# the GSI strategies whose string keys fuzzy and wildcard queries are expanded to
+# fuzzy queries on other GSIs look up the query term as it is written, and wildcard queries
+# on other GSIs match nothing
+TERM_EXPANSION_STRATEGIES = (
+    GSI_INDEX_STRATEGIES.CONTAINS,
+    GSI_INDEX_STRATEGIES.PREFIX,
+    GSI_INDEX_STRATEGIES.FLAT,
+)
+
+
 class RANKING_STRATEGIES(Enum):
     BOOST = "BOOST"
 
@@ -77,53 +207,224 @@ def parse_script_score(query: str) -> dict:
     return JAMESQL_SCRIPT_SCORE_PARSER.parse(query)
 
 
+@lru_cache()
+def compile_script_score(query: str):
+    """
+    Compiles a script score into a function that scores every result document at once.
+    """
+    return JameSQLScriptCompiler().transform(parse_script_score(query))
+
+
+# each method returns the doc id arrays of every matching key
 QUERY_TYPE_COMPARISON_METHODS = {
-    "greater_than": lambda query_term, gsi: [
-        # convert all values to str
-        doc_uuid for doc_uuid in gsi.values(min=query_term, excludemin=True)
-    ],
-    "less_than": lambda query_term, gsi: [
-        doc_uuid for doc_uuid in gsi.values(max=query_term, excludemax=True)
-    ],
-    "greater_than_or_equal": lambda query_term, gsi: [
-        doc_uuid for doc_uuid in gsi.values(min=query_term)
-    ],
-    "less_than_or_equal": lambda query_term, gsi: [
-        doc_uuid for doc_uuid in gsi.values(max=query_term)
-    ],
+    "greater_than": lambda query_term, gsi: list(
+        gsi.values(min=query_term, excludemin=True)
+    ),
+    "less_than": lambda query_term, gsi: list(
+        gsi.values(max=query_term, excludemax=True)
+    ),
+    "greater_than_or_equal": lambda query_term, gsi: list(gsi.values(min=query_term)),
+    "less_than_or_equal": lambda query_term, gsi: list(gsi.values(max=query_term)),
+}
+
+# each predicate tests whether a single stored value matches a query term, so that candidate
+# documents can be checked without reading every matching key from a GSI
+QUERY_TYPE_VALUE_PREDICATES = {
+    "range": lambda value, query_term: query_term[0] <= value <= query_term[1],
+    "greater_than": lambda value, query_term: value > query_term,
+    "less_than": lambda value, query_term: value < query_term,
+    "greater_than_or_equal": lambda value, query_term: value >= query_term,
+    "less_than_or_equal": lambda value, query_term: value <= query_term,
 }
 
+# the arguments that select the keys a range or comparison query reads from an OOBTree
+QUERY_TYPE_KEY_RANGES = {
+    "range": lambda query_term: {"min": query_term[0], "max": query_term[1]},
+    "greater_than": lambda query_term: {"min": query_term, "excludemin": True},
+    "less_than": lambda query_term: {"max": query_term, "excludemax": True},
+    "greater_than_or_equal": lambda query_term: {"min": query_term},
+    "less_than_or_equal": lambda query_term: {"max": query_term},
+}
+
+
+def project_document(document: dict, fields: list = None) -> dict:
+    """
+    Returns a document with only `fields` and its `uuid`. If `fields` is None, the document
+    is returned unchanged.
+    """
+    if fields is None:
+        return document
+
+    return {field: document[field] for field in ["uuid", *fields] if field in document}
+
+
+def copy_response(result: dict) -> dict:
+    """
+    Returns a copy of a search response that can be modified without changing the original.
+    """
+    copied = {
+        **result,
+        "documents": [dict(document) for document in result["documents"]],
+    }
+
+    if "groups" in result:
+        copied["groups"] = defaultdict(
+            list,
+            {
+                group: [dict(document) for document in documents]
+                for group, documents in result["groups"].items()
+            },
+        )
+
+    for key in ["metrics", "spelling_substitutions", "group_counts"]:
+        if key in result:
+            copied[key] = dict(result[key])
+
+    if "aggregations" in result:
+        copied["aggregations"] = copy.deepcopy(result["aggregations"])
+
+    return copied
+
+
+def result_sort_key(field: str):
+    """
+    Returns a sort key for (document, score) search results that sorts by `field`.
+    """
+    if field == "_score":
+        return itemgetter(1)
+
+    return lambda result: result[0][field]
+
+
+def sort_results(results: list, key, reverse: bool, limit: int = None) -> list:
+    """
+    Returns the first `limit` results of `sorted(results, key=key, reverse=reverse)`.
+
+    When only the first page of results is needed, a heap is used to select it, which is
+    O(n log limit) instead of O(n log n).
+    """
+    if limit is None or limit >= len(results):
+        return sorted(results, key=key, reverse=reverse)
+
+    if reverse:
+        return heapq.nlargest(limit, results, key=key)
 
-def get_trigrams(line):#
+    return heapq.nsmallest(limit, results, key=key)
+
+
+def reversed_items(tree: OOBTree):
+    """
+    Yields the items in an OOBTree in decreasing order of key.
+
+    OOBTrees can only be iterated in increasing order, so items are read in slices from the
+    end of the tree. Slices double in size, so reading the first few items is cheap.
+    """
+    items = tree.items()
+    end = len(items)
+    slice_size = 64
+
+    while end > 0:
+        start = max(end - slice_size, 0)
+
+        yield from reversed(items[start:end])
+
+        end = start
+        slice_size *= 2
+
+
+def posting_count(postings) -> int:
+    """
+    Returns the number of documents in a GSI entry, or 0 if there is no entry.
+    """
+    return 0 if postings is None else len(postings)
+
+
+def document_length_column() -> array:
+    return array("I")
+
+
+def get_trigrams(line):
     return [line[i : i + 3] for i in range(len(line) - 2)]
 
 
 class JameSQL:
-    SELF_METHODS = {"close_to": "_close_to"}
+    def __init__(
+        self,
+        match_limit_for_large_result_pages=1000,
+        sketch_precision: int = HYPERLOGLOG_PRECISION,
+        spelling_cache_size: int = SPELLING_CACHE_SIZE,
+        result_cache_size: int = RESULT_CACHE_SIZE,
+        result_cache_ttl: float = None,
+    ) -> None:
+        if not (
+            MINIMUM_HYPERLOGLOG_PRECISION
+            <= sketch_precision
+            <= MAXIMUM_HYPERLOGLOG_PRECISION
+        ):
+            raise ValueError(
+                f"sketch_precision must be between {MINIMUM_HYPERLOGLOG_PRECISION} "
+                f"and {MAXIMUM_HYPERLOGLOG_PRECISION}."
+            )
 
-    def __init__(self, match_limit_for_large_result_pages=1000) -> None:
         self.global_index = {}
+        # every document has a dense integer doc id, which GSIs use in place of its UUID
+        # doc ids are not reused until the index is compacted, so the UUID of a removed
+        # document is None
         self.uuids_to_position_in_global_index = {}
+        self.doc_uuids = []
         self.gsis = {}
         self.last_transaction_after_recovery = None
         self.autosuggest_index = {}
         self.doc_lengths = defaultdict(dict)
+        # the length of every string field, indexed by doc id, used to score documents in bulk
+        self.document_length_columns = defaultdict(document_length_column)
         self.document_length_words = defaultdict(int)
+        # the values of every NUMERIC and DATE field, indexed by doc id, used to sort and score
+        # documents in bulk
+        self.columns = {}
+        # a HyperLogLog sketch of the distinct values of every field, updated on every add
+        # values cannot be removed from a sketch, so the sketches of fields whose values were
+        # updated or removed are marked as stale and rebuilt when they are next read
+        self.field_sketches = {}
+        self.stale_sketches = set()
+        self.sketch_precision = sketch_precision
         self.autosuggest_on = None
         self.word_counts = defaultdict(int)
-        self.string_query_parser = Lark(
-            rewriter_grammar,
-            parser="earley",
-            propagate_positions=False,
-            maybe_placeholders=False,
-        )
+        # a fuzzy index of every word in `word_counts`, built when it is first read
+        self.term_index = None
+        # a k-gram index of the string keys of each GSI, built when it is first read
+        # wildcard queries, and contains queries on PREFIX and FLAT GSIs, look up the keys
+        # they match in it, instead of scanning every key
+        self.key_indexes = {}
+        # a fuzzy index of the words in the string keys of each PREFIX and FLAT GSI, built
+        # when a fuzzy query on the field is first compiled
+        self.fuzzy_indexes = {}
+        self.string_query_parser = STRING_QUERY_PARSER
         self.match_limit_for_large_result_pages = match_limit_for_large_result_pages
-        self.tf = defaultdict(dict)
-        self.idf = {}
-        self.tf_idf = defaultdict(lambda: SortedDict())
-        self.bm25 = defaultdict(lambda: SortedDict())
-        self.reverse_tf_idf = defaultdict(lambda: SortedDict())
+        # corpus statistics for CONTAINS fields, kept up to date on every write
+        # IDF-dependent scores are computed from these at query time
+        self.document_frequencies = defaultdict(Counter)
+        self.field_document_counts = Counter()
+        self.field_lengths = Counter()
+        # the largest number of times each word appears in a document of each CONTAINS
+        # field, and the length of the shortest value of each string field
+        # these bound the BM25 score of a word, so they are not lowered when documents are
+        # removed
+        self.max_term_counts = defaultdict(Counter)
+        self.field_min_lengths = {}
         self.write_lock = threading.Lock()
+        # set when the index is opened from a read-only segment
+        self.segment = None
+        # compiled query plans, keyed by the query they were compiled from
+        self.query_plans = LRUCache(QUERY_PLAN_CACHE_SIZE)
+        # search responses, invalidated when a document they depend on is written, and
+        # expired `result_cache_ttl` seconds after they were cached if it is set
+        self.result_cache = LRUCache(result_cache_size, ttl=result_cache_ttl)
+        # spelling corrections, keyed by the word and the vocabulary epoch they were made in
+        # the epoch is incremented whenever `word_counts` changes, so corrections made from
+        # the previous counts are never read again, and are evicted as the cache fills
+        self.spelling_cache = LRUCache(spelling_cache_size)
+        self.vocabulary_epoch = 0
 
         self.k1 = 1.5
         self.b = 0.75
@@ -133,138 +434,514 @@ class JameSQL:
     def __len__(self):
         return len(self.global_index)
 
-    def _close_to(self, query: list) -> dict:
+    def _create_reverse_index(
+        self, documents, index_by: str, compression: str = None
+    ) -> Dict[str, PostingList]:
         """
-        Accepts a query and returns a query that is close to the original query.
+        Accepts an iterable of (doc id, document) pairs and returns a reverse index of
+        the `index_by` field in the form:
 
-        This is useful for finding documents that are similar to the original query.
+        {word: PostingList}
+
+        Where `word` is every word in the field. Each `PostingList` stores the doc ids of the
+        documents that contain the word, and the positions and number of times the word
+        appears in each document. If `compression` is set, posting lists are compressed.
+
+        The corpus statistics for the field are rebuilt along with the index.
         """
-        matching_documents = set()
 
-        positions = defaultdict(int)
+        index = defaultdict(POSTING_LIST_COMPRESSION[compression])
 
-        stride = query[0].get("distance", 3)
+        self.document_frequencies[index_by] = Counter()
+        self.max_term_counts[index_by] = Counter()
+        self.field_document_counts[index_by] = 0
+        self.field_lengths[index_by] = 0
 
-        for i, item in enumerate(query):
-            if i == 0:
-                continue
+        for doc_id, document in documents:
+            if isinstance(document.get(index_by), str):
+                self._add_to_reverse_index(index, index_by, document, doc_id)
 
-            field = list(item.keys())[0]
-            value = item[field]
+        return index
 
-            previous_word = (
-                query[i - 1][list(query[i - 1].keys())[0]] if i > 0 else None
-            )
+    def _add_to_reverse_index(
+        self, index: dict, field: str, document: dict, doc_id: int
+    ) -> None:
+        """
+        Adds the words in a field of a document to a reverse index, and updates the corpus
+        statistics for the field.
 
-            if not self.gsis.get(field):
-                self.create_gsi(field, GSI_INDEX_STRATEGIES.INFER)
+        This only touches the words in the document. Scores that depend on IDF are computed
+        at query time, so adding a document never requires a pass over the corpus.
+        """
 
-            gsi = self.gsis[field]
-            gsi_index = gsi["gsi"]
+        value = document[field]
+        words = value.split()
 
-            previous_word_positions = gsi_index.get(previous_word)["documents"]["uuid"]
-            current_word_positions = gsi_index.get(value)["documents"]["uuid"]
+        word_positions = defaultdict(list)
+        new_words = []
 
-            stride_range = range(-stride, stride + 1)
+        for pos, word in enumerate(words):
+            word_lower = word.lower()
 
-            if gsi["strategy"] == GSI_INDEX_STRATEGIES.CONTAINS.name:
-                for doc_id, positions in current_word_positions.items():
-                    if doc_id not in previous_word_positions:
-                        continue
+            word_positions[word_lower].append(pos)
 
-                    if matching_documents and doc_id not in matching_documents:
-                        continue
+            for counted_word in (word_lower, word):
+                if counted_word not in self.word_counts:
+                    new_words.append(counted_word)
 
-                    for position in set(positions):
-                        for stride_value in stride_range:
-                            if (
-                                position + stride_value
-                                in previous_word_positions[doc_id]
-                            ):
-                                matching_documents.add(doc_id)
+            self.word_counts[word_lower] += 1
+            self.word_counts[word] += 1
 
-        documents = [self.global_index.get(doc_id) for doc_id in matching_documents]
+        new_terms = [word for word in word_positions if word not in index]
 
-        return documents
+        for word, positions in word_positions.items():
+            index[word].add(doc_id, positions, len(positions))
 
-    def _create_reverse_index(
-        self, documents: str, index_by: str
-    ) -> Dict[str, List[int]]:
+        if words:
+            self.vocabulary_epoch += 1
+
+        if new_words or new_terms:
+            self._add_to_term_indexes(field, new_words, new_terms)
+
+        # the full value is indexed so fields can be queried with "equals"
+        if value not in word_positions:
+            index[value].add(doc_id, [0], 0)
+
+        for word, positions in word_positions.items():
+            self.document_frequencies[field][word] += 1
+
+            if len(positions) > self.max_term_counts[field][word]:
+                self.max_term_counts[field][word] = len(positions)
+
+        self.field_document_counts[field] += 1
+        self.field_lengths[field] += len(words)
+
+    def _term_index(self) -> DeletionIndex:
+        """
+        Returns the fuzzy index of every word in a CONTAINS GSI.
+
+        The index is built from `word_counts` the first time it is read, and new words are
+        added to it as documents are indexed.
         """
-        Accepts a document and returns a reverse index of the document in the form:
+        term_index = self.term_index
 
-        {word: word_count}
+        if term_index is None:
+            with self.write_lock:
+                if self.term_index is None:
+                    self.term_index = DeletionIndex()
+                    self.term_index.update(list(self.word_counts))
 
-        Where `word` is every word in the document and `word_count` is the number of times it appears.
+                term_index = self.term_index
+
+        return term_index
+
+    def _add_to_term_indexes(self, field: str, words: list, terms: list) -> None:
         """
+        Adds words that were not in `word_counts` to the fuzzy index, and words that were not
+        in the GSI of `field` to the key index of that field.
 
-        index = defaultdict(
-            lambda: {
-                "count": 0,
-                "documents": {"uuid": defaultdict(set), "count": defaultdict(int)},
-            }
+        Plans with terms expanded from the words that were indexed before are recompiled.
+        """
+        if self.term_index is not None:
+            self.term_index.update(words)
+
+        if field in self.key_indexes:
+            self.key_indexes[field].update(terms)
+
+        self.query_plans.invalidate([VOCABULARY_TAG])
+
+    def _key_index(self, field: str) -> KGramIndex:
+        """
+        Returns the k-gram index of the string keys in the GSI of a field.
+
+        The index is built from the keys of the GSI the first time it is read, and new keys
+        are added to it as documents are indexed. The keys of a CONTAINS GSI that hold the
+        full value of a field are not words, so they are not indexed.
+        """
+        key_index = self.key_indexes.get(field)
+
+        if key_index is None:
+            with self.write_lock:
+                if field not in self.key_indexes:
+                    key_index = KGramIndex()
+
+                    if (
+                        self.gsis[field]["strategy"]
+                        == GSI_INDEX_STRATEGIES.CONTAINS.name
+                    ):
+                        key_index.update(
+                            term
+                            for term in list(self.gsis[field]["gsi"])
+                            if term.split() == [term] and term == term.lower()
+                        )
+                    else:
+                        key_index.update(
+                            key
+                            for key in list(self.gsis[field]["gsi"])
+                            if isinstance(key, str)
+                        )
+
+                    self.key_indexes[field] = key_index
+
+                key_index = self.key_indexes[field]
+
+        return key_index
+
+    def _fuzzy_index(self, field: str) -> DeletionIndex:
+        """
+        Returns the fuzzy index of the words in the string keys of a PREFIX or FLAT GSI.
+
+        The index is built from the keys of the GSI the first time it is read, and the words
+        of new keys are added to it as documents are indexed.
+        """
+        fuzzy_index = self.fuzzy_indexes.get(field)
+
+        if fuzzy_index is None:
+            with self.write_lock:
+                if field not in self.fuzzy_indexes:
+                    fuzzy_index = DeletionIndex()
+                    fuzzy_index.update(
+                        word
+                        for key in list(self.gsis[field]["gsi"])
+                        if isinstance(key, str)
+                        for word in key.split()
+                    )
+
+                    self.fuzzy_indexes[field] = fuzzy_index
+
+                fuzzy_index = self.fuzzy_indexes[field]
+
+        return fuzzy_index
+
+    def _add_key_to_term_indexes(self, field: str, key) -> None:
+        """
+        Adds a new key of a PREFIX or FLAT GSI to the key and fuzzy indexes of the field, if
+        they have been built.
+
+        Plans with terms expanded from the keys that were indexed before are recompiled.
+        """
+        if not isinstance(key, str):
+            return
+
+        if field in self.key_indexes:
+            self.key_indexes[field].add(key)
+
+        if field in self.fuzzy_indexes:
+            self.fuzzy_indexes[field].update(key.split())
+
+        if field in self.key_indexes or field in self.fuzzy_indexes:
+            self.query_plans.invalidate([VOCABULARY_TAG])
+
+    def _remove_key_from_term_indexes(self, field: str, key) -> None:
+        """
+        Removes a key that is no longer in the GSI of a field from the key and fuzzy indexes
+        of the field, if they have been built.
+        """
+        if not isinstance(key, str):
+            return
+
+        if field in self.key_indexes:
+            self.key_indexes[field].remove(key)
+
+        if field in self.fuzzy_indexes:
+            for word in key.split():
+                self.fuzzy_indexes[field].remove(word)
+
+        if field in self.key_indexes or field in self.fuzzy_indexes:
+            self.query_plans.invalidate([VOCABULARY_TAG])
+
+    def _wildcard_query_terms(self, field: str, query_term: str, phrases: bool) -> list:
+        """
+        Returns the terms that a wildcard query on a CONTAINS field looks up.
+
+        Each word with a `*` or `?` is replaced by every word in the GSI that matches it. If
+        `phrases` is False, words are matched independently, so each word is returned once.
+        Otherwise, every phrase made from the matching words is returned, up to
+        MAXIMUM_WILDCARD_PHRASES.
+        """
+        gsi = self.gsis[field]["gsi"]
+        expansions = []
+
+        for word in query_term.lower().split():
+            if "*" in word or "?" in word:
+                expansions.append(
+                    [
+                        term
+                        for term in self._key_index(field).search(word)
+                        if term in gsi
+                    ]
+                )
+            else:
+                expansions.append([word])
+
+        if not phrases:
+            return list(dict.fromkeys(term for terms in expansions for term in terms))
+
+        return [
+            " ".join(words)
+            for words in itertools.islice(
+                itertools.product(*expansions), MAXIMUM_WILDCARD_PHRASES
+            )
+        ]
+
+    def _wildcard_key_terms(self, field: str, pattern: str) -> list:
+        """
+        Returns every key in a PREFIX or FLAT GSI that matches a wildcard pattern.
+
+        The keys of a PREFIX GSI hold the first `prefix_limit` characters of each value, so
+        the pattern is matched against those characters.
+        """
+        gsi = self.gsis[field]["gsi"]
+
+        return [key for key in self._key_index(field).search(pattern) if key in gsi]
+
+    def _fuzzy_terms(self, word: str) -> list:
+        """
+        Returns every word in a CONTAINS GSI within one edit of a word.
+
+        Words are never removed from the fuzzy index, so words that are no longer in any
+        document are skipped.
+        """
+        return [
+            term for term in self._term_index().search(word) if term in self.word_counts
+        ]
+
+    def _remove_from_reverse_index(
+        self, index: dict, field: str, document: dict, doc_id: int
+    ) -> None:
+        """
+        Removes the words in a field of a document from a reverse index, and updates the
+        corpus statistics for the field.
+        """
+
+        value = document[field]
+        words = value.split()
+
+        unique_words_in_document = set()
+
+        for word in words:
+            for counted_word in (word.lower(), word):
+                self.word_counts[counted_word] -= 1
+
+                if self.word_counts[counted_word] <= 0:
+                    del self.word_counts[counted_word]
+
+            unique_words_in_document.add(word.lower())
+
+        if words:
+            self.vocabulary_epoch += 1
+
+        for term in unique_words_in_document | {value}:
+            entry = index.get(term)
+
+            if entry is None:
+                continue
+
+            entry.remove(doc_id)
+
+            if not len(entry):
+                del index[term]
+                self._remove_key_from_term_indexes(field, term)
+
+        for word in unique_words_in_document:
+            self.document_frequencies[field][word] -= 1
+
+            if self.document_frequencies[field][word] <= 0:
+                del self.document_frequencies[field][word]
+                self.max_term_counts[field].pop(word, None)
+
+        self.field_document_counts[field] -= 1
+        self.field_lengths[field] -= len(words)
+
+    def _inverse_document_frequency(self, field: str, term: str) -> float:
+        document_frequency = self.document_frequencies.get(field, {}).get(term, 0)
+        total_documents = self.field_document_counts[field]
+
+        return math.log(
+            (total_documents - document_frequency + 0.5) / (document_frequency + 0.5)
+            + 1
         )
 
-        total_documents = len(documents)
-        document_frequencies = defaultdict(int)
+    def _term_scores(
+        self, field: str, term: str, candidates: numpy.ndarray = None
+    ) -> Dict[int, float]:
+        """
+        Returns the TF-IDF score of a term for every document whose `field` contains the term,
+        keyed by doc id.
 
-        for document in documents:
-            word_count = defaultdict(int)  # Track word counts in this document
-            words = document[index_by].split()  # Tokenize the document
+        If `candidates` is given, only documents in that sorted array of doc ids are scored.
+        """
+
+        entry = self.gsis[field]["gsi"].get(term)
+
+        if entry is None:
+            return {}
+
+        if candidates is not None and len(candidates) < len(entry):
+            # look up each candidate, instead of reading the whole posting list
+            doc_ids = entry.intersect(candidates)
+            counts = numpy.array(
+                [entry.count_of(doc_id) for doc_id in doc_ids.tolist()]
+            )
+        else:
+            doc_ids = entry.doc_ids()
+            counts = entry.term_counts()
+
+            if candidates is not None:
+                keep = numpy.isin(doc_ids, candidates, assume_unique=True)
+                doc_ids, counts = doc_ids[keep], counts[keep]
+
+        scores = counts * self._inverse_document_frequency(field, term)
+
+        return dict(zip(doc_ids.tolist(), scores.tolist()))
+
+    def _term_positions(self, field: str, term: str, doc_id: int) -> list:
+        entry = self.gsis[field]["gsi"].get(term)
+
+        if entry is None:
+            return []
+
+        return entry.positions_of(doc_id)
 
-            unique_words_in_document = set()
+    def _bm25_term_score(self, field: str, term: str, doc_uuid: str) -> float:
+        entry = self.gsis[field]["gsi"].get(term)
 
-            index[document[index_by]]["documents"]["uuid"][document["uuid"]].add(0)
+        if entry is None or not self.field_document_counts[field]:
+            return 0
 
-            for pos, word in enumerate(document[index_by].split()):
-                word_lower = word.lower()
+        tf = entry.count_of(self.uuids_to_position_in_global_index[doc_uuid])
+        document_length = self.doc_lengths[doc_uuid].get(field, 0)
 
-                # Update index
-                index[word_lower]["count"] += 1
-                index[word_lower]["documents"]["uuid"][document["uuid"]].add(pos)
-                index[word_lower]["documents"]["count"][document["uuid"]] += 1
+        term_score = self._bm25_term_frequency_score(field, tf, document_length)
 
-                self.word_counts[word_lower] += 1
-                self.word_counts[word] += 1
-                word_count[word_lower] += 1
+        return term_score * self._inverse_document_frequency(field, term)
 
-                # Track first occurrence of the word in the document for document frequencies
-                if word_lower not in unique_words_in_document:
-                    document_frequencies[word_lower] += 1
-                    unique_words_in_document.add(word_lower)
+    def _bm25_term_frequency_score(
+        self, field: str, tf: int, document_length: int
+    ) -> float:
+        average_document_length = (
+            self.field_lengths[field] / self.field_document_counts[field]
+        )
+
+        return (tf * (self.k1 + 1)) / (
+            tf
+            + self.k1
+            * (1 - self.b + self.b * (document_length / average_document_length))
+        )
+
+    def _bm25_upper_bound(self, field: str, term: str) -> float:
+        """
+        Returns the highest BM25 score that a term can give a document.
+
+        BM25 scores grow with the number of times a term appears in a document and shrink
+        with the length of the document, so the bound is the score of the largest term count
+        in a document of the field, in the shortest document of the field.
+        """
+        return self._bm25_term_frequency_score(
+            field,
+            self.max_term_counts.get(field, {}).get(term, 0),
+            self.field_min_lengths.get(field, 0),
+        ) * self._inverse_document_frequency(field, term)
 
-            # Compute term frequency (TF) for each word in the document
-            total_words_in_document = len(words)
-            for word, count in word_count.items():
-                self.tf[document["uuid"]][word] = count  # / total_words_in_document
+    def _bm25_term_scorer(
+        self,
+        field: str,
+        term: str,
+        term_doc_ids: numpy.ndarray,
+        tf: numpy.ndarray,
+        column: numpy.ndarray,
+    ):
+        """
+        Returns a function that computes the BM25 score of a term for the documents at an
+        array of positions in `term_doc_ids`, from the term counts in `tf` and the document
+        length column of the field.
+        """
+        inverse_document_frequency = self._inverse_document_frequency(field, term)
 
-        # Compute inverse document frequency (IDF) for each word in the corpus
-        for word, doc_count in document_frequencies.items():
-            self.idf[word] = math.log(
-                (total_documents - doc_count + 0.5) / (doc_count + 0.5) + 1
+        def score(positions: numpy.ndarray) -> numpy.ndarray:
+            doc_ids = term_doc_ids[positions]
+
+            document_lengths = numpy.zeros(len(doc_ids))
+            in_column = doc_ids < len(column)
+            document_lengths[in_column] = column[doc_ids[in_column]]
+
+            term_scores = self._bm25_term_frequency_score(
+                field, tf[positions], document_lengths
             )
 
-        # Compute TF-IDF for each document
-        for document in documents:
-            for word, tf_value in self.tf[document["uuid"]].items():
-                score = tf_value * self.idf[word]
-                if self.tf_idf[word].get(score):
-                    self.tf_idf[word][score].add(document["uuid"])
-                else:
-                    self.tf_idf[word][score] = set([document["uuid"]])
+            return term_scores * inverse_document_frequency
 
-            for w in document[index_by].split(" "):
-                if self.reverse_tf_idf[w].get(index_by) is None:
-                    self.reverse_tf_idf[w][index_by] = {}
+        return score
 
-                self.reverse_tf_idf[w][index_by][document["uuid"]] = score
+    def _bm25_top_k(
+        self, doc_ids: numpy.ndarray, terms: list, fields: list, k: int
+    ) -> list:
+        """
+        Returns the `k` documents in a sorted array of doc ids with the highest BM25 score for
+        `terms` across `fields`, as a list of (doc_id, score) tuples.
+
+        Documents are ranked with MaxScore. The upper bound of each term is computed from
+        the corpus statistics rather than from its postings, so the postings of terms that
+        cannot lift a document into the top k on their own are only read for the documents
+        that can. If fewer than `k` documents contain a term, the list is padded with
+        unscored documents in doc id order.
+        """
+        doc_ids = to_numpy(doc_ids)
 
-                if self.reverse_tf_idf[w.lower()].get(index_by) is None:
-                    self.reverse_tf_idf[w.lower()][index_by] = {}
+        columns = {}
 
-                self.reverse_tf_idf[w.lower()][index_by][document["uuid"]] = score
+        for field in fields:
+            column = self.document_length_columns.get(field, ())
 
-        return index
+            # columns in memory are copied, so that documents can be added while the column
+            # is being read, and columns in a segment are read in place
+            if not isinstance(column, numpy.ndarray):
+                column = numpy.array(column, dtype=numpy.uint32)
+
+            columns[field] = column
+
+        term_doc_ids = []
+        upper_bounds = []
+        scorers = []
+
+        for term in terms:
+            for field in fields:
+                entry = self.gsis[field]["gsi"].get(term)
+
+                if entry is None or not self.field_document_counts[field]:
+                    term_doc_ids.append(EMPTY_DOC_IDS)
+                    upper_bounds.append(0)
+                    scorers.append(None)
+                    continue
+
+                postings = to_numpy(entry.doc_ids())
+
+                term_doc_ids.append(postings)
+                upper_bounds.append(self._bm25_upper_bound(field, term))
+                scorers.append(
+                    self._bm25_term_scorer(
+                        field,
+                        term,
+                        postings,
+                        to_numpy(entry.term_counts()),
+                        columns[field],
+                    )
+                )
+
+        top_doc_ids, top_scores = max_score_top_k(
+            term_doc_ids, upper_bounds, scorers, k, doc_ids
+        )
+
+        ranked = list(zip(top_doc_ids.tolist(), top_scores.tolist()))
+
+        if len(ranked) < k:
+            unscored = difference(doc_ids, numpy.sort(top_doc_ids))
+
+            ranked.extend(
+                (doc_id, 0) for doc_id in unscored[: k - len(ranked)].tolist()
+            )
+
+        return ranked
 
     @classmethod
     def load(cls) -> "JameSQL":
@@ -320,6 +997,198 @@ class JameSQL:
 
         return instance
 
+    def save_snapshot(self, path: str = INDEX_SNAPSHOT_FILE) -> None:
+        """
+        Writes the full state of the index to a binary snapshot file.
+
+        A snapshot contains the global index, every GSI, the TF/IDF tables and the autosuggest index,
+        so `load_snapshot()` can restore an index without re-tokenizing any documents.
+
+        The snapshot is written to a temporary file and then moved into place, so an interrupted
+        write never replaces a valid snapshot with a partial one.
+        """
+
+        with self.write_lock:
+            state = {
+                attribute: getattr(self, attribute) for attribute in SNAPSHOT_ATTRIBUTES
+            }
+            payload = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+
+        header = SNAPSHOT_HEADER.pack(
+            SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(payload), zlib.crc32(payload)
+        )
+
+        temporary_path = path + ".tmp"
+
+        with open(temporary_path, "wb") as f:
+            f.write(header)
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(temporary_path, path)
+
+    @classmethod
+    def load_snapshot(cls, path: str = INDEX_SNAPSHOT_FILE) -> "JameSQL":
+        """
+        Reads an index from a snapshot written by `save_snapshot()`.
+
+        Snapshots are deserialized with `pickle`, so only load snapshots that you created.
+        """
+
+        with open(path, "rb") as f:
+            header = f.read(SNAPSHOT_HEADER.size)
+
+            if len(header) < SNAPSHOT_HEADER.size:
+                raise ValueError(f"{path} is not a JameSQL snapshot.")
+
+            magic, version, payload_length, checksum = SNAPSHOT_HEADER.unpack(header)
+
+            if magic != SNAPSHOT_MAGIC:
+                raise ValueError(f"{path} is not a JameSQL snapshot.")
+
+            if version != SNAPSHOT_VERSION:
+                raise ValueError(
+                    f"Unsupported snapshot version {version}. "
+                    f"This version of JameSQL reads snapshot version {SNAPSHOT_VERSION}."
+                )
+
+            payload = f.read(payload_length)
+
+        if len(payload) != payload_length or zlib.crc32(payload) != checksum:
+            raise ValueError(f"Snapshot {path} is corrupt.")
+
+        # the garbage collector would otherwise repeatedly scan the
+        # millions of container objects created while unpickling
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+
+        try:
+            state = pickle.loads(payload)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+        instance = cls()
+
+        for attribute, value in state.items():
+            setattr(instance, attribute, value)
+
+        return instance
+
+    def save_segment(self, path: str = INDEX_SEGMENT_FILE) -> None:
+        """
+        Writes the index to an immutable segment file.
+
+        Unlike a snapshot, a segment is not read into memory when it is opened. Documents,
+        posting lists and term dictionaries are stored as contiguous arrays that are
+        memory-mapped by `open_segment()`.
+        """
+
+        with self.write_lock:
+            write_segment(self, path)
+
+    @classmethod
+    def open_segment(cls, path: str = INDEX_SEGMENT_FILE) -> "JameSQL":
+        """
+        Opens a segment written by `save_segment()` as a read-only index.
+
+        Segments are opened with `mmap`, so processes that open the same segment share a
+        single copy of it in the OS page cache, and opening a segment only reads the pages
+        that queries touch.
+        """
+
+        segment = Segment(path)
+
+        instance = cls()
+        instance.segment = segment
+        instance.global_index = segment.documents()
+        instance.uuids_to_position_in_global_index = segment.doc_ids()
+        instance.doc_uuids = segment.doc_uuids()
+        instance.gsis = segment.gsis()
+        instance.word_counts = segment.word_counts()
+        instance.field_sketches = segment.field_sketches()
+        instance.doc_lengths = segment.doc_lengths()
+        instance.document_length_columns = segment.document_length_columns()
+        instance.columns = segment.columns()
+        (
+            instance.document_frequencies,
+            instance.field_document_counts,
+            instance.field_lengths,
+            instance.max_term_counts,
+            instance.field_min_lengths,
+        ) = segment.corpus_statistics(instance.gsis)
+
+        return instance
+
+    def _ensure_writable(self) -> None:
+        if self.segment is not None:
+            raise ValueError(
+                f"This index was opened from the read-only segment {self.segment.path}."
+            )
+
+    def _allocate_doc_id(self, doc_uuid: str) -> int:
+        """
+        Returns the doc id of a document, allocating the next doc id if the document does
+        not have one.
+        """
+        doc_id = self.uuids_to_position_in_global_index.get(doc_uuid)
+
+        if doc_id is not None:
+            return doc_id
+
+        doc_id = len(self.doc_uuids)
+
+        self.doc_uuids.append(doc_uuid)
+        self.uuids_to_position_in_global_index[doc_uuid] = doc_id
+
+        return doc_id
+
+    def _release_doc_id(self, doc_uuid: str) -> None:
+        doc_id = self.uuids_to_position_in_global_index.pop(doc_uuid, None)
+
+        if doc_id is not None:
+            self.doc_uuids[doc_id] = None
+
+    def _iterate_documents(self):
+        """
+        Yields every document in the index as a (doc id, document) pair.
+        """
+        for doc_uuid, document in self.global_index.items():
+            yield self.uuids_to_position_in_global_index[doc_uuid], document
+
+    def _live_doc_ids(self) -> numpy.ndarray:
+        """
+        Returns the sorted doc ids of every document in the index.
+        """
+        return numpy.sort(
+            numpy.fromiter(
+                self.uuids_to_position_in_global_index.values(),
+                dtype=DOC_ID_DTYPE,
+                count=len(self.uuids_to_position_in_global_index),
+            )
+        )
+
+    def _document_for_doc_id(self, doc_id: int, fields: list = None) -> dict:
+        """
+        Returns the document with a doc id, or None if the document has been removed.
+
+        If `fields` is provided, the document may only contain those fields and its `uuid`.
+        """
+        if self.segment is not None:
+            return self.global_index.document(
+                doc_id, None if fields is None else fields + ["uuid"]
+            )
+
+        doc_uuid = self.doc_uuids[doc_id]
+
+        return None if doc_uuid is None else self.global_index[doc_uuid]
+
+    def _documents_for_doc_ids(self, doc_ids: numpy.ndarray) -> List[dict]:
+        documents = (self._document_for_doc_id(doc_id) for doc_id in doc_ids.tolist())
+
+        return [document for document in documents if document is not None]
+
     def enable_autosuggest(self, field):
         """
         Accepts a field and adds it to the auto suggest index.
@@ -417,19 +1286,30 @@ class JameSQL:
         if query == "":
             return {"documents": []}
 
-        query, spelling_substitutions = self._compute_string_query(
-            query, query_keys, fuzzy=fuzzy, highlight_keys=highlight_keys
+        key = self._result_cache_key(
+            {"query": query}, query_keys, start, fuzzy, highlight_keys
         )
 
-        if start:
-            query["skip"] = start
+        def run():
+            jamesql_query, spelling_substitutions = self._compute_string_query(
+                query, query_keys, fuzzy=fuzzy, highlight_keys=highlight_keys
+            )
 
-        result = self.search(query)
+            if start:
+                jamesql_query["skip"] = start
 
-        if spelling_substitutions:
-            result["spelling_substitutions"] = spelling_substitutions
+            result = self._search(jamesql_query, [], [])
 
-        return result
+            if spelling_substitutions:
+                result["spelling_substitutions"] = spelling_substitutions
+
+            # the query is rewritten with spelling corrections from every document
+            tags = self._result_cache_tags(jamesql_query, [], [], result)
+            tags.add(ALL_DOCUMENTS_TAG)
+
+            return result, tags
+
+        return self._cached_response(key, run)
 
     def _get_unique_record_count(self, documents: list) -> int:
         """
@@ -452,20 +1332,488 @@ class JameSQL:
                     for item in value:
                         counts[key].add(item)
                 else:
-                    counts[key].add(value)
+                    counts[key].add(value)
+
+        counts = {
+            key: len(value)
+            for key, value in counts.items()
+            if not key.startswith("_") and key != "uuid"
+        }
+
+        return counts
+
+    def _doc_id_mask(self, doc_ids: numpy.ndarray):
+        """
+        Returns a boolean array that is True at every doc id in `doc_ids`, or None if every
+        document in the index is in `doc_ids`.
+        """
+        # when every document matched, the documents in each GSI key do not need to be filtered
+        if len(doc_ids) >= len(self.uuids_to_position_in_global_index):
+            return None
+
+        mask = numpy.zeros(len(self.doc_uuids), dtype=bool)
+        mask[doc_ids] = True
+
+        return mask
+
+    def _aggregate(self, aggregations: dict, doc_ids: numpy.ndarray) -> dict:
+        """
+        Computes the aggregations in a query over every document that matched it.
+
+        `terms` and `cardinality` aggregations count the documents in each key of a FLAT,
+        NUMERIC or DATE GSI. Every other aggregation is computed over the values of a NUMERIC
+        or DATE field, read from the column of that field.
+        """
+        if not isinstance(aggregations, dict):
+            raise ValueError("aggregations must be a dictionary.")
+
+        results = {}
+        mask = self._doc_id_mask(doc_ids)
+
+        for name, aggregation in aggregations.items():
+            if not isinstance(aggregation, dict) or len(aggregation) != 1:
+                raise ValueError(f"Aggregation {name} must have exactly one type.")
+
+            aggregation_type, options = next(iter(aggregation.items()))
+
+            if aggregation_type not in AGGREGATION_METHODS:
+                raise ValueError(
+                    "Invalid aggregation type. Must be one of: "
+                    + ", ".join(AGGREGATION_METHODS)
+                    + "."
+                )
+
+            field = options.get("field") if isinstance(options, dict) else None
+
+            if field not in self.gsis:
+                raise ValueError(f"Aggregation {name} must have a field with a GSI.")
+
+            strategy = self.gsis[field]["strategy"]
+
+            if aggregation_type == "cardinality" and "precision" in options:
+                results[name] = {
+                    "value": self._approximate_cardinality(
+                        field, doc_ids, mask is None, options["precision"]
+                    )
+                }
+                continue
+
+            if aggregation_type in GSI_AGGREGATIONS:
+                if strategy not in (
+                    GSI_INDEX_STRATEGIES.FLAT.name,
+                    GSI_INDEX_STRATEGIES.NUMERIC.name,
+                    GSI_INDEX_STRATEGIES.DATE.name,
+                ):
+                    raise ValueError(
+                        f"{aggregation_type} aggregations need a FLAT, NUMERIC or DATE field."
+                    )
+
+                results[name] = AGGREGATION_METHODS[aggregation_type](
+                    bucket_counts(self.gsis[field]["gsi"], mask), options
+                )
+            else:
+                if strategy not in (
+                    GSI_INDEX_STRATEGIES.NUMERIC.name,
+                    GSI_INDEX_STRATEGIES.DATE.name,
+                ):
+                    raise ValueError(
+                        f"{aggregation_type} aggregations need a NUMERIC or DATE field."
+                    )
+
+                column = self._field_column(field)
+
+                results[name] = AGGREGATION_METHODS[aggregation_type](
+                    column.present_values(doc_ids), options, column.dates
+                )
+
+        return results
+
+    def _field_sketch(self, field: str) -> HyperLogLog:
+        """
+        Returns a sketch of the distinct values of a field in every document in the index.
+        """
+        sketch = self.field_sketches.get(field)
+
+        if sketch is not None and field not in self.stale_sketches:
+            return sketch
+
+        with self.write_lock:
+            sketch = HyperLogLog(self.sketch_precision)
+
+            for _, document in self._iterate_documents():
+                if field in document:
+                    value = document[field]
+                    sketch.update(value if isinstance(value, list) else [value])
+
+            self.field_sketches[field] = sketch
+            self.stale_sketches.discard(field)
+
+        return sketch
+
+    def _approximate_cardinality(
+        self, field: str, doc_ids: numpy.ndarray, all_documents: bool, precision: int
+    ) -> int:
+        """
+        Returns the approximate number of distinct values of a field in `doc_ids`.
+
+        When every document matched, the count is read from the sketch kept for the field.
+        """
+        sketch = HyperLogLog(precision)
+
+        if all_documents and precision <= self.sketch_precision:
+            sketch = self._field_sketch(field).reduce(precision)
+        else:
+            for document in self._documents_for_doc_ids(doc_ids):
+                if field in document:
+                    value = document[field]
+                    sketch.update(value if isinstance(value, list) else [value])
+
+        return sketch.count()
+
+    def _field_column(self, field: str) -> Column:
+        """
+        Returns the column of a NUMERIC or DATE field.
+
+        Fields without a column, such as fields whose GSI was inferred when they were first
+        queried, have their column built from the stored documents.
+        """
+        if field in self.columns:
+            return self.columns[field]
+
+        strategy = self.gsis[field]["strategy"]
+        column = Column(dates=strategy == GSI_INDEX_STRATEGIES.DATE.name)
+
+        for doc_id, document in self._iterate_documents():
+            if field in document:
+                column.set(doc_id, document[field])
+
+        return column
+
+    def _get_approximate_unique_record_count(self, doc_ids: numpy.ndarray) -> dict:
+        """
+        Returns the approximate number of unique values of every field in `doc_ids`.
+
+        Unlike `_get_unique_record_count`, which stores every value of every field, values are
+        counted with a fixed-size HyperLogLog sketch for each field. When every document
+        matched, the sketches kept for each field are read, without reading any documents.
+        """
+        if len(doc_ids) >= len(self.uuids_to_position_in_global_index):
+            sketches = {field: self._field_sketch(field) for field in self.gsis}
+        else:
+            sketches = document_sketches(
+                self._documents_for_doc_ids(doc_ids), self.sketch_precision
+            )
+
+        counts = {
+            field: sketch.count()
+            for field, sketch in sketches.items()
+            if not field.startswith("_")
+        }
+
+        return {field: count for field, count in counts.items() if count}
+
+    def scroll(self, query: dict, scroll_size: int = 10):
+        for i in range(0, len(self.global_index), scroll_size):
+            query["skip"] = i
+            yield self.search(query)
+
+    def _add_to_gsi(self, key: str, value, document: dict, doc_id: int) -> None:
+        """
+        Adds the value of a single field in a document to the GSI for that field.
+        """
+
+        if self.gsis[key]["strategy"] == GSI_INDEX_STRATEGIES.CONTAINS.name:
+            if isinstance(value, str):
+                self._add_to_reverse_index(self.gsis[key]["gsi"], key, document, doc_id)
+        elif self.gsis[key]["strategy"] == GSI_INDEX_STRATEGIES.PREFIX.name:
+            prefix = value[: self.gsis[key].get("prefix_limit", 20)]
+
+            if self.gsis[key]["gsi"].get(prefix) is None:
+                self.gsis[key]["gsi"][prefix] = doc_id_array()
+                self._add_key_to_term_indexes(key, prefix)
+
+            insert_doc_id(self.gsis[key]["gsi"][prefix], doc_id)
+        elif self.gsis[key]["strategy"] == GSI_INDEX_STRATEGIES.FLAT.name:
+            for inner in value if isinstance(value, list) else [value]:
+                if self.gsis[key]["gsi"].get(inner) is None:
+                    self.gsis[key]["gsi"][inner] = doc_id_array()
+                    self._add_key_to_term_indexes(key, inner)
+
+                insert_doc_id(self.gsis[key]["gsi"][inner], doc_id)
+        elif (
+            self.gsis[key]["strategy"] == GSI_INDEX_STRATEGIES.NUMERIC.name
+            or self.gsis[key]["strategy"] == GSI_INDEX_STRATEGIES.DATE.name
+        ):
+            if self.gsis[key]["gsi"].get(value) is None:
+                self.gsis[key]["gsi"][value] = doc_id_array()
+
+            insert_doc_id(self.gsis[key]["gsi"][value], doc_id)
+
+            if key in self.columns:
+                self.columns[key].set(doc_id, value)
+        elif self.gsis[key]["strategy"] == GSI_INDEX_STRATEGIES.TRIGRAM_CODE.name:
+            code_lines = value.split("\n")
+            total_lines = len(code_lines)
+            file_name = document.get("file_name")
+
+            trigram_lines = defaultdict(list)
+
+            for line_num, line in enumerate(code_lines):
+                trigrams = get_trigrams(line)
+
+                for trigram in trigrams:
+                    if (
+                        not trigram_lines[trigram]
+                        or trigram_lines[trigram][-1] != line_num
+                    ):
+                        trigram_lines[trigram].append(line_num)
+
+                self.gsis[key]["id2line"][f"{file_name}:{line_num}"] = line
+
+            for trigram, line_numbers in trigram_lines.items():
+                self.gsis[key]["gsi"][trigram].add(
+                    doc_id, line_numbers, len(line_numbers)
+                )
+
+            self.gsis[key]["doc_lengths"][file_name] = total_lines
+        elif self.gsis[key]["strategy"] == GSI_INDEX_STRATEGIES.NOT_INDEXABLE.name:
+            pass
+        else:
+            raise ValueError(
+                "Invalid GSI strategy. Must be one of: "
+                + ", ".join([strategy.name for strategy in GSI_INDEX_STRATEGIES])
+                + "."
+            )
+
+    def _record_document_length(self, doc_uuid: str, key: str, value: str) -> None:
+        length = len(value.split())
+
+        self.doc_lengths[doc_uuid][key] = length
+        self.document_length_words[doc_uuid] += length
+
+        if length < self.field_min_lengths.get(key, length + 1):
+            self.field_min_lengths[key] = length
+
+        doc_id = self.uuids_to_position_in_global_index[doc_uuid]
+        column = self.document_length_columns[key]
+
+        if len(column) <= doc_id:
+            column.extend([0] * (doc_id + 1 - len(column)))
+
+        column[doc_id] = length
+
+    def _index_document(self, document: dict) -> None:
+        """
+        Adds every field in a document to the GSI for that field.
+        """
+
+        doc_id = self.uuids_to_position_in_global_index[document["uuid"]]
+
+        add_document_to_sketches(self.field_sketches, document, self.sketch_precision)
+
+        for key, value in document.items():
+            if key == "uuid":
+                continue
+
+            if isinstance(value, str):
+                self._record_document_length(document["uuid"], key, value)
+
+            if key not in self.gsis:
+                # create_gsi indexes every document in the index, including this one
+                self.create_gsi(key, strategy=GSI_INDEX_STRATEGIES.INFER)
+                continue
+
+            self._add_to_gsi(key, value, document, doc_id)
+
+    def _remove_from_gsis(self, document: dict, release_doc_id: bool = True) -> None:
+        """
+        Removes every field in a document from the GSI for that field, and releases the
+        document's doc id.
+
+        A document that is replaced keeps its doc id, by setting `release_doc_id` to False,
+        so documents that tie in a search stay in the same order. Released doc ids are not
+        reused, so `compact()` renumbers the remaining documents.
+        """
+
+        doc_id = self.uuids_to_position_in_global_index[document["uuid"]]
+
+        for key, value in document.items():
+            if key == "uuid" or key not in self.gsis:
+                continue
+
+            strategy = self.gsis[key]["strategy"]
+            gsi = self.gsis[key]["gsi"]
+
+            if strategy == GSI_INDEX_STRATEGIES.CONTAINS.name:
+                if isinstance(value, str):
+                    self._remove_from_reverse_index(gsi, key, document, doc_id)
+            elif strategy == GSI_INDEX_STRATEGIES.PREFIX.name:
+                prefix = value[: self.gsis[key].get("prefix_limit", 20)]
+                doc_ids = gsi.get(prefix)
+
+                if doc_ids is not None and remove_doc_id(doc_ids, doc_id):
+                    if not doc_ids:
+                        del gsi[prefix]
+                        self._remove_key_from_term_indexes(key, prefix)
+            elif strategy in {
+                GSI_INDEX_STRATEGIES.FLAT.name,
+                GSI_INDEX_STRATEGIES.NUMERIC.name,
+                GSI_INDEX_STRATEGIES.DATE.name,
+            }:
+                for inner in value if isinstance(value, list) else [value]:
+                    doc_ids = gsi.get(inner)
+
+                    if doc_ids is not None and remove_doc_id(doc_ids, doc_id):
+                        if not doc_ids:
+                            del gsi[inner]
+                            self._remove_key_from_term_indexes(key, inner)
+
+                if key in self.columns:
+                    self.columns[key].remove(doc_id)
+            elif strategy == GSI_INDEX_STRATEGIES.TRIGRAM_CODE.name:
+                for trigram in {
+                    trigram
+                    for line in value.split("\n")
+                    for trigram in get_trigrams(line)
+                }:
+                    entry = gsi.get(trigram)
+
+                    if entry is not None:
+                        entry.remove(doc_id)
+
+                        if not len(entry):
+                            del gsi[trigram]
+
+                file_name = document.get("file_name")
+                id2line = self.gsis[key]["id2line"]
+
+                for line_num in range(len(value.split("\n"))):
+                    id2line.pop(f"{file_name}:{line_num}", None)
+
+                self.gsis[key]["doc_lengths"].pop(file_name, None)
+
+        self.doc_lengths.pop(document["uuid"], None)
+        self.document_length_words.pop(document["uuid"], None)
+        self.stale_sketches.update(key for key in document if key != "uuid")
+
+        if release_doc_id:
+            self._release_doc_id(document["uuid"])
+
+    def add_many(
+        self, documents, batch_size: int = 1000, write_to_journal=False
+    ) -> int:
+        """
+        Accepts an iterable of documents and indexes them in batches of `batch_size`.
+
+        This is faster than calling `add()` for each document. Each batch is written to the
+        journal in a single write, and GSIs are updated once per batch rather than once per
+        document. Fields that do not yet have a GSI get one at the end of the batch, inferred
+        from every document in the index.
+
+        `documents` can be any iterable, including a generator, so documents can be
+        streamed into the index without loading them all into memory first.
+
+        Returns the number of documents that were added.
+        """
+
+        self._ensure_writable()
+
+        total_documents = 0
+        batch = []
+
+        for document in documents:
+            batch.append(document)
+
+            if len(batch) >= batch_size:
+                self._add_batch(batch, write_to_journal)
+                total_documents += len(batch)
+                batch = []
+
+        if batch:
+            self._add_batch(batch, write_to_journal)
+            total_documents += len(batch)
+
+        return total_documents
+
+    def _add_batch(self, documents: list, write_to_journal=False) -> None:
+        with self.write_lock:
+            if write_to_journal:
+                with open(JOURNAL_FILE, "a") as f:
+                    f.write(
+                        "".join(
+                            json.dumps({"operation": "add", "document": document})
+                            + "\n"
+                            for document in documents
+                        )
+                    )
+
+            for document in documents:
+                if not document.get("uuid"):
+                    document["uuid"] = uuid.uuid4().hex
+
+            # a later copy of a document replaces an earlier one, as it does with add(), so
+            # only the last copy of each uuid in the batch is indexed
+            documents = list(
+                {document["uuid"]: document for document in documents}.values()
+            )
+
+            documents_by_field = defaultdict(list)
+            changed_result_tags = set()
+
+            for document in documents:
+                previous = self.global_index.get(document["uuid"])
+
+                if previous is not None:
+                    self._remove_from_gsis(previous, release_doc_id=False)
+
+                changed_result_tags.update(
+                    self._changed_result_tags(previous, document)
+                )
+
+                self.global_index[document["uuid"]] = document
+
+                self._allocate_doc_id(document["uuid"])
+
+                if self.autosuggest_on and document.get(self.autosuggest_on):
+                    self.autosuggest_index[document[self.autosuggest_on].lower()] = (
+                        document[self.autosuggest_on]
+                    )
+
+                add_document_to_sketches(
+                    self.field_sketches, document, self.sketch_precision
+                )
+
+                for key, value in document.items():
+                    if key == "uuid":
+                        continue
+
+                    if isinstance(value, str):
+                        self._record_document_length(document["uuid"], key, value)
+
+                    documents_by_field[key].append(document)
+
+            for key, field_documents in documents_by_field.items():
+                if key not in self.gsis:
+                    # create_gsi indexes every document in the index, including this batch
+                    self.create_gsi(key, strategy=GSI_INDEX_STRATEGIES.INFER)
+                else:
+                    for document in field_documents:
+                        self._add_to_gsi(
+                            key,
+                            document[key],
+                            document,
+                            self.uuids_to_position_in_global_index[document["uuid"]],
+                        )
 
-        counts = {
-            key: len(value)
-            for key, value in counts.items()
-            if not key.startswith("_") and key != "uuid"
-        }
+            self.result_cache.invalidate(changed_result_tags)
 
-        return counts
+            if write_to_journal:
+                with open(INDEX_DATA_FILE, "a") as f:
+                    f.write(
+                        "".join(json.dumps(document) + "\n" for document in documents)
+                    )
 
-    def scroll(self, query: dict, scroll_size: int = 10):
-        for i in range(0, len(self.global_index), scroll_size):
-            query["skip"] = i
-            yield self.search(query)
+                os.remove(JOURNAL_FILE)
 
     def add(
         self, document: dict, doc_id=None, write_to_journal=False
@@ -480,6 +1828,8 @@ class JameSQL:
         Every document is assigned a UUID.
         """
 
+        self._ensure_writable()
+
         with self.write_lock:
             if write_to_journal:
                 with open(JOURNAL_FILE, "a") as f:
@@ -493,116 +1843,23 @@ class JameSQL:
             else:
                 document["uuid"] = uuid.uuid4().hex
 
+            previous = self.global_index.get(document["uuid"])
+
+            if previous is not None:
+                self._remove_from_gsis(previous, release_doc_id=False)
+
             self.global_index[document["uuid"]] = document
 
-            self.uuids_to_position_in_global_index[document["uuid"]] = (
-                len(self.global_index) - 1
-            )
+            self._allocate_doc_id(document["uuid"])
 
             if self.autosuggest_on and document.get(self.autosuggest_on):
                 self.autosuggest_index[document[self.autosuggest_on].lower()] = (
                     document[self.autosuggest_on]
                 )
 
-            # add to GSI
-            for key, value in document.items():
-                if isinstance(value, str):
-                    self.doc_lengths[document["uuid"]][key] = len(value.split(" "))
-                    self.document_length_words[document["uuid"]] += len(
-                        value.split(" ")
-                    )
-
-                if key not in self.gsis:
-                    if key == "uuid":
-                        continue
-                    self.create_gsi(key, strategy=GSI_INDEX_STRATEGIES.INFER)
-
-                if self.gsis[key]["strategy"] == GSI_INDEX_STRATEGIES.CONTAINS.name:
-                    if not self.gsis[key]["gsi"].get(value):
-                        self.gsis[key]["gsi"][value] = {
-                            "documents": {
-                                "uuid": defaultdict(list),
-                                "count": defaultdict(int),
-                            }
-                        }
-                    self.gsis[key]["gsi"][value]["length"] = len(value)
-                    # self.gsis[key]["gsi"][value]["documents"]["uuid"][
-                    #     document["uuid"]
-                    # ].add(0)
-                    self.gsis[key]["gsi"][value]["documents"]["count"][
-                        document["uuid"]
-                    ] += 1
-                elif self.gsis[key]["strategy"] == GSI_INDEX_STRATEGIES.PREFIX.name:
-                    if not self.gsis[key]["gsi"].get(value[:20]):
-                        self.gsis[key]["gsi"][value[:20]] = {
-                            "documents": {
-                                "uuid": defaultdict(list),
-                                "count": defaultdict(int),
-                            }
-                        }
-
-                    self.gsis[key]["gsi"][value]["documents"]["length"] = len(value)
-                    self.gsis[key]["gsi"][value[:20]]["documents"]["uuid"][
-                        document["uuid"]
-                    ].append(0)
-                    self.gsis[key]["gsi"][value[:20]]["documents"]["count"][
-                        document["uuid"]
-                    ] += 1
-                elif self.gsis[key]["strategy"] == GSI_INDEX_STRATEGIES.FLAT.name:
-                    if isinstance(value, list):
-                        for inner in value:
-                            if not self.gsis[key]["gsi"].get(inner):
-                                self.gsis[key]["gsi"][inner] = []
-
-                            self.gsis[key]["gsi"][inner].append(document["uuid"])
-                    else:
-                        if not self.gsis[key]["gsi"].get(value):
-                            self.gsis[key]["gsi"][value] = []
-
-                        self.gsis[key]["gsi"][value].append(document["uuid"])
-                elif (
-                    self.gsis[key]["strategy"] == GSI_INDEX_STRATEGIES.NUMERIC.name
-                    or self.gsis[key]["strategy"] == GSI_INDEX_STRATEGIES.DATE.name
-                ):
-                    if not self.gsis[key]["gsi"].get(value):
-                        self.gsis[key]["gsi"][value] = []
-
-                    self.gsis[key]["gsi"][value].append(document["uuid"])
-                elif (
-                    self.gsis[key]["strategy"] == GSI_INDEX_STRATEGIES.TRIGRAM_CODE.name
-                ):
-                    code_lines = value.split("\n")
-                    total_lines = len(code_lines)
-                    file_name = document.get("file_name")
-
-                    for line_num, line in enumerate(code_lines):
-                        trigrams = get_trigrams(line)
-
-                        if len(trigrams) == 0:
-                            self.gsis[key]["id2line"][f"{file_name}:{line_num}"] = line
+            self._index_document(document)
 
-                        for trigram in trigrams:
-                            if not self.gsis[key]["gsi"].get(trigram):
-                                self.gsis[key]["gsi"][trigram] = []
-
-                            self.gsis[key]["gsi"][trigram].append(
-                                (file_name, line_num, document["uuid"])
-                            )
-                            self.gsis[key]["id2line"][f"{file_name}:{line_num}"] = line
-                    self.gsis[key]["doc_lengths"][file_name] = total_lines
-                elif (
-                    self.gsis[key]["strategy"]
-                    == GSI_INDEX_STRATEGIES.NOT_INDEXABLE.name
-                ):
-                    pass
-                else:
-                    raise ValueError(
-                        "Invalid GSI strategy. Must be one of: "
-                        + ", ".join(
-                            [strategy.name for strategy in GSI_INDEX_STRATEGIES]
-                        )
-                        + "."
-                    )
+            self.result_cache.invalidate(self._changed_result_tags(previous, document))
 
             if write_to_journal:
                 with open(INDEX_DATA_FILE, "a") as f:
@@ -617,13 +1874,23 @@ class JameSQL:
         Accepts a UUID and a document and updates the document associated with that key.
         """
 
+        self._ensure_writable()
+
         with self.write_lock:
-            if uuid not in self.uuids_to_position_in_global_index:
+            if uuid not in self.global_index:
                 return {"error": "Document not found"}
 
-            position_in_global_index = self.uuids_to_position_in_global_index[uuid]
+            previous = self.global_index[uuid]
+
+            # the updated document keeps its doc id
+            self._remove_from_gsis(previous, release_doc_id=False)
 
-            self.global_index[position_in_global_index] = document
+            document["uuid"] = uuid
+            self.global_index[uuid] = document
+
+            self._index_document(document)
+
+            self.result_cache.invalidate(self._changed_result_tags(previous, document))
 
             return document
 
@@ -632,22 +1899,100 @@ class JameSQL:
         Accepts a UUID and removes the document associated with that key.
         """
 
+        self._ensure_writable()
+
         with self.write_lock:
             with open(JOURNAL_FILE, "a") as f:
                 op_record = {"operation": "remove", "document": {"uuid": uuid}}
                 f.write(json.dumps(op_record) + "\n")
 
-            del self.global_index[uuid]
+            previous = self.global_index.pop(uuid)
+
+            self._remove_from_gsis(previous)
+
+            self.result_cache.invalidate(self._changed_result_tags(previous))
 
             with open(JOURNAL_FILE, "w") as f:
                 f.write("")
 
-    @lru_cache()
+    def compact(self) -> int:
+        """
+        Gives the documents in the index consecutive doc ids, and returns the number of doc
+        ids that were reclaimed.
+
+        Every removal retires a doc id, which keeps its slot in every column until the
+        index is compacted. Documents keep their order, so posting lists stay
+        sorted when they are renumbered.
+        """
+
+        self._ensure_writable()
+
+        with self.write_lock:
+            live_doc_ids = self._live_doc_ids()
+            retired_doc_ids = len(self.doc_uuids) - len(live_doc_ids)
+
+            if not retired_doc_ids:
+                return 0
+
+            new_doc_ids = numpy.zeros(len(self.doc_uuids), dtype=DOC_ID_DTYPE)
+            new_doc_ids[live_doc_ids] = numpy.arange(
+                len(live_doc_ids), dtype=DOC_ID_DTYPE
+            )
+
+            for gsi in self.gsis.values():
+                for key, entry in list(gsi["gsi"].items()):
+                    if isinstance(entry, (PostingList, VarintPostingList)):
+                        renumbered = type(entry)()
+
+                        for doc_id, count, positions in entry.postings():
+                            renumbered.add(int(new_doc_ids[doc_id]), positions, count)
+                    else:
+                        renumbered = doc_id_array(new_doc_ids[to_numpy(entry)].tolist())
+
+                    gsi["gsi"][key] = renumbered
+
+            self.columns = {
+                field: column.compact(live_doc_ids)
+                for field, column in self.columns.items()
+            }
+
+            for field, column in list(self.document_length_columns.items()):
+                lengths = numpy.array(column, dtype=numpy.uint32)
+
+                self.document_length_columns[field] = array(
+                    "I", lengths[live_doc_ids[live_doc_ids < len(lengths)]].tobytes()
+                )
+
+            self.doc_uuids = [
+                self.doc_uuids[doc_id] for doc_id in live_doc_ids.tolist()
+            ]
+            self.uuids_to_position_in_global_index = {
+                doc_uuid: doc_id for doc_id, doc_uuid in enumerate(self.doc_uuids)
+            }
+
+            # cached plans and responses may hold the previous doc ids
+            self.query_plans.clear()
+            self.result_cache.clear()
+
+            return retired_doc_ids
+
     def spelling_correction(self, query: str) -> str:
         """
         Accepts a query and returns a spelling corrected query.
+
+        Corrections are cached until the words in the index, or their counts, change.
+        `index.spelling_cache.stats()` returns the number of cache hits and misses.
         """
+        key = (query, self.vocabulary_epoch)
+        correction = self.spelling_cache.get(key)
+
+        if correction is None:
+            correction = self._correct_spelling(query)
+            self.spelling_cache.put(key, correction)
+
+        return correction
 
+    def _correct_spelling(self, query: str) -> str:
         if query in self.word_counts and self.word_counts[query] > 1:
             return query
 
@@ -670,11 +2015,7 @@ class JameSQL:
         if segmentations:
             all_possibilities.update(segmentations)
 
-        fuzzy_suggestions = self._turn_query_into_fuzzy_options(query)
-
-        fuzzy_suggestions = [
-            word for word in fuzzy_suggestions if word in self.word_counts
-        ]
+        fuzzy_suggestions = self._fuzzy_terms(query)
 
         if fuzzy_suggestions:
             all_possibilities.update(
@@ -684,11 +2025,7 @@ class JameSQL:
         fuzzy_suggestions_2_edits = []
 
         for word in fuzzy_suggestions:
-            fuzzy_suggestions_2_edits.extend(self._turn_query_into_fuzzy_options(word))
-
-        fuzzy_suggestions_2_edits = [
-            word for word in fuzzy_suggestions_2_edits if word in self.word_counts
-        ]
+            fuzzy_suggestions_2_edits.extend(self._fuzzy_terms(word))
 
         for word in fuzzy_suggestions_2_edits:
             if word in self.word_counts:
@@ -705,6 +2042,7 @@ class JameSQL:
         index_by: str | List[str],
         strategy: GSI_INDEX_STRATEGIES = "infer",
         prefix_limit=20,
+        compression: str = None,
     ) -> Dict[str, dict]:
         """
         The raw index returned by create_index is not optimized for querying. Instead, it is designed as
@@ -733,8 +2071,19 @@ class JameSQL:
         - Prefix
         - Contains (reverse index)
         - Flat
+
+        The posting lists of CONTAINS and TRIGRAM_CODE GSIs can be compressed by setting
+        `compression` to "varint". Compressed posting lists use less memory, at the cost of
+        decoding postings when they are read.
         """
 
+        if compression not in POSTING_LIST_COMPRESSION:
+            raise ValueError(
+                "Invalid compression. Must be one of: "
+                + ", ".join([name for name in POSTING_LIST_COMPRESSION if name])
+                + "."
+            )
+
         documents_in_indexed_by = [
             item.get(index_by) for item in self.global_index.values()
         ]
@@ -780,41 +2129,61 @@ class JameSQL:
             else:
                 strategy = GSI_INDEX_STRATEGIES.FLAT
 
+        if compression and strategy not in {
+            GSI_INDEX_STRATEGIES.CONTAINS,
+            GSI_INDEX_STRATEGIES.TRIGRAM_CODE,
+        }:
+            raise ValueError(
+                "Compression is only supported by CONTAINS and TRIGRAM_CODE GSIs."
+            )
+
         if strategy == GSI_INDEX_STRATEGIES.PREFIX:
             gsi = pygtrie.CharTrie()
 
-            for item in self.global_index.values():
-                gsi[item.get(index_by)[:prefix_limit]] = item.get("uuid")
+            for doc_id, item in self._iterate_documents():
+                prefix = item.get(index_by)[:prefix_limit]
+
+                if gsi.get(prefix) is None:
+                    gsi[prefix] = doc_id_array()
+
+                insert_doc_id(gsi[prefix], doc_id)
         elif strategy == GSI_INDEX_STRATEGIES.CONTAINS:
             gsi = self._create_reverse_index(
-                [item for item in self.global_index.values()], index_by
+                self._iterate_documents(), index_by, compression
             )
         elif strategy == GSI_INDEX_STRATEGIES.FLAT:
-            gsi = defaultdict(list)
+            gsi = defaultdict(doc_id_array)
 
-            for item in self.global_index.values():
+            for doc_id, item in self._iterate_documents():
                 if isinstance(item.get(index_by), list):
                     for inner in item.get(index_by):
-                        gsi[inner].append(item.get("uuid"))
+                        insert_doc_id(gsi[inner], doc_id)
                 else:
-                    gsi[item.get(index_by)].append(item.get("uuid"))
+                    insert_doc_id(gsi[item.get(index_by)], doc_id)
         elif (
             strategy == GSI_INDEX_STRATEGIES.NUMERIC
             or strategy == GSI_INDEX_STRATEGIES.DATE
         ):
             gsi = OOBTree()
+            column = Column(dates=strategy == GSI_INDEX_STRATEGIES.DATE)
 
-            for item in self.global_index.values():
-                if gsi.get(item.get(index_by)) is None:
-                    gsi[item.get(index_by)] = []
-
+            for doc_id, item in self._iterate_documents():
                 if isinstance(item.get(index_by), list):
-                    for inner in item.get(index_by):
-                        gsi[inner].append(item.get("uuid"))
+                    values = item.get(index_by)
+                else:
+                    values = [item.get(index_by)]
+
+                for value in values:
+                    if gsi.get(value) is None:
+                        gsi[value] = doc_id_array()
 
-                gsi[item.get(index_by)].append(item.get("uuid"))
+                    insert_doc_id(gsi[value], doc_id)
+
+                if index_by in item:
+                    column.set(doc_id, item[index_by])
         elif strategy == GSI_INDEX_STRATEGIES.TRIGRAM_CODE:
-            gsi = {}
+            # documents are indexed once the GSI has been registered, below
+            gsi = defaultdict(POSTING_LIST_COMPRESSION[compression])
         elif strategy == GSI_INDEX_STRATEGIES.NOT_INDEXABLE:
             gsi = {}
         else:
@@ -826,24 +2195,289 @@ class JameSQL:
 
         self.gsis[index_by] = {"gsi": gsi, "strategy": strategy.name}
 
+        if strategy in (GSI_INDEX_STRATEGIES.NUMERIC, GSI_INDEX_STRATEGIES.DATE):
+            self.columns[index_by] = column
+        else:
+            self.columns.pop(index_by, None)
+
+        if compression:
+            self.gsis[index_by]["compression"] = compression
+
         if strategy == GSI_INDEX_STRATEGIES.TRIGRAM_CODE:
             self.gsis[index_by]["id2line"] = {}
             self.gsis[index_by]["doc_lengths"] = {}
 
+            for doc_id, item in self._iterate_documents():
+                if isinstance(item.get(index_by), str):
+                    self._add_to_gsi(index_by, item[index_by], item, doc_id)
+
+        if strategy == GSI_INDEX_STRATEGIES.PREFIX:
+            self.gsis[index_by]["prefix_limit"] = prefix_limit
+
+        # the key and fuzzy indexes of the previous GSI are rebuilt from the new one when
+        # they are read
+        self.key_indexes.pop(index_by, None)
+        self.fuzzy_indexes.pop(index_by, None)
+
+        # compiled plans refer to the strategy of the GSI they query, so they are recompiled
+        self.query_plans.clear()
+        self.result_cache.clear()
+
         gc.collect()
-        
+
         return gsi
 
+    def _bm25_fields(self) -> list:
+        return [
+            name
+            for name, gsi in self.gsis.items()
+            if gsi["strategy"] == GSI_INDEX_STRATEGIES.CONTAINS.name
+        ]
+
+    def _can_rank_top_k(self, query: dict, term_queries: list, fields: list) -> bool:
+        """
+        Returns whether a query can be ranked with `_bm25_top_k`.
+
+        Top-k ranking needs every document score to be a sum of BM25 term scores, so it is
+        only used when results are sorted by descending `_score`, without a `query_score`,
+        and without `fields`, which add phrase and title weights to the score.
+        """
+        return bool(
+            self.enable_experimental_bm25_ranker
+            and term_queries
+            and not fields
+            and query["sort_by"] == "_score"
+            and query.get("sort_order") != "asc"
+            and not query.get("query_score")
+            and query.get("limit", 10)
+        )
+
+    def _can_sort_by_index(self, query: dict, result_count: int) -> bool:
+        """
+        Returns whether the results of a query can be read in order from the GSI of the
+        `sort_by` field with `_sort_by_index`.
+
+        Reading from the GSI skips the keys of documents that did not match the query, so it
+        is only used when the results are a large fraction of the index.
+        """
+        gsi = self.gsis.get(query["sort_by"])
+
+        return bool(
+            gsi is not None
+            and result_count
+            >= len(self.uuids_to_position_in_global_index) * SORT_BY_INDEX_MIN_RESULTS
+            and gsi["strategy"]
+            in (GSI_INDEX_STRATEGIES.NUMERIC.name, GSI_INDEX_STRATEGIES.DATE.name)
+            and isinstance(gsi["gsi"], OOBTree)
+            and not self.enable_experimental_bm25_ranker
+            and not query.get("query_score")
+            and query.get("limit", 10)
+        )
+
+    def _sort_by_index(
+        self, doc_ids: numpy.ndarray, field: str, reverse: bool, limit: int
+    ) -> list:
+        """
+        Returns the first `limit` documents in a sorted array of doc ids, in order of the
+        value of `field`, as a list of (doc_id, score) tuples.
+
+        The keys of a NUMERIC or DATE GSI are already in order, so documents are read from
+        the GSI key by key until the page is full, and the results are never sorted.
+        Documents with the same value are returned in doc id order, as a stable sort would.
+
+        Returns None if a document does not have a value in the GSI.
+        """
+        gsi = self.gsis[field]["gsi"]
+        # when every document matches, the doc ids in the GSI do not need to be filtered
+        filter_doc_ids = len(doc_ids) < len(self.uuids_to_position_in_global_index)
+
+        ranked = []
+
+        for _, value_doc_ids in reversed_items(gsi) if reverse else gsi.items():
+            if filter_doc_ids:
+                matches = intersect(value_doc_ids, doc_ids).tolist()
+            else:
+                matches = list(value_doc_ids)
+
+            ranked.extend((doc_id, 0) for doc_id in matches[: limit - len(ranked)])
+
+            if len(ranked) == limit:
+                return ranked
+
+        return ranked if len(ranked) == len(doc_ids) else None
+
+    def _can_sort_by_column(self, query: dict) -> bool:
+        """
+        Returns whether the results of a query can be sorted by the column of the `sort_by`
+        field with `_sort_by_column`.
+        """
+        return bool(
+            query["sort_by"] in self.columns
+            and not self.enable_experimental_bm25_ranker
+            and not query.get("query_score")
+            and query.get("limit", 10)
+        )
+
+    def _sort_by_column(
+        self, doc_ids: numpy.ndarray, field: str, reverse: bool, limit: int
+    ) -> list:
+        """
+        Returns the first `limit` documents in an array of doc ids, in order of the value of
+        `field`, as a list of (doc_id, score) tuples.
+
+        Documents are sorted by their values in the column of `field`, so no documents are
+        read until the page has been selected. Documents with the same value are returned in
+        doc id order, as a stable sort would.
+
+        Returns None if a document does not have a value in the column.
+        """
+        sorted_doc_ids = self.columns[field].argsort(doc_ids, reverse)
+
+        if sorted_doc_ids is None:
+            return None
+
+        return [(doc_id, 0) for doc_id in sorted_doc_ids[:limit].tolist()]
+
     def search(
         self, query: dict, term_queries: list = [], fields: list = []
     ) -> List[str]:
-        # with self.write_lock:
+        """
+        Accepts a query and returns the matching documents.
+
+        Responses are cached until a document that they depend on is added, updated or
+        removed.
+        """
+        key = self._result_cache_key(query, term_queries, fields)
+
+        def run():
+            result = self._search(query, term_queries, fields)
+
+            return result, self._result_cache_tags(query, term_queries, fields, result)
+
+        return self._cached_response(key, run)
+
+    def _result_cache_key(self, query: dict, *arguments):
+        # responses also depend on the settings of the index
+        return search_cache_key(
+            query,
+            *arguments,
+            self.match_limit_for_large_result_pages,
+            self.enable_experimental_bm25_ranker,
+            self.k1,
+            self.b,
+        )
+
+    def _cached_response(self, key, run) -> dict:
+        """
+        Returns the cached response for `key`, or calls `run` and caches the response that
+        it returns.
+
+        `run` returns a response and the tags of the fields and documents it depends on.
+        """
+        start_time = time.time()
+
+        if key is not None:
+            result = self.result_cache.get(key)
+
+            if result is not None:
+                return {
+                    **copy_response(result),
+                    "query_time": str(round(time.time() - start_time, 4)),
+                }
+
+        generation = self.result_cache.generation
+
+        result, tags = run()
+
+        if key is not None and "error" not in result:
+            self.result_cache.put(
+                key, copy_response(result), tags=tags, generation=generation
+            )
+
+        return result
+
+    def _result_cache_tags(
+        self, query: dict, term_queries: list, fields: list, result: dict
+    ) -> set:
+        """
+        Returns the tags of the fields and documents that a search response depends on.
+        """
+        if "error" in result:
+            # responses with errors are not cached
+            return set()
+
+        tags = {("document", document["uuid"]) for document in result["documents"]}
+        query_fields = set(fields)
+
+        if query["query"] == "*" or query.get("query_score"):
+            # every document is matched, or ranked by a script that can read any field
+            tags.add(ALL_DOCUMENTS_TAG)
+        else:
+            plan = self._compile_query(query["query"])
+
+            query_fields.update(plan_fields(plan.root))
+
+            if plan_negates(plan.root):
+                tags.add(ALL_DOCUMENTS_TAG)
+
+        if query.get("sort_by") not in (None, "_score"):
+            query_fields.add(query["sort_by"])
+
+        if "approximate_aggregate" in (query.get("metrics") or []):
+            # every field of every matching document is counted
+            tags.add(ALL_DOCUMENTS_TAG)
+
+        # aggregations read a field of every matching document, not only the returned ones
+        for aggregation in (query.get("aggregations") or {}).values():
+            for options in aggregation.values():
+                query_fields.add(options["field"])
+
+        if query.get("group_by"):
+            group_by = query["group_by"]
+            query_fields.add(
+                group_by if isinstance(group_by, str) else group_by["field"]
+            )
+
+            for documents in result["groups"].values():
+                tags.update(("document", document["uuid"]) for document in documents)
+
+        if term_queries and self.enable_experimental_bm25_ranker:
+            query_fields.update(self._bm25_fields())
+
+        tags.update(("field", field) for field in query_fields)
+
+        return tags
+
+    def _changed_result_tags(self, previous: dict = None, document: dict = None) -> set:
+        """
+        Returns the tags of the cached responses that can change when `previous` is replaced
+        by `document`. Either document can be None, when a document is added or removed.
+        """
+        fields = set(previous or {}) | set(document or {})
+
+        # if the stored document was modified in place, any of its fields could have changed
+        if previous is not None and document is not None and previous is not document:
+            fields = {
+                field for field in fields if previous.get(field) != document.get(field)
+            }
+
+        tags = {ALL_DOCUMENTS_TAG}
+        tags.update(("field", field) for field in fields)
+
+        if previous is not None:
+            tags.add(("document", previous["uuid"]))
+
+        return tags
+
+    def _search(self, query: dict, term_queries: list, fields: list) -> dict:
+        # searches never modify the index, so they do not take the write lock
         start_time = time.time()
 
         results_limit = query.get("limit", 10)
 
         metadata = {}
         highlights = defaultdict(list)
+        result_ids = None
 
         if not query.get("query"):
             return {
@@ -857,9 +2491,16 @@ class JameSQL:
         elif query["query"] == "*":  # all query
             results = list(self.global_index.values())
         else:
-            number_of_query_conditions = self._get_query_conditions(query["query"])
+            try:
+                plan = self._compile_query(query["query"])
+            except ValueError as error:
+                return {
+                    "documents": [],
+                    "error": str(error),
+                    "query_time": str(round(time.time() - start_time, 4)),
+                }
 
-            if len(number_of_query_conditions) > MAXIMUM_QUERY_STATEMENTS:
+            if plan.conditions > MAXIMUM_QUERY_STATEMENTS:
                 return {
                     "documents": [],
                     "error": "Too many query conditions. Maximum is "
@@ -868,14 +2509,8 @@ class JameSQL:
                     "query_time": str(round(time.time() - start_time, 4)),
                 }
 
-            metadata, result_ids = self._recursively_parse_query(query["query"])
+            metadata, result_ids = self._execute_plan(plan.root)
 
-            results = [
-                self.global_index.get(doc_id)
-                for doc_id in result_ids
-                if doc_id in self.global_index
-            ]
-        
             highlights = metadata.get("highlights", {})
 
         if query.get("sort_by") is None:
@@ -883,56 +2518,178 @@ class JameSQL:
 
         results_sort_by = query["sort_by"]
 
+        skip = int(query.get("skip") or 0)
+        # the fields to return for each document, or None to return every field
+        projection = query.get("fields")
+        # when documents can be ranked without loading every result, the (doc_id, score)
+        # tuples of the documents up to the end of the requested page
+        ranked = None
+        ranked_doc_ids = result_ids
+
+        if result_ids is not None and self._can_rank_top_k(query, term_queries, fields):
+            # only the documents on the requested page are scored in full and loaded
+            ranked = self._bm25_top_k(
+                result_ids, term_queries, self._bm25_fields(), skip + results_limit
+            )
+        elif self._can_sort_by_index(
+            query, len(self) if result_ids is None else len(result_ids)
+        ):
+            if ranked_doc_ids is None:
+                ranked_doc_ids = self._live_doc_ids()
+
+            ranked = self._sort_by_index(
+                ranked_doc_ids,
+                results_sort_by,
+                query.get("sort_order") != "asc",
+                skip + results_limit,
+            )
+
+        if ranked is None and self._can_sort_by_column(query):
+            if ranked_doc_ids is None:
+                ranked_doc_ids = self._live_doc_ids()
+
+            ranked = self._sort_by_column(
+                ranked_doc_ids,
+                results_sort_by,
+                query.get("sort_order") != "asc",
+                skip + results_limit,
+            )
+
+        if ranked is not None:
+            # documents are only used to build the response, so only the fields that are
+            # returned, or needed to aggregate the page, are read
+            stored_fields = None
+
+            if projection is not None and not query.get("metrics"):
+                stored_fields = projection
+
+            results = [
+                (self._document_for_doc_id(doc_id, stored_fields), score)
+                for doc_id, score in ranked[skip:]
+            ]
+
+            total_results = max(len(ranked_doc_ids) - skip, 0)
+
+            end_time = time.time()
+        else:
+            if result_ids is not None:
+                results = self._documents_for_doc_ids(result_ids)
+
+            total_results = max(len(results) - skip, 0)
+            # only the documents up to the end of the requested page need to be sorted
+            page_end = skip + results_limit if results_limit else None
+
+            results = self._rank_documents(
+                results, query, term_queries, fields, page_end
+            )[skip:page_end]
+
+            end_time = time.time()
+
+        if results_limit == 0:
+            results = []
+
+        # only the documents on the page are copied into the response
+        documents = [
+            {**project_document(document, projection), "_score": score}
+            for document, score in results
+        ]
+
+        result = {
+            "documents": documents,
+            "query_time": str(round(end_time - start_time, 4)),
+            "total_results": total_results,
+        }
+
+        if query.get("aggregations"):
+            try:
+                result["aggregations"] = self._aggregate(
+                    query["aggregations"], self._matched_doc_ids(query, result_ids)
+                )
+            except ValueError as error:
+                return {
+                    "documents": [],
+                    "error": str(error),
+                    "query_time": str(round(time.time() - start_time, 4)),
+                }
+
+        if query.get("metrics") and "aggregate" in query["metrics"]:
+            result["metrics"] = {
+                "unique_record_values": self._get_unique_record_count(
+                    [document for document, _ in results]
+                ),
+            }
+        elif query.get("metrics") and "approximate_aggregate" in query["metrics"]:
+            result["metrics"] = {
+                "unique_record_values": self._get_approximate_unique_record_count(
+                    self._matched_doc_ids(query, result_ids)
+                ),
+            }
+
+        if query.get("group_by"):
+            try:
+                result["groups"], result["group_counts"] = self._group_results(
+                    query,
+                    self._matched_doc_ids(query, result_ids),
+                    term_queries,
+                    fields,
+                    projection,
+                )
+            except ValueError as error:
+                return {
+                    "documents": [],
+                    "error": str(error),
+                    "query_time": str(round(time.time() - start_time, 4)),
+                }
+
+        return result
+
+    def _rank_documents(
+        self,
+        documents: List[dict],
+        query: dict,
+        term_queries: list,
+        fields: list,
+        limit: int = None,
+    ) -> list:
+        """
+        Scores and sorts documents as the results of a query are ranked, and returns the
+        first `limit` as (document, score) tuples.
+        """
         doc_scores = defaultdict(int)
 
         if self.enable_experimental_bm25_ranker:
-            # TODO: Make sure this code can process boosts.
+            bm25_fields = fields or self._bm25_fields()
 
-            self.avgdl = sum(self.document_length_words.values()) / len(
-                self.document_length_words
-            )
-
-            for doc in results:
+            for doc in documents:
                 doc_uuid = doc["uuid"]
-                doc_value = self.tf.get(doc_uuid, {})
-                doc_word_length = self.document_length_words[doc_uuid]
                 doc_score = 0
 
                 for term in term_queries:
-                    tf = doc_value.get(term, 0)
-                    idf = self.idf.get(term, 0)
-
-                    term_score = (tf * (self.k1 + 1)) / (
-                        tf
-                        + self.k1
-                        * (
-                            1
-                            - self.b
-                            + self.b
-                            * (doc_word_length / self.avgdl)
-                        )
-                    )
-                    term_score *= idf
+                    for field in bm25_fields:
+                        doc_score += self._bm25_term_score(field, term, doc_uuid)
+
+                doc_id = self.uuids_to_position_in_global_index[doc_uuid]
 
-                    doc_score += term_score
-                
                 for field in fields:
-                    field_gsi = self.gsis[field]["gsi"]
-                    starting_word_pos = field_gsi[term_queries[0]]["documents"]["uuid"][doc_uuid]
+                    starting_word_pos = self._term_positions(
+                        field, term_queries[0], doc_id
+                    )
                     first_word_pos = set(starting_word_pos)
 
                     for i, term in enumerate(term_queries[1:]):
-                        word_pos = field_gsi[term]["documents"]["uuid"][doc_uuid]
+                        word_pos = self._term_positions(field, term, doc_id)
                         first_word_pos &= set(x - i for x in word_pos)
 
                     if first_word_pos and field != "title_lower":
                         doc_score += len(first_word_pos)
-                    
+
                     if field == "title_lower":
                         title_terms = set(doc["title_lower"].split())
                         overlap = title_terms & set(term_queries)
-                        overlap_ratio = len(overlap) / len(title_terms) if title_terms else 0
-                        doc_score *= (50 / (1 - overlap_ratio + 1))
+                        overlap_ratio = (
+                            len(overlap) / len(title_terms) if title_terms else 0
+                        )
+                        doc_score *= 50 / (1 - overlap_ratio + 1)
 
                     # add weight for the first time the term is mentioned
                     # the closer the mention is to the beginning of the document, the higher the weight
@@ -942,63 +2699,182 @@ class JameSQL:
 
                 doc_scores[doc["uuid"]] = doc_score
 
-        end_time = time.time()
-        # add _score key to all results; create new object
-        for doc in results:
-            doc["_score"] = doc_scores.get(doc["uuid"], 0)
-            
-        if query.get("sort_order") == "asc":
-            results = sorted(results, key=itemgetter(results_sort_by), reverse=False)
-        else:
-            results = sorted(results, key=itemgetter(results_sort_by), reverse=True)
-        # print top 5 scores
+        # scores are kept next to the documents, so stored documents are never modified
+        results = [
+            (document, doc_scores.get(document["uuid"], 0)) for document in documents
+        ]
 
         if query.get("query_score"):
-            tree = parse_script_score(query["query_score"])
+            # results are sorted by their script score, so they are not sorted by sort_by
+            score_documents = compile_script_score(query["query_score"])
+
+            doc_ids = numpy.fromiter(
+                (
+                    self.uuids_to_position_in_global_index[document["uuid"]]
+                    for document, _ in results
+                ),
+                dtype=DOC_ID_DTYPE,
+                count=len(results),
+            )
 
-            for document in results:
-                if document.get("_score") is None:
-                    document["_score"] = 0
+            def result_column(field):
+                if field == "_score":
+                    return [score for _, score in results]
 
-                transformer = JameSQLScriptTransformer(document)
+                # dates are read from a column as seconds since the Unix epoch
+                if field in self.columns:
+                    values = self.columns[field].take(doc_ids)
 
-                document["_score"] = transformer.transform(tree)
+                    if values is not None:
+                        return values
 
-            results = sorted(results, key=lambda x: x.get("_score", 0), reverse=True)
+                return [document[field] for document, _ in results]
 
-        if query.get("skip"):
-            results = results[int(query["skip"]) :]
+            results = list(
+                zip(
+                    (document for document, _ in results),
+                    score_documents(result_column, len(results)),
+                )
+            )
 
-        total_results = len(results)
+            results = sort_results(results, itemgetter(1), True, limit)
+        else:
+            results = sort_results(
+                results,
+                result_sort_key(query["sort_by"]),
+                query.get("sort_order") != "asc",
+                limit,
+            )
 
-        if results_limit:
-            results = results[:results_limit]
+        return results
 
-        if results_limit == 0:
-            results = []
+    def _group_results(
+        self,
+        query: dict,
+        doc_ids: numpy.ndarray,
+        term_queries: list,
+        fields: list,
+        projection: list = None,
+    ) -> tuple:
+        """
+        Groups every document that matched a query by the value of the `group_by` field.
 
-        result = {
-            "documents": results,
-            "query_time": str(round(end_time - start_time, 4)),
-            "total_results": total_results,
-        }
+        Returns the top documents in each of the `size` groups with the most documents, and
+        the number of documents in each of those groups. Documents with a list value are
+        counted in the group of every item.
 
-        if query.get("metrics") and "aggregate" in query["metrics"]:
-            result["metrics"] = {
-                "unique_record_values": self._get_unique_record_count(results),
-            }
+        When the field has a FLAT, NUMERIC or DATE GSI, the documents in each group are the
+        intersection of the matched doc ids and the posting list of a GSI key, so only the
+        returned documents are read. Otherwise, the field is read from every matched document.
+        """
+        group_by = query["group_by"]
 
-        if query.get("group_by"):
-            result["groups"] = defaultdict(list)
+        if isinstance(group_by, str):
+            group_by = {"field": group_by}
 
-            for doc in results:
-                if isinstance(doc.get(query["group_by"]), list):
-                    for item in doc.get(query["group_by"]):
-                        result["groups"][item].append(doc)
-                else:
-                    result["groups"][doc.get(query["group_by"])].append(doc)
+        if not isinstance(group_by, dict) or not isinstance(group_by.get("field"), str):
+            raise ValueError("group_by must be a field, or a dictionary with a field.")
 
-        return result
+        field = group_by["field"]
+        size = group_by.get("size", DEFAULT_GROUP_SIZE)
+        # the number of documents returned in each group, which is the page size by default
+        limit = group_by.get("limit", group_by.get("top_hits", query.get("limit", 10)))
+
+        for name, value in [("size", size), ("limit", limit)]:
+            if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+                raise ValueError(
+                    f"The {name} of a group_by must be a positive integer."
+                )
+
+        if self.gsis.get(field, {}).get("strategy") in (
+            GSI_INDEX_STRATEGIES.FLAT.name,
+            GSI_INDEX_STRATEGIES.NUMERIC.name,
+            GSI_INDEX_STRATEGIES.DATE.name,
+        ):
+            gsi = self.gsis[field]["gsi"]
+            mask = self._doc_id_mask(doc_ids)
+            counts = bucket_counts(gsi, mask)
+
+            def group_doc_ids(key):
+                if mask is None:
+                    return to_numpy(gsi[key])
+
+                return intersect(gsi[key], doc_ids)
+
+        else:
+            keys = defaultdict(list)
+
+            for doc_id in doc_ids.tolist():
+                value = self._document_for_doc_id(doc_id).get(field)
+
+                for item in dict.fromkeys(
+                    value if isinstance(value, list) else [value]
+                ):
+                    keys[item].append(doc_id)
+
+            counts = [(key, len(key_doc_ids)) for key, key_doc_ids in keys.items()]
+
+            def group_doc_ids(key):
+                return numpy.array(keys[key], dtype=DOC_ID_DTYPE)
+
+        # groups with the same number of documents stay in the order of the GSI
+        counts = sorted(counts, key=itemgetter(1), reverse=True)[:size]
+
+        groups = defaultdict(list)
+
+        for key, _ in counts:
+            groups[key] = [
+                {**project_document(document, projection), "_score": score}
+                for document, score in self._group_top_hits(
+                    group_doc_ids(key), query, term_queries, fields, limit
+                )
+            ]
+
+        return groups, dict(counts)
+
+    def _group_top_hits(
+        self,
+        doc_ids: numpy.ndarray,
+        query: dict,
+        term_queries: list,
+        fields: list,
+        limit: int,
+    ) -> list:
+        """
+        Returns the first `limit` documents in a group, in the order of the query results,
+        as (document, score) tuples.
+        """
+        if not limit:
+            return []
+
+        if self._can_sort_by_column(query):
+            ranked = self._sort_by_column(
+                doc_ids, query["sort_by"], query.get("sort_order") != "asc", limit
+            )
+
+            if ranked is not None:
+                return [
+                    (self._document_for_doc_id(doc_id), score)
+                    for doc_id, score in ranked
+                ]
+
+        return self._rank_documents(
+            self._documents_for_doc_ids(doc_ids), query, term_queries, fields, limit
+        )
+
+    def _matched_doc_ids(
+        self, query: dict, result_ids: numpy.ndarray = None
+    ) -> numpy.ndarray:
+        """
+        Returns the doc ids of every document that matched a query.
+        """
+        if result_ids is not None:
+            return result_ids
+
+        if query["query"] == "*":
+            return self._live_doc_ids()
+
+        return EMPTY_DOC_IDS
 
     def _get_query_conditions(self, query_tree):
         first_key = list(query_tree.keys())[0]
@@ -1017,188 +2893,438 @@ class JameSQL:
         else:
             return query_tree
 
-    def _recursively_parse_query(self, query_tree: dict) -> set:
+    def _compile_query(self, query_tree: dict) -> QueryPlan:
+        """
+        Accepts a query tree and returns a compiled plan for it.
+
+        Plans are cached, so a query that has been run before is not compiled again.
         """
-        Accepts a query tree and returns a set of matching documents.
+        key = query_cache_key(query_tree)
+        plan = self.query_plans.get(key) if key is not None else None
 
-        This function implements a depth-first search to parse the query tree.
+        if plan is None:
+            generation = self.query_plans.generation
 
-        If a node is a query, the query is evaluated. If a node is a keyword, the keyword is evaluated
-        with the query results from the children nodes.
+            plan = QueryPlan(
+                self._compile_clause(query_tree),
+                len(self._get_query_conditions(query_tree)),
+            )
+
+            if key is not None:
+                self.query_plans.put(
+                    key,
+                    plan,
+                    tags=[VOCABULARY_TAG] if plan_expands_terms(plan.root) else [],
+                    generation=generation,
+                )
+
+        return plan
+
+    def _compile_clause(self, query_tree: dict):
         """
-        acc = set()
+        Accepts a query tree and returns the plan node that evaluates it.
 
+        This function implements a depth-first search to compile the query tree. Keywords are
+        compiled into a BooleanQuery over their children, and queries against a field are
+        compiled into a TermQuery.
+        """
         first_key = list(query_tree.keys())[0]
 
         if first_key in RESERVED_QUERY_TERMS:
-            return {}, set()
+            return EmptyQuery()
 
         if first_key in KEYW0RDS:
-            values = []
-            metadata = []
-
-            method = METHODS[first_key]
-
             if isinstance(query_tree[first_key], dict):
-                for key, query in query_tree[first_key].items():
-                    query_metadata, query_values = self._recursively_parse_query(
-                        {key: query}
-                    )
-                    metadata.append(query_metadata)
-                    values.append(query_values)
+                clauses = [{key: query} for key, query in query_tree[first_key].items()]
             else:
-                for query in query_tree[first_key]:
-                    query_metadata, query_values = self._recursively_parse_query(query)
-                    metadata.append(query_metadata)
-                    values.append(query_values)
+                clauses = query_tree[first_key]
+
+            return BooleanQuery(
+                first_key, tuple(self._compile_clause(query) for query in clauses)
+            )
+
+        if first_key == "close_to" and isinstance(query_tree[first_key], list):
+            return self._compile_close_to_list(query_tree)
+
+        return self._compile_term_query(first_key, query_tree[first_key])
+
+    def _compile_close_to_list(self, query_tree: dict) -> TermQuery:
+        """
+        Compiles a close_to query written as a list of {field: word} items, such as:
+
+        {"close_to": [{"lyric": "made"}, {"lyric": "temple,"}], "distance": 7}
+
+        into a close_to query against their field. "distance" can be set next to the list,
+        or in any item.
+        """
+        words = []
+        fields = set()
+        distance = query_tree.get("distance", DEFAULT_PROXIMITY_DISTANCE)
+
+        for item in query_tree["close_to"]:
+            for field, value in item.items():
+                if field == "distance":
+                    distance = value
+                else:
+                    fields.add(field)
+                    words.append(str(value))
+
+        # positions in different fields cannot be compared
+        if len(fields) != 1:
+            raise ValueError(
+                "Every word in a close_to query must be in the same field."
+            )
+
+        return self._compile_term_query(
+            fields.pop(), {"close_to": " ".join(words), "distance": distance}
+        )
+
+    def _compile_term_query(self, query_field: str, options: dict) -> TermQuery:
+        query_type = next(key for key in options if key not in RESERVED_QUERY_TERMS)
+
+        if not self.gsis.get(query_field):
+            self.create_gsi(query_field, GSI_INDEX_STRATEGIES.INFER)
+
+        gsi_type = GSI_INDEX_STRATEGIES[self.gsis[query_field]["strategy"]]
+
+        query_term = options[query_type]
+
+        # FLAT, NUMERIC and DATE GSIs are keyed by the stored values, so query terms are only
+        # converted to strings for text GSIs
+        if gsi_type not in (
+            GSI_INDEX_STRATEGIES.FLAT,
+            GSI_INDEX_STRATEGIES.NUMERIC,
+            GSI_INDEX_STRATEGIES.DATE,
+        ):
+            query_term = str(query_term)
+        elif isinstance(query_term, list):
+            query_term = tuple(query_term)
 
-            # uuids = [set(value.get("uuid") for value in value) for value in values]
-            uuids = values
+        distance = 0
 
-            if first_key == "not":
-                uuid_intersection = set(self.global_index.keys()).difference(
-                    method(*uuids)
+        if query_type in PROXIMITY_METHODS:
+            if gsi_type != GSI_INDEX_STRATEGIES.CONTAINS:
+                raise ValueError(
+                    f"{query_type} queries can only be used on CONTAINS fields."
                 )
+
+            if query_type == "phrase":
+                distance = options.get("slop", 0)
             else:
-                uuid_intersection = method(*uuids)
+                distance = options.get("distance", DEFAULT_PROXIMITY_DISTANCE)
+
+            if not isinstance(distance, int) or distance < 0:
+                raise ValueError(
+                    f"The {'slop' if query_type == 'phrase' else 'distance'} of a "
+                    f"{query_type} query must be a positive integer."
+                )
+
+        if query_type == "wildcard" and gsi_type == GSI_INDEX_STRATEGIES.CONTAINS:
+            query_terms = self._wildcard_query_terms(
+                query_field,
+                query_term,
+                options.get("strict", False) or options.get("highlight", False),
+            )
+        elif query_type == "wildcard" and gsi_type in TERM_EXPANSION_STRATEGIES:
+            query_terms = self._wildcard_key_terms(query_field, str(query_term))
+        elif query_type == "wildcard":
+            query_terms = []
+        elif (
+            options.get("fuzzy", False)
+            and gsi_type in TERM_EXPANSION_STRATEGIES
+            and isinstance(query_term, str)
+        ):
+            query_terms = self._fuzzy_query_terms(query_field, query_term)
+        else:
+            query_terms = [query_term]
+
+        return TermQuery(
+            field=query_field,
+            query_type=query_type,
+            terms=tuple(query_terms),
+            strategy=gsi_type,
+            strict=options.get("strict", False),
+            highlight=options.get("highlight", False),
+            highlight_stride=options.get("highlight_stride", 1),
+            boost=float(options.get("boost", 1)),
+            expanded=(query_type == "wildcard" or bool(options.get("fuzzy", False)))
+            and gsi_type in TERM_EXPANSION_STRATEGIES,
+            distance=distance,
+        )
 
-            acc = set.union(acc, uuid_intersection)
+    def _estimate_cardinality(self, plan) -> int:
+        """
+        Estimates the number of documents that a plan node matches, from the sizes of the
+        posting lists and key ranges in each GSI that it reads.
+        """
+        if isinstance(plan, EmptyQuery):
+            return 0
 
-            # for each item in metadata, update the scores and highlights
-            final_highlights = defaultdict(list)
-            final_scores = defaultdict(float)
+        if isinstance(plan, TermQuery):
+            return min(self._estimate_term_query_cardinality(plan), len(self))
 
-            for item in metadata:
-                for key in list(acc):
-                    highlights = item.get("highlights", {}).get(key)
-                    if highlights:
-                        final_highlights[key].extend(highlights)
+        cardinalities = [self._estimate_cardinality(clause) for clause in plan.clauses]
 
-                    score_record = item.get("scores", {}).get(key)
-                    if score_record:
-                        final_scores[key] += score_record
+        if plan.operator == "and":
+            return min(cardinalities, default=0)
 
-            scores = {
-                "scores": final_scores,
-                "highlights": final_highlights,
-            }
+        if plan.operator == "or":
+            return min(sum(cardinalities), len(self))
+
+        # "not" matches every document that its first clause does not match
+        return len(self) - (cardinalities[0] if cardinalities else 0)
+
+    def _estimate_term_query_cardinality(self, plan: TermQuery) -> int:
+        gsi = self.gsis[plan.field]["gsi"]
+
+        if plan.strategy == GSI_INDEX_STRATEGIES.CONTAINS and (
+            plan.query_type in {"contains", "wildcard"}
+            or plan.query_type in PROXIMITY_METHODS
+        ):
+            estimate = 0
+
+            for query_term in plan.terms:
+                lengths = [
+                    posting_count(gsi.get(word.lower())) for word in query_term.split()
+                ]
+
+                # strict and positional matches contain every word, other matches contain
+                # any word
+                if (
+                    plan.strict
+                    or plan.highlight
+                    or plan.query_type in PROXIMITY_METHODS
+                ):
+                    estimate += min(lengths, default=0)
+                else:
+                    estimate += sum(lengths)
+
+            return estimate
+
+        if plan.strategy == GSI_INDEX_STRATEGIES.TRIGRAM_CODE:
+            return min(
+                (
+                    posting_count(gsi.get(trigram))
+                    for trigram in get_trigrams(plan.terms[0])
+                ),
+                default=0,
+            )
+
+        # the terms of a wildcard query on a PREFIX or FLAT GSI are the keys it matches
+        if plan.query_type in {"equals", "wildcard"}:
+            return sum(posting_count(gsi.get(query_term)) for query_term in plan.terms)
+
+        if plan.query_type in QUERY_TYPE_KEY_RANGES and plan.strategy in {
+            GSI_INDEX_STRATEGIES.NUMERIC,
+            GSI_INDEX_STRATEGIES.DATE,
+        }:
+            if len(gsi) == 0:
+                return 0
+
+            try:
+                keys = len(
+                    gsi.keys(**QUERY_TYPE_KEY_RANGES[plan.query_type](plan.terms[0]))
+                )
+            except TypeError:
+                return len(self)
+
+            # assume that documents are spread evenly across keys
+            return math.ceil(keys * len(self) / len(gsi))
+
+        return len(self)
+
+    def _execute_plan(self, plan, candidates: numpy.ndarray = None) -> tuple:
+        """
+        Accepts a plan node and returns the query metadata and a sorted array of the doc ids
+        of matching documents.
+
+        If a node is a query, the query is evaluated. If a node is a keyword, the keyword is evaluated
+        with the query results from the children nodes by merging their sorted doc id arrays.
+
+        If `candidates` is given, only documents in that sorted array of doc ids can match. The
+        clauses of an "and" are run from the most to the least selective, and each clause is
+        only run against the documents that matched the clauses before it.
+        """
+        if isinstance(plan, TermQuery):
+            return self._run(plan, candidates)
+
+        if isinstance(plan, EmptyQuery):
+            return {}, EMPTY_DOC_IDS
+
+        # metadata is kept in the order that the clauses are written
+        metadata = [{} for _ in plan.clauses]
+
+        if plan.operator == "and":
+            acc = candidates
+            order = sorted(
+                range(len(plan.clauses)),
+                key=lambda i: self._estimate_cardinality(plan.clauses[i]),
+            )
+
+            for i in order:
+                metadata[i], acc = self._execute_plan(plan.clauses[i], acc)
 
-        elif first_key in self.SELF_METHODS:
-            func = self.SELF_METHODS[first_key]
+                if len(acc) == 0:
+                    break
 
-            acc = set.union(getattr(self, func)(query_tree[first_key]))
+            if acc is None:
+                acc = EMPTY_DOC_IDS
         else:
-            scores, result_uuids = self._run({"query": query_tree}, first_key)
-            acc = set.union(acc, result_uuids)
+            values = []
 
-        return scores, acc
+            for i, clause in enumerate(plan.clauses):
+                metadata[i], query_values = self._execute_plan(clause, candidates)
+                values.append(query_values)
 
-    def _turn_query_into_fuzzy_options(self, query_term: str) -> dict:
-        query_term = str(query_term)
+            acc = METHODS[plan.operator](*values)
 
-        query_terms = []
+            if plan.operator == "not":
+                # "not" removes its matches from the candidates, or from every document
+                if candidates is None:
+                    candidates = self._live_doc_ids()
 
-        # create versions of query where a letter is replaced in every possible position
-        query_terms.extend(
-            [
-                query_term[:i] + c + query_term[i + 1 :]
-                for i in range(len(query_term))
-                for c in string.ascii_lowercase
-            ]
-        )
-        # create versions of query where a letter is added in every possible position
-        query_terms.extend(
-            [
-                query_term[:i] + c + query_term[i:]
-                for i in range(len(query_term))
-                for c in string.ascii_lowercase
-            ]
-        )
+                acc = difference(candidates, acc)
 
-        # add letter to end of query
-        query_terms.extend([query_term + c for c in string.ascii_lowercase])
+        matching_doc_ids = set(acc.tolist())
 
-        # remove a letter from every possible position
-        query_terms.extend(
-            [query_term[:i] + query_term[i + 1 :] for i in range(len(query_term))]
-        )
+        # for each item in metadata, update the scores and highlights
+        final_highlights = defaultdict(list)
+        final_scores = defaultdict(float)
 
-        # swap every letter with the next letter
-        query_terms.extend(
-            [
-                query_term[:i] + query_term[i + 1] + query_term[i] + query_term[i + 2 :]
-                for i in range(len(query_term) - 1)
-            ]
-        )
+        for item in metadata:
+            for key, highlights in item.get("highlights", {}).items():
+                if highlights and key in matching_doc_ids:
+                    final_highlights[key].extend(highlights)
+
+            for key, score_record in item.get("scores", {}).items():
+                if score_record and key in matching_doc_ids:
+                    final_scores[key] += score_record
+
+        scores = {
+            "scores": final_scores,
+            "highlights": final_highlights,
+        }
+
+        return scores, acc
+
+    def _fuzzy_query_terms(self, field: str, query_term: str) -> list:
+        """
+        Returns the query term, and every version of it where one word is replaced by an
+        indexed word within one edit of it.
+
+        Words are looked up as they are written and in lowercase, because words are matched
+        in lowercase by "contains" queries. The words of a CONTAINS GSI are looked up in the
+        fuzzy index of every indexed word, and the words of a PREFIX or FLAT GSI in the fuzzy
+        index of the keys of that GSI.
+        """
+        if self.gsis[field]["strategy"] == GSI_INDEX_STRATEGIES.CONTAINS.name:
+            fuzzy_terms = self._fuzzy_terms
+        else:
+            fuzzy_terms = lambda word: list(self._fuzzy_index(field).search(word))
+
+        words = query_term.split(" ")
+        query_terms = [query_term]
+
+        for i, word in enumerate(words):
+            for term in dict.fromkeys(fuzzy_terms(word) + fuzzy_terms(word.lower())):
+                if term != word:
+                    query_terms.append(" ".join(words[:i] + [term] + words[i + 1 :]))
 
         return query_terms
 
     def _run_trigram_code(self, query_term, query_field):
+        matching_documents = []
         matching_highlights = {}
-        trigrams = get_trigrams(query_term)
 
-        contexts = []
+        gsi = self.gsis[query_field]["gsi"]
+        postings = [gsi.get(trigram) for trigram in get_trigrams(query_term)]
+
+        if not postings or any(posting is None for posting in postings):
+            return matching_documents, matching_highlights
 
-        candidates = set(self.gsis[query_field]["gsi"].get(trigrams[0], []))
+        # the positions of a trigram are the line numbers on which it appears
+        for doc_id in intersect_posting_lists(postings).tolist():
+            line_numbers = set(postings[0].positions_of(doc_id))
 
-        for trigram in trigrams:
-            candidates = candidates.intersection(
-                set(self.gsis[query_field]["gsi"].get(trigram, []))
-            )
+            for posting in postings[1:]:
+                line_numbers &= set(posting.positions_of(doc_id))
 
-        # candidate[2] is the document uuid
-        matching_documents = [candidate[2] for candidate in candidates]
+            if not line_numbers:
+                continue
+
+            file_name = self._document_for_doc_id(doc_id).get("file_name")
 
-        # get line numbers
-        for candidate in candidates:
-            contexts.append(
+            matching_documents.append(doc_id)
+            matching_highlights[doc_id] = [
                 {
-                    "line": candidate[1],
+                    "line": line_num,
                     "code": self.gsis[query_field]["id2line"][
-                        f"{candidate[0]}:{candidate[1]}"
+                        f"{file_name}:{line_num}"
                     ],
                 }
-            )
-            matching_highlights[candidate[2]] = contexts
+                for line_num in sorted(line_numbers)
+            ]
 
         return matching_documents, matching_highlights
 
-    def _run_get_strict_matches(self, query_term, gsi):
-        matching_documents = []
+    def _run_get_strict_matches(self, query_term, gsi, candidates=None):
         matching_positions = {}
-        words = query_term.split()
-        uuids = set(gsi.get(words[0], {}).get("documents", {}).get("uuid", []))
-        # only look at documents that contain all words, for efficiency
-        for w in query_term.split(" "):
-            uuids = uuids.intersection(
-                gsi.get(w, {}).get("documents", {}).get("uuid", [])
+
+        doc_ids, starts = self._run_positional_query(
+            gsi, "phrase", query_term.split(), 0, candidates
+        )
+
+        for key in starts.tolist():
+            matching_positions.setdefault(key >> POSITION_BITS, set()).add(
+                key & ((1 << POSITION_BITS) - 1)
             )
-        for document in uuids:
-            first_word_pos = set(gsi[words[0]]["documents"]["uuid"][document])
 
-            for i, word in enumerate(words):
-                word_uuids = gsi[word]["documents"]["uuid"][document]
-                # subtract i from each position to account for the fact that the first word is at position 0
-                word_positions = set([x - i for x in word_uuids])
+        return doc_ids.tolist(), matching_positions
+
+    def _run_positional_query(
+        self, gsi, query_type: str, words: list, distance: int, candidates=None
+    ) -> tuple:
+        """
+        Returns the doc ids of the documents that match a phrase, near or close_to query, and
+        the position keys of the matches.
+
+        Only documents that contain every word are read. The positions of each word in those
+        documents are read as one sorted array of position keys, and the arrays are merged
+        with binary searches, so a query takes time linear in the number of positions read.
+        """
+        postings = [gsi.get(word) for word in words]
+
+        if not postings or any(posting is None for posting in postings):
+            return EMPTY_DOC_IDS, EMPTY_POSITION_KEYS
+
+        # only look at documents that contain all words, for efficiency
+        if candidates is not None:
+            doc_ids = candidates
+
+            for posting in sorted(postings, key=len):
+                doc_ids = posting.intersect(doc_ids)
+        else:
+            doc_ids = intersect_posting_lists(postings)
 
-                first_word_pos &= word_positions
-            # print position of all "." in text
-            if len(first_word_pos) > 0:
-                matching_documents.append(document)
-                matching_positions[document] = first_word_pos
+        matches = PROXIMITY_METHODS[query_type](
+            [posting.position_keys(doc_ids) for posting in postings], distance
+        )
 
-        return matching_documents, matching_positions
+        return key_doc_ids(matches), matches
 
     def _run_get_highlights(
         self, gsi, query_field, matching_documents, matching_positions, highlight_stride
     ):
         matching_highlights = {}
+        end_of_sentence_postings = gsi.get(END_OF_SENTENCE_TOKEN)
+
         for document in matching_documents:
             highlights = []
             # get pos of .EOS in text
-            eos_token_positions = gsi[END_OF_SENTENCE_TOKEN]["documents"]["uuid"][
-                document
-            ]
+            if end_of_sentence_postings is None:
+                continue
+
+            eos_token_positions = end_of_sentence_postings.positions_of(document)
             if len(eos_token_positions) == 0:
                 continue
             # get first token position before each match and after
@@ -1213,7 +3339,7 @@ class JameSQL:
                 original_before = max(before)
                 original_after = min(after)
 
-                doc = self.global_index[document][query_field].split(" ")
+                doc = self._document_for_doc_id(document)[query_field].split(" ")
 
                 if highlight_stride == 1:
                     highlights.append(
@@ -1265,96 +3391,134 @@ class JameSQL:
 
         return matching_highlights
 
-    def _run(self, query: dict, query_field: str) -> List[str]:
+    def _filter_candidates(
+        self, query_field: str, query_type: str, query_term, candidates: numpy.ndarray
+    ) -> numpy.ndarray:
+        """
+        Returns the candidates whose stored value for `query_field` matches a range or
+        comparison query.
+        """
+        predicate = QUERY_TYPE_VALUE_PREDICATES[query_type]
+        matching_documents = []
+
+        for doc_id in candidates.tolist():
+            value = self._document_for_doc_id(doc_id, [query_field]).get(query_field)
+
+            try:
+                if any(
+                    predicate(item, query_term)
+                    for item in (value if isinstance(value, list) else [value])
+                ):
+                    matching_documents.append(doc_id)
+            except TypeError:
+                # values that cannot be compared with the query term are never stored in
+                # the GSI
+                continue
+
+        return to_numpy(matching_documents)
+
+    def _run(self, plan: TermQuery, candidates: numpy.ndarray = None) -> tuple:
         """
-        Accept a query and return a list of matching documents.
+        Accept a compiled query against a single field and return the query metadata and a
+        sorted array of the doc ids of matching documents.
 
-        This function should be passed in a GSI that is structured to allow
-        for searching the field that a user wants to search by.
+        The query is run against the GSI for the field, which is structured to allow for
+        searching the field that a user wants to search by.
 
         For example, if a user wants to search by title, the GSI should be structured
         so that the title is the key and the partition key is the value.
 
         This can be done using the transform_index_into_gsi function.
+
+        If `candidates` is given, only documents in that sorted array of doc ids can match.
         """
 
+        # a list of sorted doc id arrays, merged once every query term has been run
         matching_documents = []
         matching_document_scores = {}
         matching_highlights = {}
 
-        query_type = list(
-            [
-                key
-                for key in query["query"][query_field].keys()
-                if key not in RESERVED_QUERY_TERMS
-            ]
-        )[0]
-
-        query_term = str(query["query"][query_field][query_type])
+        query_field = plan.field
+        query_type = plan.query_type
+        query_terms = plan.terms
 
-        enforce_strict = query["query"][query_field].get("strict", False)
-        highlight_terms = query["query"][query_field].get("highlight", False)
-        highlight_stride = query["query"][query_field].get("highlight_stride", 1)
+        enforce_strict = plan.strict
+        highlight_terms = plan.highlight
+        highlight_stride = plan.highlight_stride
 
-        if not self.gsis.get(query_field):
-            self.create_gsi(query_field, GSI_INDEX_STRATEGIES.INFER)
-
-        gsi_type = GSI_INDEX_STRATEGIES[self.gsis[query_field]["strategy"]]
+        gsi_type = plan.strategy
 
         gsi = self.gsis[query_field]["gsi"]
 
-        fuzzy = query["query"][query_field].get("fuzzy", False)
-
-        boost_factor = query["query"][query_field].get("boost", 1)
-
-        query_terms = [query_term]
+        boost_factor = plan.boost
 
         matching_positions = {}
 
-        print(query, query_type, gsi_type)
-
-        if fuzzy:
-            final_query_terms = []
-
-            for query_term in query_terms:
-                final_query_terms.extend(
-                    self._turn_query_into_fuzzy_options(query_term)
-                )
-
-            query_terms = final_query_terms
-
-        if query_type == "wildcard":
-            # replace * with every possible character
-            query_terms = [query_term.replace("*", c) for c in string.ascii_lowercase]
+        # when there are fewer candidates than documents in the matching keys, the stored
+        # value of each candidate is checked instead of reading the keys from the GSI
+        filter_candidates = (
+            candidates is not None
+            and query_type in QUERY_TYPE_VALUE_PREDICATES
+            and gsi_type == GSI_INDEX_STRATEGIES.NUMERIC
+            and len(candidates) < self._estimate_cardinality(plan)
+        )
 
         for query_term in query_terms:
-            if gsi_type == GSI_INDEX_STRATEGIES.TRIGRAM_CODE:
-                matching_documents, matching_highlights = self._run_trigram_code(
+            if filter_candidates:
+                matching_documents.append(
+                    self._filter_candidates(
+                        query_field, query_type, query_term, candidates
+                    )
+                )
+            elif gsi_type == GSI_INDEX_STRATEGIES.TRIGRAM_CODE:
+                trigram_matches, matching_highlights = self._run_trigram_code(
                     query_term, query_field
                 )
+                matching_documents.append(trigram_matches)
             elif (
                 query_type == "starts_with" and gsi_type == GSI_INDEX_STRATEGIES.PREFIX
             ):
-                matches = gsi.keys(prefix=query_term)
-                matching_documents.extend([gsi[match] for match in matches])
+                if gsi.has_node(query_term):
+                    matches = gsi.keys(prefix=query_term)
+                    matching_documents.extend([gsi[match] for match in matches])
+            elif (
+                query_type in PROXIMITY_METHODS
+                and gsi_type == GSI_INDEX_STRATEGIES.CONTAINS
+            ):
+                words = str(query_term).lower().split()
+
+                matches, _ = self._run_positional_query(
+                    gsi, query_type, words, plan.distance, candidates
+                )
+                matching_documents.append(matches)
+
+                for word in dict.fromkeys(words):
+                    for doc_id, score in self._term_scores(
+                        query_field, word, matches
+                    ).items():
+                        matching_document_scores[doc_id] = (
+                            matching_document_scores.get(doc_id, 0) + score
+                        )
             elif (
                 query_type in {"contains", "wildcard"}
                 and gsi_type == GSI_INDEX_STRATEGIES.CONTAINS
             ):
                 if enforce_strict or highlight_terms:
-                    matches, pos = (
-                        self._run_get_strict_matches(query_term, gsi)
+                    matches, pos = self._run_get_strict_matches(
+                        query_term, gsi, candidates
                     )
-                    matching_documents.extend(matches)
+                    matching_documents.append(matches)
                     matching_positions = pos
                     if highlight_terms:
-                        matching_highlights.extend(self._run_get_highlights(
-                            gsi,
-                            query_field,
-                            matching_documents,
-                            matching_positions,
-                            highlight_stride,
-                        ))
+                        matching_highlights.update(
+                            self._run_get_highlights(
+                                gsi,
+                                query_field,
+                                matches,
+                                matching_positions,
+                                highlight_stride,
+                            )
+                        )
                 else:
                     for word in str(query_term).split(" "):
                         word = word.lower()
@@ -1362,10 +3526,14 @@ class JameSQL:
                         if gsi.get(word) is None:
                             continue
 
-                        results = self.reverse_tf_idf[word].get(query_field, {})
+                        results = self._term_scores(query_field, word, candidates)
+
+                        for doc_id, score in results.items():
+                            matching_document_scores[doc_id] = (
+                                matching_document_scores.get(doc_id, 0) + score
+                            )
 
-                        matching_document_scores = results
-                        matching_documents.extend(results.keys())
+                        matching_documents.append(list(results.keys()))
 
             elif gsi_type not in (
                 GSI_INDEX_STRATEGIES.FLAT,
@@ -1373,34 +3541,33 @@ class JameSQL:
                 GSI_INDEX_STRATEGIES.DATE,
             ):
                 if query_type == "starts_with":
-                    for document in self.global_index.values():
+                    for doc_id, document in self._iterate_documents():
                         if document.get(query_field).startswith(query_term):
-                            matching_documents.append(document["uuid"])
-                elif query_type == "equals":
-                    matching_documents.extend(
-                        gsi.get(query_term, {}).get("documents", {}).get("uuid", [])
-                    )
+                            matching_documents.append([doc_id])
+                elif query_type in {"equals", "wildcard"}:
+                    postings = gsi.get(query_term)
+
+                    if isinstance(postings, (PostingList, VarintPostingList)):
+                        postings = postings.doc_ids()
+
+                    if postings is not None:
+                        matching_documents.append(postings)
                 elif (
                     query_type == "contains" and gsi_type == GSI_INDEX_STRATEGIES.PREFIX
                 ):
-                    results = [
-                        list(doc["documents"]["uuid"].keys())
-                        for key, doc in gsi.items()
-                        if pybmoore.search(query_term, key)
-                    ]
-                    # flatten
-                    matching_documents.extend(
-                        [item for sublist in results for item in sublist]
-                    )
-            elif query_type == "equals":
-                matching_documents.extend(
-                    [doc_uuid for doc_uuid in gsi.get(query_term, [])]
-                )
+                    for key in self._key_index(query_field).containing(query_term):
+                        postings = gsi.get(key)
+
+                        if postings is not None:
+                            matching_documents.append(postings)
+            elif query_type in {"equals", "wildcard"}:
+                postings = gsi.get(query_term)
+
+                if postings is not None:
+                    matching_documents.append(postings)
             elif query_type == "range":
                 lower_bound, upper_bound = query_term
-                results = gsi.values(min=lower_bound, max=upper_bound)
-                for result in results:
-                    matching_documents.extend(result)
+                matching_documents.extend(gsi.values(min=lower_bound, max=upper_bound))
             elif query_type in QUERY_TYPE_COMPARISON_METHODS and gsi_type in {
                 GSI_INDEX_STRATEGIES.DATE,
                 GSI_INDEX_STRATEGIES.NUMERIC,
@@ -1409,36 +3576,39 @@ class JameSQL:
                 if gsi_type == GSI_INDEX_STRATEGIES.DATE:
                     query_term = datetime.datetime.fromisoformat(query_term)
 
-                result = QUERY_TYPE_COMPARISON_METHODS[query_type](query_term, gsi)
+                matching_documents.extend(
+                    QUERY_TYPE_COMPARISON_METHODS[query_type](query_term, gsi)
+                )
 
-                if isinstance(result[0], list):
-                    for item in result:
-                        matching_documents.extend(item)
-                else:
-                    matching_documents.extend(result)
+            elif (
+                gsi_type == GSI_INDEX_STRATEGIES.FLAT
+                and query_type in {"contains", "starts_with"}
+                and query_term is not None
+            ):
+                query_term = str(query_term)
 
-            else:
-                for key, value in gsi.items():
-                    if query_term is None or key is None or GSI_INDEX_STRATEGIES.DATE:
+                for key in self._key_index(query_field).containing(query_term):
+                    if query_type == "starts_with" and not key.startswith(query_term):
                         continue
 
-                    matches = pybmoore.search(str(query_term), key)
+                    postings = gsi.get(key)
 
-                    if query_type in {"contains", "wildcard"} and len(matches) > 0:
-                        matching_documents.extend(value)
-                    elif query_type == "starts_with" and len(matches) > 0:
-                        for match in matches:
-                            # this indicates that the query term is a prefix of the sort key
-                            if match[0] == 0:
-                                matching_documents.extend(value)
-                                break
+                    if postings is not None:
+                        matching_documents.append(postings)
+
+        doc_ids = union(*matching_documents)
+
+        if candidates is not None:
+            doc_ids = intersect(doc_ids, candidates)
+
+        doc_ids = doc_ids[: self.match_limit_for_large_result_pages]
 
         advanced_query_information = {
             "scores": defaultdict(dict),
             "highlights": defaultdict(dict),
         }
 
-        for doc in matching_documents[: self.match_limit_for_large_result_pages]:
+        for doc in doc_ids.tolist():
             advanced_query_information["scores"][doc] = matching_document_scores.get(
                 doc, 0
             ) * float(boost_factor)
@@ -1448,7 +3618,4 @@ class JameSQL:
                     doc, {}
                 )
 
-        return (
-            advanced_query_information,
-            matching_documents[: self.match_limit_for_large_result_pages],
-        )
+        return advanced_query_information, doc_ids
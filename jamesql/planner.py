@@ -0,0 +1,138 @@
+from enum import Enum
+from typing import NamedTuple
+
+import orjson
+
+# the number of compiled query plans kept for each index
+QUERY_PLAN_CACHE_SIZE = 1024
+
+
+class TermQuery(NamedTuple):
+    """
+    A query against a single field, such as {"title": {"contains": "tolerate"}}.
+
+    `terms` holds every term that is looked up in the GSI: the query term itself, or the
+    expanded options of a fuzzy or wildcard query. `expanded` is True if the options were
+    read from the words in the index, so the plan changes when a new word is indexed.
+    `distance` is the slop of a phrase query, or the distance of a near or close_to query.
+    """
+
+    field: str
+    query_type: str
+    terms: tuple
+    strategy: Enum
+    strict: bool = False
+    highlight: bool = False
+    highlight_stride: int = 1
+    boost: float = 1.0
+    expanded: bool = False
+    distance: int = 0
+
+
+class BooleanQuery(NamedTuple):
+    """
+    An "and", "or" or "not" over the results of its clauses.
+    """
+
+    operator: str
+    clauses: tuple
+
+
+class EmptyQuery(NamedTuple):
+    """
+    A query that matches no documents.
+    """
+
+
+class QueryPlan(NamedTuple):
+    """
+    A compiled query.
+
+    `conditions` is the number of conditions in the top level of the query, which is checked
+    against MAXIMUM_QUERY_STATEMENTS before the query is run.
+    """
+
+    root: NamedTuple
+    conditions: int
+
+
+def query_cache_key(query_tree: dict):
+    """
+    Returns a key that identifies a query tree, or None if the query cannot be serialized.
+
+    Keys are not sorted, because the order of the keys in a query is significant: the first key
+    of a clause is the field or operator that it applies to.
+    """
+    try:
+        return orjson.dumps(query_tree)
+    except TypeError:
+        return None
+
+
+def search_cache_key(query: dict, *arguments):
+    """
+    Returns a key that identifies a search, or None if the search cannot be serialized.
+
+    The options of the search, such as "limit" and "sort_by", are normalized: defaults are
+    filled in and the options are sorted. `arguments` are any other arguments that the
+    response depends on.
+    """
+    query_tree = query_cache_key(query.get("query"))
+
+    if query_tree is None:
+        return None
+
+    options = {key: value for key, value in query.items() if key != "query"}
+
+    options["limit"] = options.get("limit", 10)
+    options["skip"] = options.get("skip") or 0
+    options["sort_by"] = options.get("sort_by") or "_score"
+
+    try:
+        return (
+            query_tree,
+            orjson.dumps(options, option=orjson.OPT_SORT_KEYS),
+            orjson.dumps(arguments),
+        )
+    except TypeError:
+        return None
+
+
+def plan_fields(plan) -> set:
+    """
+    Returns the names of every field that a plan node reads.
+    """
+    if isinstance(plan, TermQuery):
+        return {plan.field}
+
+    if isinstance(plan, BooleanQuery):
+        return set().union(*(plan_fields(clause) for clause in plan.clauses))
+
+    return set()
+
+
+def plan_expands_terms(plan) -> bool:
+    """
+    Returns True if a plan node contains a query whose terms were expanded from the words in
+    the index.
+    """
+    if isinstance(plan, TermQuery):
+        return plan.expanded
+
+    if isinstance(plan, BooleanQuery):
+        return any(plan_expands_terms(clause) for clause in plan.clauses)
+
+    return False
+
+
+def plan_negates(plan) -> bool:
+    """
+    Returns True if a plan node contains a "not", whose results depend on every document in
+    the index.
+    """
+    if isinstance(plan, BooleanQuery):
+        return plan.operator == "not" or any(
+            plan_negates(clause) for clause in plan.clauses
+        )
+
+    return False
@@ -0,0 +1,838 @@
+from array import array
+from bisect import bisect_left
+
+import numpy
+
+# documents are identified inside GSIs by a dense, unsigned 32-bit doc id
+# the external UUID of a document is mapped to its doc id by the index
+DOC_ID_TYPECODE = "I"
+DOC_ID_DTYPE = numpy.uint32
+
+EMPTY_DOC_IDS = numpy.empty(0, dtype=DOC_ID_DTYPE)
+
+# a position key holds a doc id in its high bits and a position in its low POSITION_BITS bits,
+# so the positions of a term in many documents are one sorted array
+POSITION_BITS = 32
+EMPTY_POSITION_KEYS = numpy.empty(0, dtype=numpy.int64)
+
+# the number of documents in each compressed block of a VarintPostingList
+# every block has a skip pointer, so lookups only decode the blocks they need
+POSTINGS_BLOCK_SIZE = 128
+
+
+def doc_id_array(doc_ids=()) -> array:
+    """
+    Returns a new, growable array of doc ids.
+    """
+    return array(DOC_ID_TYPECODE, doc_ids)
+
+
+def insert_doc_id(doc_ids: array, doc_id: int) -> None:
+    """
+    Inserts a doc id into a sorted array of doc ids. Doc ids that are already present are ignored.
+
+    Doc ids are allocated in increasing order, so this is an append in the common case.
+    """
+    if not doc_ids or doc_ids[-1] < doc_id:
+        doc_ids.append(doc_id)
+        return
+
+    position = bisect_left(doc_ids, doc_id)
+
+    if position == len(doc_ids) or doc_ids[position] != doc_id:
+        doc_ids.insert(position, doc_id)
+
+
+def remove_doc_id(doc_ids: array, doc_id: int) -> bool:
+    """
+    Removes a doc id from a sorted array of doc ids. Returns whether the doc id was present.
+    """
+    position = bisect_left(doc_ids, doc_id)
+
+    if position < len(doc_ids) and doc_ids[position] == doc_id:
+        del doc_ids[position]
+        return True
+
+    return False
+
+
+def to_numpy(doc_ids) -> numpy.ndarray:
+    """
+    Returns a sorted array of doc ids as a NumPy array.
+
+    Arrays stored in a GSI are copied, so a query never holds a view of an array that a
+    concurrent write may resize.
+    """
+    if isinstance(doc_ids, numpy.ndarray):
+        return doc_ids
+
+    return numpy.array(doc_ids, dtype=DOC_ID_DTYPE)
+
+
+def intersect(*doc_id_arrays) -> numpy.ndarray:
+    """
+    Returns the doc ids present in every sorted array.
+
+    Arrays are intersected from shortest to longest. Each step looks up the doc ids of the
+    current result in the next array with a binary search, so the cost of an intersection
+    is bounded by the size of the rarest array rather than the most common one.
+    """
+    if not doc_id_arrays:
+        return EMPTY_DOC_IDS
+
+    doc_id_arrays = sorted((to_numpy(doc_ids) for doc_ids in doc_id_arrays), key=len)
+
+    result = doc_id_arrays[0]
+
+    for doc_ids in doc_id_arrays[1:]:
+        if len(result) == 0:
+            break
+
+        positions = numpy.searchsorted(doc_ids, result)
+        found = positions < len(doc_ids)
+        found[found] = doc_ids[positions[found]] == result[found]
+
+        result = result[found]
+
+    return result
+
+
+def union(*doc_id_arrays) -> numpy.ndarray:
+    """
+    Returns the doc ids present in any sorted array.
+    """
+    doc_id_arrays = [to_numpy(doc_ids) for doc_ids in doc_id_arrays]
+
+    if not doc_id_arrays:
+        return EMPTY_DOC_IDS
+
+    if len(doc_id_arrays) == 1:
+        return doc_id_arrays[0]
+
+    # a stable sort of concatenated sorted runs is a k-way merge
+    merged = numpy.sort(numpy.concatenate(doc_id_arrays), kind="stable")
+
+    if len(merged) == 0:
+        return merged
+
+    unique = numpy.empty(len(merged), dtype=bool)
+    unique[0] = True
+    numpy.not_equal(merged[1:], merged[:-1], out=unique[1:])
+
+    return merged[unique]
+
+
+def difference(doc_ids, *doc_id_arrays) -> numpy.ndarray:
+    """
+    Returns the doc ids in the first sorted array that are not present in any other array.
+    """
+    result = to_numpy(doc_ids)
+
+    for other in doc_id_arrays:
+        other = to_numpy(other)
+
+        if len(result) == 0 or len(other) == 0:
+            continue
+
+        positions = numpy.searchsorted(other, result)
+        found = positions < len(other)
+        found[found] = other[positions[found]] == result[found]
+
+        result = result[~found]
+
+    return result
+
+
+def _position_keys(
+    documents, offsets, positions, doc_ids: numpy.ndarray
+) -> numpy.ndarray:
+    """
+    Returns the position keys of a term in each of a sorted array of doc ids, from the
+    parallel arrays of a posting list. Doc ids that are not in `documents` are skipped.
+    """
+    documents = to_numpy(documents)
+    indexes = numpy.searchsorted(documents, doc_ids)
+    found = indexes < len(documents)
+    found[found] = documents[indexes[found]] == doc_ids[found]
+    doc_ids, indexes = doc_ids[found], indexes[found]
+
+    if len(doc_ids) == 0:
+        return EMPTY_POSITION_KEYS
+
+    offsets = numpy.asarray(offsets, dtype=numpy.int64)
+    starts, ends = offsets[indexes], offsets[indexes + 1]
+    lengths = ends - starts
+
+    # only the positions from the first to the last document are copied
+    first = int(starts[0])
+    window = numpy.asarray(positions[first : int(ends[-1])], dtype=numpy.int64)
+    gather = numpy.repeat(
+        starts - first - (numpy.cumsum(lengths) - lengths), lengths
+    ) + numpy.arange(int(lengths.sum()))
+
+    return (
+        numpy.repeat(doc_ids.astype(numpy.int64), lengths) << POSITION_BITS
+    ) | window[gather]
+
+
+class PostingList:
+    """
+    The documents that contain a term in a CONTAINS or TRIGRAM_CODE GSI.
+
+    In a TRIGRAM_CODE GSI, the positions of a trigram are the line numbers on which it appears.
+
+    Postings are stored as parallel arrays, sorted by doc id:
+
+    - `documents`: the doc id of each document that contains the term.
+    - `counts`: the number of times the term appears in each document.
+    - `offsets` and `positions`: the positions of the term in the i-th document are
+      `positions[offsets[i]:offsets[i + 1]]`.
+
+    `count` is the number of times the term appears across all documents.
+    """
+
+    __slots__ = ("count", "documents", "counts", "offsets", "positions")
+
+    def __init__(self):
+        self.count = 0
+        self.documents = doc_id_array()
+        self.counts = array("I")
+        self.offsets = array("I", [0])
+        self.positions = array("I")
+
+    @classmethod
+    def from_arrays(cls, count, documents, counts, offsets, positions) -> "PostingList":
+        """
+        Creates a read-only posting list from existing arrays, such as views of a segment.
+
+        `offsets` may index into a `positions` array shared by many posting lists.
+        """
+        posting_list = cls.__new__(cls)
+        posting_list.count = count
+        posting_list.documents = documents
+        posting_list.counts = counts
+        posting_list.offsets = offsets
+        posting_list.positions = positions
+
+        return posting_list
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def _find(self, doc_id: int) -> int:
+        position = bisect_left(self.documents, doc_id)
+
+        if position < len(self.documents) and self.documents[position] == doc_id:
+            return position
+
+        return -1
+
+    def __contains__(self, doc_id: int) -> bool:
+        return self._find(doc_id) != -1
+
+    def add(self, doc_id: int, positions: list, count: int) -> None:
+        """
+        Adds a document to the posting list. `positions` must be sorted.
+        """
+        if not self.documents or self.documents[-1] < doc_id:
+            self.count += count
+            self.documents.append(doc_id)
+            self.counts.append(count)
+            self.positions.extend(positions)
+            self.offsets.append(len(self.positions))
+            return
+
+        self.remove(doc_id)
+
+        self.count += count
+
+        position = bisect_left(self.documents, doc_id)
+        start = self.offsets[position]
+
+        self.documents.insert(position, doc_id)
+        self.counts.insert(position, count)
+        self.positions[start:start] = array("I", positions)
+        self.offsets.insert(position + 1, start)
+        self._shift_offsets(position + 1, len(positions))
+
+    def remove(self, doc_id: int) -> int:
+        """
+        Removes a document from the posting list and returns the number of times the term
+        appeared in the document.
+        """
+        position = self._find(doc_id)
+
+        if position == -1:
+            return 0
+
+        count = self.counts[position]
+        start, end = self.offsets[position], self.offsets[position + 1]
+
+        del self.documents[position]
+        del self.counts[position]
+        del self.positions[start:end]
+        del self.offsets[position + 1]
+        self._shift_offsets(position + 1, -(end - start))
+
+        self.count -= count
+
+        return count
+
+    def _shift_offsets(self, start: int, amount: int) -> None:
+        if amount == 0 or start >= len(self.offsets):
+            return
+
+        shifted = numpy.array(self.offsets[start:], dtype=numpy.int64) + amount
+        self.offsets[start:] = array("I", shifted.astype(numpy.uint32).tobytes())
+
+    def positions_of(self, doc_id: int):
+        """
+        Returns the positions of the term in a document, or an empty list if the
+        document does not contain the term.
+        """
+        position = self._find(doc_id)
+
+        if position == -1:
+            return []
+
+        return self.positions[
+            self.offsets[position] : self.offsets[position + 1]
+        ].tolist()
+
+    def count_of(self, doc_id: int) -> int:
+        position = self._find(doc_id)
+
+        return 0 if position == -1 else int(self.counts[position])
+
+    def position_keys(self, doc_ids: numpy.ndarray) -> numpy.ndarray:
+        """
+        Returns the positions of the term in each of a sorted array of doc ids, as a sorted
+        array of position keys.
+        """
+        return _position_keys(
+            self.documents, self.offsets, self.positions, to_numpy(doc_ids)
+        )
+
+    def doc_ids(self) -> numpy.ndarray:
+        return to_numpy(self.documents)
+
+    def term_counts(self) -> numpy.ndarray:
+        return numpy.array(self.counts, dtype=numpy.uint32)
+
+    def intersect(self, doc_ids: numpy.ndarray) -> numpy.ndarray:
+        """
+        Returns the doc ids in a sorted array that are also in the posting list.
+        """
+        return intersect(self.documents, doc_ids)
+
+    def postings(self):
+        """
+        Yields every document in the posting list as a (doc id, count, positions) tuple.
+        """
+        for position, doc_id in enumerate(self.documents):
+            yield int(doc_id), int(self.counts[position]), self.positions[
+                self.offsets[position] : self.offsets[position + 1]
+            ].tolist()
+
+    def items(self):
+        """
+        Yields every document in the posting list as a (doc id, positions) tuple.
+        """
+        for doc_id, _, positions in self.postings():
+            yield doc_id, positions
+
+    def nbytes(self) -> int:
+        """
+        Returns the number of bytes used to store the postings.
+        """
+        return sum(
+            len(values) * values.itemsize
+            for values in (self.documents, self.counts, self.offsets, self.positions)
+        )
+
+
+def encode_varints(values) -> bytes:
+    """
+    Encodes non-negative integers as variable-length integers.
+
+    Each byte stores seven bits of a value, least significant bits first. The high bit
+    of a byte is set when more bytes of the same value follow.
+    """
+    values = numpy.asarray(values, dtype=numpy.uint64)
+
+    if len(values) == 0:
+        return b""
+
+    lengths = numpy.ones(len(values), dtype=numpy.int64)
+
+    for bits in range(7, 64, 7):
+        lengths += values >= (1 << bits)
+
+    owners = numpy.repeat(numpy.arange(len(values)), lengths)
+    byte_numbers = numpy.arange(lengths.sum()) - numpy.repeat(
+        numpy.cumsum(lengths) - lengths, lengths
+    )
+
+    encoded = (
+        (values[owners] >> (byte_numbers * 7).astype(numpy.uint64)) & 0x7F
+    ).astype(numpy.uint8)
+    encoded[byte_numbers < lengths[owners] - 1] |= 0x80
+
+    return encoded.tobytes()
+
+
+def decode_varints(data: bytes, limit: int = None) -> numpy.ndarray:
+    """
+    Decodes variable-length integers written by `encode_varints()`.
+
+    If `limit` is provided, only the first `limit` integers are decoded.
+    """
+    raw = numpy.frombuffer(data, dtype=numpy.uint8)
+    ends = numpy.flatnonzero(raw < 0x80)
+
+    if limit is not None and limit < len(ends):
+        ends = ends[:limit]
+        raw = raw[: ends[-1] + 1] if limit else raw[:0]
+
+    if len(ends) == len(raw):
+        # every value fits in a single byte
+        return raw.astype(numpy.int64)
+
+    starts = numpy.empty(len(ends), dtype=numpy.int64)
+    starts[:1] = 0
+    starts[1:] = ends[:-1] + 1
+
+    shifts = (numpy.arange(len(raw)) - numpy.repeat(starts, ends - starts + 1)) * 7
+
+    return numpy.add.reduceat((raw & 0x7F).astype(numpy.int64) << shifts, starts)
+
+
+def _encode_block(doc_ids: list, counts: list, positions: list) -> bytes:
+    """
+    Encodes a block of postings as one stream of variable-length integers:
+
+    [number of documents] [doc id deltas] [counts] [number of positions] [position deltas]
+
+    The first doc id in a block is stored in full, so every block can be decoded on its own.
+    Positions are delta-encoded within each document.
+    """
+    lengths = [len(document_positions) for document_positions in positions]
+    position_deltas = [
+        position - (document_positions[i - 1] if i else 0)
+        for document_positions in positions
+        for i, position in enumerate(document_positions)
+    ]
+
+    parts = [[len(doc_ids)], numpy.diff(doc_ids, prepend=0), counts, lengths]
+    parts.append(position_deltas)
+
+    return encode_varints(
+        numpy.concatenate([numpy.asarray(part, dtype=numpy.int64) for part in parts])
+    )
+
+
+def _decode_block_doc_ids(block: bytes) -> numpy.ndarray:
+    size = int(decode_varints(block, limit=1)[0])
+
+    return numpy.cumsum(decode_varints(block, limit=size + 1)[1:]).astype(DOC_ID_DTYPE)
+
+
+def _decode_block(block: bytes) -> tuple:
+    """
+    Returns the doc ids, counts, position offsets and positions stored in a block.
+    """
+    values = decode_varints(block)
+    size = int(values[0])
+
+    doc_ids = numpy.cumsum(values[1 : size + 1]).astype(DOC_ID_DTYPE)
+    counts = values[size + 1 : 2 * size + 1]
+    lengths = values[2 * size + 1 : 3 * size + 1]
+
+    offsets = numpy.zeros(size + 1, dtype=numpy.int64)
+    numpy.cumsum(lengths, out=offsets[1:])
+
+    # undo the delta encoding, restarting at the first position of each document
+    running_totals = numpy.cumsum(values[3 * size + 1 :])
+    document_starts = numpy.zeros(size, dtype=numpy.int64)
+    has_previous = (offsets[:-1] > 0) & (lengths > 0)
+    document_starts[has_previous] = running_totals[offsets[:-1][has_previous] - 1]
+    positions = running_totals - numpy.repeat(document_starts, lengths)
+
+    return doc_ids, counts, offsets, positions
+
+
+class VarintPostingList:
+    """
+    A compressed posting list, with the same interface as `PostingList`.
+
+    Postings are split into blocks of `POSTINGS_BLOCK_SIZE` documents. Doc ids, counts and
+    positions in each block are delta-encoded and stored as variable-length integers, so a
+    posting usually takes one or two bytes instead of four. The last doc id of every block
+    is kept uncompressed as a skip pointer: lookups and intersections use the skip pointers
+    to find the blocks that can contain a doc id, and only decode those blocks. The most
+    recently decoded block is kept, so repeated lookups in the same block are not decoded
+    again.
+
+    New postings are added to an uncompressed tail, which is compressed into a block once it
+    holds `POSTINGS_BLOCK_SIZE` documents.
+    """
+
+    __slots__ = (
+        "count",
+        "size",
+        "blocks",
+        "block_last_doc_ids",
+        "tail_doc_ids",
+        "tail_counts",
+        "tail_positions",
+        "decoded_block",
+    )
+
+    def __init__(self):
+        self.count = 0
+        self.size = 0
+        self.blocks = []
+        self.block_last_doc_ids = doc_id_array()
+        self.tail_doc_ids = []
+        self.tail_counts = []
+        self.tail_positions = []
+        self.decoded_block = None
+
+    def __getstate__(self) -> dict:
+        # the decoded block is a cache, so it is not saved
+        return {
+            slot: getattr(self, slot)
+            for slot in self.__slots__
+            if slot != "decoded_block"
+        }
+
+    def __setstate__(self, state: dict) -> None:
+        for slot, value in state.items():
+            setattr(self, slot, value)
+
+        self.decoded_block = None
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _last_doc_id(self) -> int:
+        if self.tail_doc_ids:
+            return self.tail_doc_ids[-1]
+
+        if self.block_last_doc_ids:
+            return self.block_last_doc_ids[-1]
+
+        return -1
+
+    def _find_block(self, doc_id: int) -> int:
+        """
+        Returns the block that may contain a doc id. `len(self.blocks)` refers to the tail.
+        """
+        return bisect_left(self.block_last_doc_ids, doc_id)
+
+    def _read_block(self, block_number: int) -> tuple:
+        if block_number == len(self.blocks):
+            offsets = [0]
+
+            for document_positions in self.tail_positions:
+                offsets.append(offsets[-1] + len(document_positions))
+
+            return (
+                numpy.array(self.tail_doc_ids, dtype=DOC_ID_DTYPE),
+                numpy.array(self.tail_counts, dtype=numpy.int64),
+                offsets,
+                numpy.array(
+                    [p for positions in self.tail_positions for p in positions],
+                    dtype=numpy.int64,
+                ),
+            )
+
+        # read the cache once, so that a concurrent search decoding another block cannot
+        # change it between the check and the return
+        decoded_block = self.decoded_block
+
+        if decoded_block is None or decoded_block[0] != block_number:
+            decoded_block = (block_number, _decode_block(self.blocks[block_number]))
+            self.decoded_block = decoded_block
+
+        return decoded_block[1]
+
+    def _write_block(self, block_number: int, doc_ids, counts, positions) -> None:
+        self.decoded_block = None
+
+        if block_number == len(self.blocks):
+            self.tail_doc_ids, self.tail_counts, self.tail_positions = (
+                doc_ids,
+                counts,
+                positions,
+            )
+        elif doc_ids:
+            self.blocks[block_number] = _encode_block(doc_ids, counts, positions)
+            self.block_last_doc_ids[block_number] = doc_ids[-1]
+        else:
+            del self.blocks[block_number]
+            del self.block_last_doc_ids[block_number]
+
+    def _block_postings(self, block_number: int) -> tuple:
+        """
+        Returns the postings in a block as lists that can be modified.
+        """
+        if block_number == len(self.blocks):
+            return (
+                list(self.tail_doc_ids),
+                list(self.tail_counts),
+                list(self.tail_positions),
+            )
+
+        doc_ids, counts, offsets, positions = self._read_block(block_number)
+
+        return (
+            doc_ids.tolist(),
+            counts.tolist(),
+            [
+                positions[offsets[i] : offsets[i + 1]].tolist()
+                for i in range(len(doc_ids))
+            ],
+        )
+
+    def _flush_tail(self) -> None:
+        self.decoded_block = None
+        self.blocks.append(
+            _encode_block(self.tail_doc_ids, self.tail_counts, self.tail_positions)
+        )
+        self.block_last_doc_ids.append(self.tail_doc_ids[-1])
+
+        self.tail_doc_ids = []
+        self.tail_counts = []
+        self.tail_positions = []
+
+    def add(self, doc_id: int, positions: list, count: int) -> None:
+        """
+        Adds a document to the posting list. `positions` must be sorted.
+        """
+        if doc_id > self._last_doc_id():
+            self.tail_doc_ids.append(doc_id)
+            self.tail_counts.append(count)
+            self.tail_positions.append(list(positions))
+        else:
+            self.remove(doc_id)
+
+            block_number = self._find_block(doc_id)
+            doc_ids, counts, block_positions = self._block_postings(block_number)
+
+            position = bisect_left(doc_ids, doc_id)
+            doc_ids.insert(position, doc_id)
+            counts.insert(position, count)
+            block_positions.insert(position, list(positions))
+
+            self._write_block(block_number, doc_ids, counts, block_positions)
+
+        self.count += count
+        self.size += 1
+
+        if len(self.tail_doc_ids) >= POSTINGS_BLOCK_SIZE:
+            self._flush_tail()
+
+    def remove(self, doc_id: int) -> int:
+        """
+        Removes a document from the posting list and returns the number of times the term
+        appeared in the document.
+        """
+        block_number = self._find_block(doc_id)
+        doc_ids, counts, positions = self._block_postings(block_number)
+
+        position = bisect_left(doc_ids, doc_id)
+
+        if position == len(doc_ids) or doc_ids[position] != doc_id:
+            return 0
+
+        count = counts.pop(position)
+        del doc_ids[position]
+        del positions[position]
+
+        self._write_block(block_number, doc_ids, counts, positions)
+
+        self.count -= count
+        self.size -= 1
+
+        return count
+
+    def _locate(self, doc_id: int) -> tuple:
+        """
+        Returns the decoded block that contains a doc id and the position of the doc id in
+        the block, or None if the posting list does not contain the doc id.
+        """
+        block = self._read_block(self._find_block(doc_id))
+        doc_ids = block[0]
+
+        position = int(numpy.searchsorted(doc_ids, doc_id))
+
+        if position == len(doc_ids) or doc_ids[position] != doc_id:
+            return None
+
+        return block, position
+
+    def __contains__(self, doc_id: int) -> bool:
+        return self._locate(doc_id) is not None
+
+    def positions_of(self, doc_id: int):
+        """
+        Returns the positions of the term in a document, or an empty list if the
+        document does not contain the term.
+        """
+        located = self._locate(doc_id)
+
+        if located is None:
+            return []
+
+        (_, _, offsets, positions), position = located
+
+        return positions[offsets[position] : offsets[position + 1]].tolist()
+
+    def count_of(self, doc_id: int) -> int:
+        located = self._locate(doc_id)
+
+        if located is None:
+            return 0
+
+        (_, counts, _, _), position = located
+
+        return int(counts[position])
+
+    def position_keys(self, doc_ids: numpy.ndarray) -> numpy.ndarray:
+        """
+        Returns the positions of the term in each of a sorted array of doc ids, as a sorted
+        array of position keys.
+
+        Each block that may contain one of the doc ids is decoded once.
+        """
+        doc_ids = to_numpy(doc_ids)
+
+        if len(doc_ids) == 0 or self.size == 0:
+            return EMPTY_POSITION_KEYS
+
+        block_numbers = numpy.searchsorted(
+            numpy.array(self.block_last_doc_ids, dtype=DOC_ID_DTYPE), doc_ids
+        )
+        unique_block_numbers, starts = numpy.unique(block_numbers, return_index=True)
+
+        keys = []
+
+        for block_number, candidates in zip(
+            unique_block_numbers.tolist(), numpy.split(doc_ids, starts[1:])
+        ):
+            documents, _, offsets, positions = self._read_block(block_number)
+            keys.append(_position_keys(documents, offsets, positions, candidates))
+
+        return numpy.concatenate(keys)
+
+    def doc_ids(self) -> numpy.ndarray:
+        return numpy.concatenate(
+            [_decode_block_doc_ids(block) for block in self.blocks]
+            + [numpy.array(self.tail_doc_ids, dtype=DOC_ID_DTYPE)]
+        )
+
+    def term_counts(self) -> numpy.ndarray:
+        return numpy.concatenate(
+            [_decode_block(block)[1] for block in self.blocks]
+            + [numpy.array(self.tail_counts, dtype=numpy.int64)]
+        ).astype(numpy.uint32)
+
+    def intersect(self, doc_ids: numpy.ndarray) -> numpy.ndarray:
+        """
+        Returns the doc ids in a sorted array that are also in the posting list.
+
+        Only the blocks whose skip pointers show that they may contain one of the doc ids
+        are decoded.
+        """
+        doc_ids = to_numpy(doc_ids)
+
+        if len(doc_ids) == 0 or self.size == 0:
+            return EMPTY_DOC_IDS
+
+        block_numbers = numpy.searchsorted(
+            numpy.array(self.block_last_doc_ids, dtype=DOC_ID_DTYPE), doc_ids
+        )
+
+        # doc ids are sorted, so the doc ids that fall in each block are contiguous
+        unique_block_numbers, starts = numpy.unique(block_numbers, return_index=True)
+
+        matches = []
+
+        for block_number, candidates in zip(
+            unique_block_numbers.tolist(), numpy.split(doc_ids, starts[1:])
+        ):
+            if block_number == len(self.blocks):
+                block_doc_ids = numpy.array(self.tail_doc_ids, dtype=DOC_ID_DTYPE)
+            else:
+                block_doc_ids = _decode_block_doc_ids(self.blocks[block_number])
+
+            matches.append(intersect(block_doc_ids, candidates))
+
+        return numpy.concatenate(matches) if matches else EMPTY_DOC_IDS
+
+    def postings(self):
+        """
+        Yields every document in the posting list as a (doc id, count, positions) tuple.
+        """
+        for block_number in range(len(self.blocks) + 1):
+            doc_ids, counts, offsets, positions = self._read_block(block_number)
+
+            for i, doc_id in enumerate(doc_ids.tolist()):
+                yield doc_id, int(counts[i]), positions[
+                    offsets[i] : offsets[i + 1]
+                ].tolist()
+
+    def items(self):
+        """
+        Yields every document in the posting list as a (doc id, positions) tuple.
+        """
+        for doc_id, _, positions in self.postings():
+            yield doc_id, positions
+
+    def nbytes(self) -> int:
+        """
+        Returns the number of bytes used to store the postings.
+
+        Postings in the uncompressed tail are counted at four bytes per value.
+        """
+        tail_values = len(self.tail_doc_ids) * 2 + sum(
+            len(positions) for positions in self.tail_positions
+        )
+
+        return (
+            sum(len(block) for block in self.blocks)
+            + len(self.block_last_doc_ids) * self.block_last_doc_ids.itemsize
+            + tail_values * 4
+        )
+
+
+# the posting list classes that can be selected with create_gsi(..., compression=...)
+POSTING_LIST_COMPRESSION = {
+    None: PostingList,
+    "varint": VarintPostingList,
+}
+
+
+def intersect_posting_lists(posting_lists: list) -> numpy.ndarray:
+    """
+    Returns the doc ids present in every posting list.
+
+    Posting lists are intersected from shortest to longest, and each step looks up the
+    current result in the next posting list, so compressed posting lists only decode the
+    blocks that can contain a match.
+    """
+    if not posting_lists:
+        return EMPTY_DOC_IDS
+
+    posting_lists = sorted(posting_lists, key=len)
+
+    result = posting_lists[0].doc_ids()
+
+    for posting_list in posting_lists[1:]:
+        if len(result) == 0:
+            break
+
+        result = posting_list.intersect(result)
+
+    return result
@@ -0,0 +1,118 @@
+import numpy
+
+from jamesql.postings import DOC_ID_DTYPE, POSITION_BITS
+
+# the number of positions between the words of a near or close_to query when "distance" is
+# not set
+DEFAULT_PROXIMITY_DISTANCE = 3
+
+
+def key_doc_ids(keys: numpy.ndarray) -> numpy.ndarray:
+    """
+    Returns the sorted doc ids of an array of position keys.
+    """
+    return numpy.unique(keys >> POSITION_BITS).astype(DOC_ID_DTYPE)
+
+
+def _following_keys(keys: numpy.ndarray, targets: numpy.ndarray, side: str) -> tuple:
+    """
+    Returns the first key in `keys` at ("left") or after ("right") each target, and a mask
+    of the targets that are followed by a key in the same document.
+    """
+    indexes = numpy.searchsorted(keys, targets, side=side)
+    found = indexes < len(keys)
+
+    following = numpy.zeros(len(targets), dtype=numpy.int64)
+    following[found] = keys[indexes[found]]
+    found &= (following >> POSITION_BITS) == (targets >> POSITION_BITS)
+
+    return following, found
+
+
+def phrase(term_keys: list, slop: int = 0) -> numpy.ndarray:
+    """
+    Returns the key of the first word of every match of a phrase.
+
+    The words of a match appear in the order of the phrase. If `slop` is 0, they are
+    adjacent. Otherwise, up to `slop` other words can appear between them in total.
+    """
+    starts = term_keys[0]
+
+    if not slop:
+        for offset, keys in enumerate(term_keys[1:], 1):
+            following, found = _following_keys(keys, starts + offset, "left")
+            starts = starts[found & (following == starts + offset)]
+
+        return starts
+
+    # the earliest position of each word after the word before it gives the shortest match
+    # that starts at each position of the first word
+    ends = starts
+
+    for keys in term_keys[1:]:
+        ends, found = _following_keys(keys, ends, "right")
+        starts, ends = starts[found], ends[found]
+
+    return starts[ends - starts - (len(term_keys) - 1) <= slop]
+
+
+def near(term_keys: list, distance: int = DEFAULT_PROXIMITY_DISTANCE) -> numpy.ndarray:
+    """
+    Returns the key of the first word of every window of at most `distance` positions that
+    contains every word, in any order.
+
+    Each window is found from its first word: the window that starts at a position of a
+    word ends at the latest of the next positions of the other words.
+    """
+    starts = []
+
+    for i, keys in enumerate(term_keys):
+        ends = keys
+        found = numpy.ones(len(keys), dtype=bool)
+
+        for j, other_keys in enumerate(term_keys):
+            if i != j:
+                following, other_found = _following_keys(other_keys, keys, "left")
+                ends = numpy.maximum(ends, following)
+                found &= other_found
+
+        starts.append(keys[found & (ends - keys <= distance)])
+
+    return numpy.unique(numpy.concatenate(starts))
+
+
+def close_to(
+    term_keys: list, distance: int = DEFAULT_PROXIMITY_DISTANCE
+) -> numpy.ndarray:
+    """
+    Returns the key of the last word of every match in which each word appears after the
+    word before it, at most `distance` positions after it.
+
+    The positions of each word that can end a match of the words before it are kept. The
+    closest of those positions before a position of the next word decides if that position
+    can continue the match.
+    """
+    ends = term_keys[0]
+
+    for keys in term_keys[1:]:
+        if len(ends) == 0:
+            break
+
+        indexes = numpy.searchsorted(ends, keys, side="left") - 1
+        found = indexes >= 0
+
+        previous = numpy.zeros(len(keys), dtype=numpy.int64)
+        previous[found] = ends[indexes[found]]
+        found &= (previous >> POSITION_BITS) == (keys >> POSITION_BITS)
+
+        ends = keys[found & (keys - previous <= distance)]
+
+    return ends
+
+
+# the evaluator of each query type that matches words by their positions
+PROXIMITY_METHODS = {
+    "phrase": phrase,
+    "near": near,
+    "close_to": close_to,
+}
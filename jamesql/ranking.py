@@ -0,0 +1,170 @@
+import numpy
+
+from jamesql.postings import (
+    DOC_ID_DTYPE,
+    EMPTY_DOC_IDS,
+    difference,
+    intersect,
+    union,
+)
+
+# upper bounds are inflated by this factor so that floating point rounding when scores are
+# added up can never push a total above the sum of the upper bounds of its terms
+UPPER_BOUND_TOLERANCE = 1 + 1e-9
+
+
+def top_k(doc_ids: numpy.ndarray, scores: numpy.ndarray, k: int) -> tuple:
+    """
+    Returns the doc ids and scores of the `k` highest scoring documents, in decreasing order
+    of score.
+
+    The documents are selected with a partial sort, so only the top k are fully sorted. Ties
+    are broken by doc id, so the result is the same as stable-sorting every document by score.
+    """
+    if k <= 0:
+        return EMPTY_DOC_IDS, numpy.empty(0)
+
+    if len(scores) > k:
+        # the k-th highest score; documents that tie with it are kept so ties can be
+        # broken by doc id
+        threshold = numpy.partition(scores, len(scores) - k)[len(scores) - k]
+        keep = scores >= threshold
+
+        doc_ids, scores = doc_ids[keep], scores[keep]
+
+    order = numpy.lexsort((doc_ids, -scores))[:k]
+
+    return doc_ids[order], scores[order]
+
+
+def _term_scores(term_doc_ids: numpy.ndarray, score, doc_ids: numpy.ndarray):
+    """
+    Returns the scores of a term for a sorted array of doc ids, or 0 for documents that do
+    not contain the term.
+    """
+    positions = numpy.searchsorted(term_doc_ids, doc_ids)
+    positions[positions == len(term_doc_ids)] = 0
+    found = term_doc_ids[positions] == doc_ids
+
+    scores = numpy.zeros(len(doc_ids))
+    scores[found] = score(positions[found])
+
+    return scores
+
+
+def _totals(
+    term_doc_ids: list,
+    scorers: list,
+    terms: list,
+    doc_ids: numpy.ndarray,
+    known_scores: dict = None,
+) -> numpy.ndarray:
+    """
+    Returns the total score of each of a sorted array of doc ids, adding the scores of each
+    term in order. `known_scores` holds the scores of terms that were already computed.
+    """
+    known_scores = known_scores or {}
+    totals = numpy.zeros(len(doc_ids))
+
+    for i in terms:
+        if i in known_scores:
+            totals += known_scores[i]
+        else:
+            totals += _term_scores(term_doc_ids[i], scorers[i], doc_ids)
+
+    return totals
+
+
+def max_score_top_k(
+    term_doc_ids: list,
+    upper_bounds: list,
+    scorers: list,
+    k: int,
+    doc_ids: numpy.ndarray = None,
+) -> tuple:
+    """
+    Returns the doc ids and scores of the `k` documents with the highest total score, in
+    decreasing order of score.
+
+    Each query term has a sorted array of the doc ids that contain it in `term_doc_ids`, the
+    highest score it can give a document in `upper_bounds`, and a function in `scorers`
+    that returns its scores for the documents at an array of positions in its doc ids. The
+    total score of a document is the sum of its scores for each term, added in the order
+    the terms are given. If `doc_ids` is given, only documents in that sorted array are
+    returned.
+
+    Documents are selected with MaxScore, so only the documents that can enter the top k
+    are scored:
+
+    1. The documents of the shortest posting list with at least k documents are scored in
+       full. The k-th highest of their totals is a lower bound on the k-th highest total.
+    2. The terms with the lowest upper bounds are "non-essential" while their upper bounds
+       add up to less than that threshold, so a document that only contains non-essential
+       terms cannot enter the top k.
+    3. The other documents that contain an essential term are scored for the essential
+       terms. The posting lists of the non-essential terms are only probed for the
+       documents whose score, plus the upper bounds of the non-essential terms, can reach
+       the threshold.
+
+    The posting lists of non-essential terms, usually the most common terms, are never
+    read in full.
+    """
+    terms = [i for i, term_ids in enumerate(term_doc_ids) if len(term_ids) > 0]
+
+    if not terms or k <= 0:
+        return EMPTY_DOC_IDS, numpy.empty(0)
+
+    sampled = min(
+        (term_doc_ids[i] for i in terms if len(term_doc_ids[i]) >= k),
+        key=len,
+        default=EMPTY_DOC_IDS,
+    )
+
+    if doc_ids is not None:
+        sampled = intersect(sampled, doc_ids)
+
+    sampled = sampled.astype(DOC_ID_DTYPE, copy=False)
+    sampled_totals = _totals(term_doc_ids, scorers, terms, sampled)
+
+    threshold = top_k(sampled, sampled_totals, k)[1][-1] if len(sampled) >= k else 0
+
+    essential = []
+    non_essential_upper_bound = 0
+
+    for i in sorted(terms, key=upper_bounds.__getitem__):
+        upper_bound = upper_bounds[i] * UPPER_BOUND_TOLERANCE
+
+        # ties are broken by doc id, so a document whose total equals the threshold could
+        # still enter the top k
+        if non_essential_upper_bound + upper_bound < threshold:
+            non_essential_upper_bound += upper_bound
+        else:
+            essential.append(i)
+
+    candidates = difference(union(*(term_doc_ids[i] for i in essential)), sampled)
+
+    if doc_ids is not None:
+        candidates = intersect(candidates, doc_ids)
+
+    candidates = candidates.astype(DOC_ID_DTYPE, copy=False)
+
+    essential_scores = {
+        i: _term_scores(term_doc_ids[i], scorers[i], candidates) for i in essential
+    }
+
+    if essential and non_essential_upper_bound:
+        keep = sum(essential_scores.values()) + non_essential_upper_bound >= threshold
+
+        candidates = candidates[keep]
+        essential_scores = {i: scores[keep] for i, scores in essential_scores.items()}
+
+    return top_k(
+        numpy.concatenate([sampled, candidates]),
+        numpy.concatenate(
+            [
+                sampled_totals,
+                _totals(term_doc_ids, scorers, terms, candidates, essential_scores),
+            ]
+        ),
+        k,
+    )
@@ -1,37 +1,55 @@
+import copy
 import re
+from functools import lru_cache
 
 from lark import Lark, Transformer
 from lark.visitors import Interpreter, Visitor
 
 from .query_simplifier import simplifier
 
-grammar = """
-start: (query)+ sort_component?
-
-or_query: (query ("OR " | "or ") query)*
-and_query: (query ("AND " | "and ") query)*
-query: and_query | or_query | query_component
+# the grammar is unambiguous, so that it can be parsed with LALR in time linear in the
+# length of the query
+# AND and OR must be followed by another query, and sort: must be the last part of a query;
+# otherwise they are searched for as words or fields
+grammar = r"""
+start: query? sort_component?
+
+?query: and_query | or_operand
+and_query: query _AND or_operand
+?or_operand: or_query | query_component
+or_query: or_operand _OR query_component
 query_component: (negate_query | range_query | strict_search_query | word_query | field_query | comparison)+
 
-sort_component: "sort:" TERM (ORDER)?
+sort_component: _SORT WORD (ORDER)?
 strict_search_query: "'" MULTI_WORD "'"
 comparison: TERM OPERATOR WORD
 range_query: TERM "[" WORD "," WORD "]"
 word_query: WORD ("^" FLOAT)?
-field_query: TERM ":" ("'" MULTI_WORD "'" | WORD | DOUBLE_QUOTE MULTI_WORD DOUBLE_QUOTE)
+field_query: TERM ":" ("'" MULTI_WORD "'" | WORD | "\"" MULTI_WORD "\"")
 negate_query: "-" (strict_search_query | word_query | field_query | comparison | range_query)
-OPERATOR: ">" | "<" | ">=" | "<="
-DOUBLE_QUOTE: "\\""
-WORD: /[a-zA-Z0-9_.!?*-]+/
+
+_AND.3: /(AND|and) +(?=\S)/
+_OR.3: /(OR|or) +(?=\S)/
+_SORT.3: /sort:(?=[a-zA-Z0-9_.!?*-]+(\s+(ASC|DESC|asc|desc))?\s*$)/
+OPERATOR: ">=" | "<=" | ">" | "<"
+TERM.2: /[a-zA-Z0-9_]+(?=[:\[<>])/
+WORD: /[a-zA-Z0-9_.!?*][a-zA-Z0-9_.!?*-]*/
 FLOAT: /[0-9]+(\.[0-9]+)?/
 MULTI_WORD: /[a-zA-Z0-9 ]+/
-TERM: /[a-zA-Z0-9_]+/
-ORDER: "ASC" | "DESC" | "asc" | "desc"
+ORDER.2: /(ASC|DESC|asc|desc)(?!\S)/
 
 %import common.WS
 %ignore WS
 """
 
+# the number of parsed and rewritten string queries that are kept, so that repeated queries
+# are not parsed again
+STRING_QUERY_CACHE_SIZE = 1024
+
+# the parser is built once per process; cache=True stores the compiled parse table in a
+# temporary file, so that later processes load it instead of building it again
+STRING_QUERY_PARSER = Lark(grammar, parser="lalr", cache=True)
+
 OPERATOR_MAP = {
     ">": "greater_than",
     "<": "less_than",
@@ -283,11 +301,40 @@ class QueryRewriter(Transformer):
         return items.value
 
 
+@lru_cache(maxsize=STRING_QUERY_CACHE_SIZE)
+def parse_string_query(parser, query):
+    """
+    Parses a string query. Trees are cached, so they must not be modified.
+    """
+    return parser.parse(query)
+
+
+@lru_cache(maxsize=STRING_QUERY_CACHE_SIZE)
+def rewrite_string_query(
+    parser, query, query_keys, default_strategies, boosts, fuzzy, highlight_keys
+):
+    """
+    Parses a string query and rewrites it as a JameSQL query.
+
+    Every argument is hashable, so that rewritten queries can be cached: `query_keys` and
+    `highlight_keys` are tuples, and `default_strategies` and `boosts` are tuples of
+    (key, value) pairs. Rewritten queries are cached, so they must be copied before they are
+    modified.
+    """
+    return QueryRewriter(
+        default_strategies=dict(default_strategies),
+        query_keys=list(query_keys),
+        boosts=dict(boosts),
+        fuzzy=fuzzy,
+        highlight_keys=list(highlight_keys),
+    ).transform(parse_string_query(parser, query))
+
+
 def simplify_string_query(parser, query, correct_spelling_index=None):
     # remove punctuation not in grammar
     query = re.sub(r"[^a-zA-Z0-9_,!?^*:\-.'<>=\[\] ]", "", query)
 
-    tree = parser.parse(query)
+    tree = parse_string_query(parser, query)
 
     result = QuerySimplifier()
     result.transform(tree.copy())
@@ -321,13 +368,13 @@ def simplify_string_query(parser, query, correct_spelling_index=None):
                 final_query += word + " "
                 continue
 
-            final_query += correct_spelling_index.spelling_correction(word) + " "
+            # each word is corrected once, and only words that are replaced are reported
+            correction = correct_spelling_index.spelling_correction(word)
 
-        spelling_substitutions = {
-            word: correct_spelling_index.spelling_correction(word)
-            for word in query.split()
-            if word != correct_spelling_index.spelling_correction(word)
-        }
+            if correction != word:
+                spelling_substitutions[word] = correction
+
+            final_query += correction + " "
 
         query = final_query.strip()
 
@@ -351,14 +398,15 @@ def string_query_to_jamesql(
     if query.strip() == "":
         return {"query": {}}, []
 
-    tree = parser.parse(query)
-
-    rewritten_query = QueryRewriter(
-        default_strategies=default_strategies,
-        query_keys=query_keys,
-        boosts=boosts,
-        fuzzy=fuzzy,
-        highlight_keys=highlight_keys,
-    ).transform(tree)
+    rewritten_query = rewrite_string_query(
+        parser,
+        query,
+        tuple(query_keys),
+        tuple(sorted(default_strategies.items())),
+        tuple(sorted(boosts.items())),
+        fuzzy,
+        tuple(highlight_keys or ()),
+    )
 
-    return rewritten_query, spelling_substitutions
+    # the rewritten query is modified by search(), so the cached query is copied
+    return copy.deepcopy(rewritten_query), spelling_substitutions
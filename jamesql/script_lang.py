@@ -1,6 +1,7 @@
 import datetime
 import math
 
+import numpy
 from lark import Transformer
 
 grammar = """
@@ -72,3 +73,81 @@ class JameSQLScriptTransformer(Transformer):
 
     def OPERATOR(self, items):
         return items.value
+
+
+class JameSQLScriptCompiler(Transformer):
+    """
+    Compiles a script into a function that scores every result document at once.
+
+    The function is called with a `column` function, which returns the values of a field for
+    every document, and the number of documents. Fields are loaded into NumPy arrays, so the
+    script is evaluated once over all documents rather than once per document.
+    """
+
+    def query(self, items):
+        if len(items) == 1:
+            return items[0]
+
+        left, operator, right = items
+
+        operator_command = OPERATOR_METHODS[operator]
+
+        return lambda column: operator_command(left(column), right(column))
+
+    def logarithm(self, items):
+        value = items[1]
+
+        # + 0.1 removes the possibility of log(0)
+        return lambda column: numpy.log(value(column) + 0.1)
+
+    def start(self, items):
+        script = items[0]
+
+        def score_documents(column, size: int) -> list:
+            columns = {}
+
+            def load_column(field):
+                if field not in columns:
+                    columns[field] = numpy.asarray(column(field))
+
+                return columns[field]
+
+            # division by zero returns inf rather than stopping the search
+            with numpy.errstate(divide="ignore", invalid="ignore"):
+                scores = script(load_column)
+
+            return numpy.broadcast_to(scores, (size,)).tolist()
+
+        return score_documents
+
+    def decay(self, items):
+        value = items[0]
+
+        def decay_column(column):
+            # decay by half for every 30 days
+            now = numpy.datetime64(datetime.datetime.now(), "s")
+            posted = value(column).astype("datetime64[s]")
+            # whole days, rounded down like timedelta.days
+            days_since_post = (now - posted) // numpy.timedelta64(1, "D")
+
+            return 1.1 ** (days_since_post / 30)
+
+        return decay_column
+
+    def WORD(self, items):
+        if items.value.isdigit():
+            number = float(items.value)
+
+            return lambda column: number
+
+        field = items.value
+
+        return lambda column: column(field)
+
+    def FLOAT(self, items):
+        number = float(items.value)
+
+        return lambda column: number
+
+    def OPERATOR(self, items):
+        return items.value
@@ -0,0 +1,874 @@
+import mmap
+import os
+import pickle
+import struct
+from collections import Counter
+from collections.abc import Mapping, Sequence
+
+import numpy
+import orjson
+import pygtrie
+
+from jamesql.columns import Column
+from jamesql.postings import PostingList, doc_id_array
+from jamesql.sketches import HyperLogLog, document_sketches
+
+# segments start with a fixed header:
+# magic bytes, format version, and the location of the JSON manifest
+# that describes every array stored in the file
+SEGMENT_MAGIC = b"JSQLSEG\x00"
+SEGMENT_VERSION = 6
+SEGMENT_HEADER = struct.Struct("<8sHQQ")
+
+# arrays are aligned so they can be viewed in place with numpy.frombuffer
+SEGMENT_ALIGNMENT = 8
+
+
+def _encode_key(key) -> bytes:
+    return orjson.dumps(key)
+
+
+class _SegmentWriter:
+    def __init__(self, f):
+        self.f = f
+        self.arrays = {}
+
+        # reserve space for the header, which is written last
+        self.f.write(b"\x00" * SEGMENT_HEADER.size)
+
+    def add_array(self, name: str, values, dtype: str) -> None:
+        array = numpy.asarray(values, dtype=dtype)
+
+        padding = -self.f.tell() % SEGMENT_ALIGNMENT
+        self.f.write(b"\x00" * padding)
+
+        self.arrays[name] = {
+            "offset": self.f.tell(),
+            "dtype": array.dtype.str,
+            "length": len(array),
+        }
+
+        self.f.write(array.tobytes())
+
+    def add_blob(self, name: str, items: list) -> None:
+        offsets = numpy.zeros(len(items) + 1, dtype="<u8")
+        offsets[1:] = numpy.cumsum([len(item) for item in items], dtype="<u8")
+
+        self.add_array(name + ".offsets", offsets, "<u8")
+        self.add_array(
+            name + ".data", numpy.frombuffer(b"".join(items), dtype="u1"), "u1"
+        )
+
+    def add_postings(self, name: str, postings: list, dtype: str = "<u4") -> None:
+        """
+        Writes a list of lists as one contiguous array plus an offsets array.
+        """
+        offsets = numpy.zeros(len(postings) + 1, dtype="<u8")
+        offsets[1:] = numpy.cumsum([len(posting) for posting in postings], dtype="<u8")
+
+        self.add_array(name + ".offsets", offsets, "<u8")
+        self.add_array(
+            name + ".values",
+            [value for posting in postings for value in posting],
+            dtype,
+        )
+
+    def finish(self, manifest: dict) -> None:
+        manifest["arrays"] = self.arrays
+        encoded_manifest = orjson.dumps(manifest)
+
+        manifest_offset = self.f.tell()
+        self.f.write(encoded_manifest)
+
+        self.f.seek(0)
+        self.f.write(
+            SEGMENT_HEADER.pack(
+                SEGMENT_MAGIC, SEGMENT_VERSION, manifest_offset, len(encoded_manifest)
+            )
+        )
+
+
+def _write_reverse_index(
+    writer, prefix, gsi, document_frequencies, max_term_counts, ordinals
+) -> None:
+    terms = sorted(gsi.keys(), key=lambda term: str(term).encode())
+
+    term_counts = []
+    documents = []
+    document_counts = []
+    positions = []
+
+    for term in terms:
+        entry = gsi[term]
+
+        term_documents = []
+        term_document_counts = []
+
+        for doc_id, count, doc_positions in entry.postings():
+            term_documents.append(ordinals[doc_id])
+            term_document_counts.append(count)
+            positions.append(doc_positions)
+
+        term_counts.append(entry.count)
+        documents.append(term_documents)
+        document_counts.append(term_document_counts)
+
+    writer.add_blob(prefix + ".terms", [str(term).encode() for term in terms])
+    writer.add_array(prefix + ".term_counts", term_counts, "<u8")
+    writer.add_array(
+        prefix + ".document_frequencies",
+        [document_frequencies.get(term, 0) for term in terms],
+        "<u4",
+    )
+    writer.add_array(
+        prefix + ".max_term_counts",
+        [max_term_counts.get(term, 0) for term in terms],
+        "<u4",
+    )
+    writer.add_postings(prefix + ".documents", documents)
+    writer.add_postings(prefix + ".document_counts", document_counts)
+    writer.add_postings(prefix + ".positions", positions)
+
+
+def _write_sorted_index(writer, prefix, gsi, ordinals) -> None:
+    keys = list(gsi.keys())
+
+    writer.add_blob(prefix + ".keys", [_encode_key(key) for key in keys])
+    writer.add_postings(
+        prefix + ".documents",
+        [[ordinals[doc_id] for doc_id in gsi[key]] for key in keys],
+    )
+
+    if all(isinstance(key, (int, float)) and not isinstance(key, bool) for key in keys):
+        writer.add_array(prefix + ".numeric_keys", keys, "<f8")
+
+
+def _write_flat_index(writer, prefix, gsi, ordinals) -> None:
+    keys = sorted(gsi.keys(), key=_encode_key)
+
+    writer.add_blob(prefix + ".keys", [_encode_key(key) for key in keys])
+    writer.add_postings(
+        prefix + ".documents",
+        [[ordinals[doc_id] for doc_id in gsi[key]] for key in keys],
+    )
+
+
+def _ordinal_values(values, doc_ids: numpy.ndarray, dtype) -> numpy.ndarray:
+    """
+    Returns the values of an array indexed by doc id, in the order of `doc_ids`. Doc ids
+    past the end of the array are given a value of zero.
+    """
+    values = numpy.asarray(values, dtype=dtype)
+    result = numpy.zeros(len(doc_ids), dtype=dtype)
+
+    in_range = doc_ids < len(values)
+    result[in_range] = values[doc_ids[in_range]]
+
+    return result
+
+
+def _renumber_gsi(gsi: dict, ordinals: dict) -> dict:
+    """
+    Returns a copy of a PREFIX or TRIGRAM_CODE GSI that refers to documents by ordinal.
+
+    Entries for documents that have been removed from the index are dropped.
+    """
+    renumbered = dict(gsi)
+
+    if gsi["strategy"] == "PREFIX":
+        renumbered["gsi"] = pygtrie.CharTrie()
+
+        for key, doc_ids in gsi["gsi"].items():
+            renumbered["gsi"][key] = doc_id_array(
+                ordinals[doc_id] for doc_id in doc_ids if doc_id in ordinals
+            )
+    elif gsi["strategy"] == "TRIGRAM_CODE":
+        renumbered["gsi"] = {}
+
+        for trigram, entry in gsi["gsi"].items():
+            renumbered_entry = type(entry)()
+
+            for doc_id, count, line_numbers in entry.postings():
+                if doc_id in ordinals:
+                    renumbered_entry.add(ordinals[doc_id], line_numbers, count)
+
+            renumbered["gsi"][trigram] = renumbered_entry
+
+    return renumbered
+
+
+def write_segment(index, path: str) -> None:
+    """
+    Writes an index to an immutable segment file that can be opened with `Segment`.
+
+    Stored fields, posting lists, term dictionaries and corpus statistics are stored as
+    contiguous arrays, so a segment can be memory-mapped and shared between processes.
+    """
+
+    # documents are renumbered with dense ordinals, in doc id order, so the
+    # doc ids released by removed documents do not take up space in the segment
+    doc_ids = sorted(index.uuids_to_position_in_global_index.values())
+    doc_uuids = [index.doc_uuids[doc_id] for doc_id in doc_ids]
+    ordinals = {doc_id: ordinal for ordinal, doc_id in enumerate(doc_ids)}
+
+    manifest = {"documents": len(doc_uuids), "fields": {}}
+
+    temporary_path = path + ".tmp"
+
+    with open(temporary_path, "wb") as f:
+        writer = _SegmentWriter(f)
+
+        documents = [index.global_index[doc_uuid] for doc_uuid in doc_uuids]
+
+        # stored fields are written column by column, so that a query that only returns
+        # some fields only decodes those fields
+        stored_fields = list(
+            dict.fromkeys(field for document in documents for field in document)
+        )
+
+        manifest["stored_fields"] = stored_fields
+
+        for column_number, field in enumerate(stored_fields):
+            writer.add_blob(
+                f"stored.{column_number}",
+                [
+                    orjson.dumps(document[field]) if field in document else b""
+                    for document in documents
+                ],
+            )
+
+        encoded_uuids = [_encode_key(doc_uuid) for doc_uuid in doc_uuids]
+
+        writer.add_blob("uuids", encoded_uuids)
+        writer.add_array(
+            "uuids.sorted",
+            sorted(range(len(doc_uuids)), key=encoded_uuids.__getitem__),
+            "<u4",
+        )
+
+        words = sorted(index.word_counts.keys(), key=lambda word: word.encode())
+
+        writer.add_blob("word_counts.words", [word.encode() for word in words])
+        writer.add_array(
+            "word_counts.counts", [index.word_counts[word] for word in words], "<u8"
+        )
+
+        # document lengths and columns are written by ordinal, so BM25 scores and column
+        # sorts read them in place instead of reading every document
+        ordinal_doc_ids = numpy.array(doc_ids, dtype=numpy.int64)
+
+        manifest["document_lengths"] = {}
+        manifest["min_document_lengths"] = {}
+
+        for length_number, (field, lengths) in enumerate(
+            index.document_length_columns.items()
+        ):
+            name = f"document_lengths.{length_number}"
+            lengths = _ordinal_values(lengths, ordinal_doc_ids, "<u4")
+
+            writer.add_array(name, lengths, "<u4")
+            manifest["document_lengths"][field] = name
+
+            # documents without the field have a length of 0
+            if numpy.any(lengths > 0):
+                manifest["min_document_lengths"][field] = int(
+                    lengths[lengths > 0].min()
+                )
+
+        # sketches are rebuilt from the stored documents, so they do not count the values
+        # of removed documents
+        sketches = document_sketches(documents, index.sketch_precision)
+
+        for field_number, (field, gsi) in enumerate(index.gsis.items()):
+            strategy = gsi["strategy"]
+            prefix = f"fields.{field_number}"
+
+            field_manifest = {"strategy": strategy, "prefix": prefix}
+            manifest["fields"][field] = field_manifest
+
+            if field in sketches:
+                writer.add_array(prefix + ".sketch", sketches[field].registers, "u1")
+                field_manifest["sketch_precision"] = sketches[field].precision
+
+            if field in index.columns:
+                column = index.columns[field]
+
+                writer.add_array(
+                    prefix + ".column.values",
+                    _ordinal_values(column.values, ordinal_doc_ids, column.dtype),
+                    column.dtype,
+                )
+                writer.add_array(
+                    prefix + ".column.present",
+                    _ordinal_values(column.present, ordinal_doc_ids, "?"),
+                    "?",
+                )
+                field_manifest["column"] = True
+
+            if strategy == "CONTAINS":
+                _write_reverse_index(
+                    writer,
+                    prefix,
+                    gsi["gsi"],
+                    index.document_frequencies.get(field, {}),
+                    index.max_term_counts.get(field, {}),
+                    ordinals,
+                )
+
+                field_manifest["documents"] = index.field_document_counts[field]
+                field_manifest["length"] = index.field_lengths[field]
+            elif strategy in {"NUMERIC", "DATE"}:
+                _write_sorted_index(writer, prefix, gsi["gsi"], ordinals)
+            elif strategy == "FLAT":
+                _write_flat_index(writer, prefix, gsi["gsi"], ordinals)
+            else:
+                # other strategies are small or rarely used, so they are
+                # pickled and loaded onto the heap when the segment is opened
+                writer.add_blob(
+                    prefix + ".pickle",
+                    [
+                        pickle.dumps(
+                            _renumber_gsi(gsi, ordinals),
+                            protocol=pickle.HIGHEST_PROTOCOL,
+                        )
+                    ],
+                )
+
+        writer.finish(manifest)
+
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(temporary_path, path)
+
+
+class _Blob:
+    """
+    A read-only sequence of variable-length byte strings stored in a segment.
+    """
+
+    def __init__(self, segment, name: str):
+        self.offsets = segment.array(name + ".offsets")
+        self.data = segment.array(name + ".data")
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, position: int) -> bytes:
+        return self.data[self.offsets[position] : self.offsets[position + 1]].tobytes()
+
+    def find(self, key: bytes, order=None) -> int:
+        """
+        Returns the position of `key` in a blob sorted by byte value, or -1 if it is not present.
+
+        If `order` is provided, the blob is sorted in the order of the positions in `order`.
+        """
+        low, high = 0, len(self)
+
+        while low < high:
+            middle = (low + high) // 2
+            position = order[middle] if order is not None else middle
+
+            if self[position] < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        if low == len(self):
+            return -1
+
+        position = order[low] if order is not None else low
+
+        return position if self[position] == key else -1
+
+
+class _Postings:
+    """
+    A read-only list of arrays stored contiguously in a segment.
+    """
+
+    def __init__(self, segment, name: str):
+        self.offsets = segment.array(name + ".offsets")
+        self.values = segment.array(name + ".values")
+
+    def __getitem__(self, position: int) -> numpy.ndarray:
+        return self.values[self.offsets[position] : self.offsets[position + 1]]
+
+
+class SegmentDocuments(Mapping):
+    """
+    A read-only mapping of document UUIDs to documents, decoded from a segment on access.
+
+    Documents are stored in ordinal order. The ordinal of a document is its doc id. Each
+    field is stored in its own column, with an empty value for documents without the field.
+    """
+
+    def __init__(self, segment):
+        self.columns = {
+            field: _Blob(segment, f"stored.{column_number}")
+            for column_number, field in enumerate(segment.manifest["stored_fields"])
+        }
+        self.uuids = _Blob(segment, "uuids")
+        self.sorted_uuids = segment.array("uuids.sorted")
+
+    def uuid(self, ordinal: int):
+        return orjson.loads(self.uuids[ordinal])
+
+    def document(self, ordinal: int, fields: list = None) -> dict:
+        """
+        Returns a document. If `fields` is provided, only those fields are decoded.
+        """
+        if fields is None:
+            columns = self.columns.items()
+        else:
+            columns = [
+                (field, self.columns[field])
+                for field in fields
+                if field in self.columns
+            ]
+
+        document = {}
+
+        for field, column in columns:
+            value = column[ordinal]
+
+            if value:
+                document[field] = orjson.loads(value)
+
+        return document
+
+    def ordinal(self, doc_uuid) -> int:
+        """
+        Returns the ordinal of a document, or -1 if the document is not in the segment.
+        """
+        return self.uuids.find(_encode_key(doc_uuid), self.sorted_uuids)
+
+    def __getitem__(self, doc_uuid) -> dict:
+        ordinal = self.ordinal(doc_uuid)
+
+        if ordinal == -1:
+            raise KeyError(doc_uuid)
+
+        return self.document(ordinal)
+
+    def __contains__(self, doc_uuid) -> bool:
+        return self.ordinal(doc_uuid) != -1
+
+    def __iter__(self):
+        for ordinal in range(len(self)):
+            yield self.uuid(ordinal)
+
+    def __len__(self) -> int:
+        return len(self.uuids)
+
+    def values(self):
+        for ordinal in range(len(self)):
+            yield self.document(ordinal)
+
+    def items(self):
+        for ordinal in range(len(self)):
+            yield self.uuid(ordinal), self.document(ordinal)
+
+
+class SegmentDocIds(Mapping):
+    """
+    A read-only mapping of document UUIDs to doc ids.
+    """
+
+    def __init__(self, documents: SegmentDocuments):
+        self.documents = documents
+
+    def __getitem__(self, doc_uuid) -> int:
+        ordinal = self.documents.ordinal(doc_uuid)
+
+        if ordinal == -1:
+            raise KeyError(doc_uuid)
+
+        return ordinal
+
+    def __iter__(self):
+        return iter(self.documents)
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def values(self):
+        return range(len(self.documents))
+
+
+class SegmentDocUuids(Sequence):
+    """
+    A read-only sequence of document UUIDs, indexed by doc id.
+    """
+
+    def __init__(self, documents: SegmentDocuments):
+        self.documents = documents
+
+    def __getitem__(self, doc_id: int):
+        return self.documents.uuid(doc_id)
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+
+class SegmentReverseIndex(Mapping):
+    """
+    A read-only CONTAINS GSI backed by a segment.
+
+    Entries are `PostingList`s whose arrays are views of the segment, so reading an
+    entry does not copy or decode its postings. Compressed posting lists are written to
+    segments uncompressed, since a segment is not read into memory.
+    """
+
+    def __init__(self, segment, prefix: str):
+        self.terms = _Blob(segment, prefix + ".terms")
+        self.term_counts = segment.array(prefix + ".term_counts")
+        self.documents = _Postings(segment, prefix + ".documents")
+        self.document_counts = _Postings(segment, prefix + ".document_counts")
+        self.positions = _Postings(segment, prefix + ".positions")
+        self.document_frequencies = _TermValues(
+            self.terms, segment.array(prefix + ".document_frequencies")
+        )
+        self.max_term_counts = _TermValues(
+            self.terms, segment.array(prefix + ".max_term_counts")
+        )
+
+    def entry(self, position: int) -> PostingList:
+        first_posting = self.documents.offsets[position]
+        last_posting = self.documents.offsets[position + 1]
+
+        return PostingList.from_arrays(
+            int(self.term_counts[position]),
+            self.documents[position],
+            self.document_counts[position],
+            # offsets index into the positions of every posting in the field
+            self.positions.offsets[first_posting : last_posting + 1],
+            self.positions.values,
+        )
+
+    def __getitem__(self, term) -> PostingList:
+        position = self.terms.find(str(term).encode())
+
+        if position == -1:
+            raise KeyError(term)
+
+        return self.entry(position)
+
+    def __contains__(self, term) -> bool:
+        return self.terms.find(str(term).encode()) != -1
+
+    def __iter__(self):
+        for position in range(len(self.terms)):
+            yield self.terms[position].decode()
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+
+class SegmentSortedIndex(Mapping):
+    """
+    A read-only NUMERIC or DATE GSI backed by a segment.
+
+    This class implements the subset of the `OOBTree` interface used by the query engine.
+    """
+
+    def __init__(self, segment, prefix: str):
+        self.encoded_keys = _Blob(segment, prefix + ".keys")
+        self.documents = _Postings(segment, prefix + ".documents")
+
+        if segment.has_array(prefix + ".numeric_keys"):
+            self.numeric_keys = segment.array(prefix + ".numeric_keys")
+        else:
+            self.numeric_keys = None
+
+    def key(self, position: int):
+        return orjson.loads(self.encoded_keys[position])
+
+    def _bisect(self, key, right=False) -> int:
+        if self.numeric_keys is not None:
+            return int(
+                numpy.searchsorted(
+                    self.numeric_keys, key, side="right" if right else "left"
+                )
+            )
+
+        low, high = 0, len(self)
+
+        while low < high:
+            middle = (low + high) // 2
+            middle_key = self.key(middle)
+
+            if middle_key < key or (right and middle_key == key):
+                low = middle + 1
+            else:
+                high = middle
+
+        return low
+
+    def __getitem__(self, key) -> numpy.ndarray:
+        position = self._bisect(key)
+
+        if position == len(self) or self.key(position) != key:
+            raise KeyError(key)
+
+        return self.documents[position]
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self.key(position)
+
+    def __len__(self) -> int:
+        return len(self.encoded_keys)
+
+    def values(self, min=None, max=None, excludemin=False, excludemax=False):
+        start = 0 if min is None else self._bisect(min, right=excludemin)
+        end = len(self) if max is None else self._bisect(max, right=not excludemax)
+
+        for position in range(start, end):
+            yield self.documents[position]
+
+
+class SegmentFlatIndex(Mapping):
+    """
+    A read-only FLAT GSI backed by a segment.
+    """
+
+    def __init__(self, segment, prefix: str):
+        self.encoded_keys = _Blob(segment, prefix + ".keys")
+        self.documents = _Postings(segment, prefix + ".documents")
+
+    def __getitem__(self, key) -> numpy.ndarray:
+        try:
+            position = self.encoded_keys.find(_encode_key(key))
+        except TypeError:
+            raise KeyError(key)
+
+        if position == -1:
+            raise KeyError(key)
+
+        return self.documents[position]
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield orjson.loads(self.encoded_keys[position])
+
+    def __len__(self) -> int:
+        return len(self.encoded_keys)
+
+
+class SegmentDocumentLengths(Mapping):
+    """
+    A read-only mapping of document UUIDs to the length of each of their string fields,
+    read from the document length columns of a segment.
+    """
+
+    def __init__(self, documents: SegmentDocuments, columns: dict):
+        self.documents = documents
+        self.columns = columns
+
+    def __getitem__(self, doc_uuid) -> dict:
+        ordinal = self.documents.ordinal(doc_uuid)
+
+        if ordinal == -1:
+            raise KeyError(doc_uuid)
+
+        # fields that a document does not have are stored with a length of zero
+        return {
+            field: int(column[ordinal])
+            for field, column in self.columns.items()
+            if column[ordinal]
+        }
+
+    def __iter__(self):
+        return iter(self.documents)
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+
+class _TermValues(Mapping):
+    """
+    A read-only mapping of terms to integers. Like `Counter`, unknown terms have a value of 0.
+    """
+
+    def __init__(self, words: _Blob, counts: numpy.ndarray):
+        self.words = words
+        self.counts = counts
+
+    def __getitem__(self, word) -> int:
+        position = self.words.find(str(word).encode())
+
+        return 0 if position == -1 else int(self.counts[position])
+
+    def get(self, word, default=None):
+        position = self.words.find(str(word).encode())
+
+        return default if position == -1 else int(self.counts[position])
+
+    def __contains__(self, word) -> bool:
+        return self.words.find(str(word).encode()) != -1
+
+    def __iter__(self):
+        for position in range(len(self.words)):
+            yield self.words[position].decode()
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+
+class Segment:
+    """
+    An immutable index segment opened with `mmap`.
+
+    Every process that opens the same segment shares one copy of it in the OS page cache,
+    and only the pages touched by a query are read from disk.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+        with open(path, "rb") as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self.mmap) < SEGMENT_HEADER.size:
+            raise ValueError(f"{path} is not a JameSQL segment.")
+
+        magic, version, manifest_offset, manifest_length = SEGMENT_HEADER.unpack(
+            self.mmap[: SEGMENT_HEADER.size]
+        )
+
+        if magic != SEGMENT_MAGIC:
+            raise ValueError(f"{path} is not a JameSQL segment.")
+
+        if version != SEGMENT_VERSION:
+            raise ValueError(
+                f"Unsupported segment version {version}. "
+                f"This version of JameSQL reads segment version {SEGMENT_VERSION}."
+            )
+
+        self.manifest = orjson.loads(
+            self.mmap[manifest_offset : manifest_offset + manifest_length]
+        )
+
+        self._documents = None
+
+    def has_array(self, name: str) -> bool:
+        return name in self.manifest["arrays"]
+
+    def array(self, name: str) -> numpy.ndarray:
+        """
+        Returns a zero-copy view of an array stored in the segment.
+        """
+        array = self.manifest["arrays"][name]
+
+        return numpy.frombuffer(
+            self.mmap,
+            dtype=array["dtype"],
+            count=array["length"],
+            offset=array["offset"],
+        )
+
+    def documents(self) -> SegmentDocuments:
+        if self._documents is None:
+            self._documents = SegmentDocuments(self)
+
+        return self._documents
+
+    def doc_ids(self) -> SegmentDocIds:
+        return SegmentDocIds(self.documents())
+
+    def doc_uuids(self) -> SegmentDocUuids:
+        return SegmentDocUuids(self.documents())
+
+    def word_counts(self) -> _TermValues:
+        return _TermValues(
+            _Blob(self, "word_counts.words"), self.array("word_counts.counts")
+        )
+
+    def corpus_statistics(self, gsis: dict) -> tuple:
+        """
+        Returns the document frequencies, document counts, total lengths and largest term
+        counts of every CONTAINS field in the segment, and the length of the shortest value
+        of every string field.
+        """
+        document_frequencies = {}
+        field_document_counts = Counter()
+        field_lengths = Counter()
+        max_term_counts = {}
+
+        for field, field_manifest in self.manifest["fields"].items():
+            if field_manifest["strategy"] != "CONTAINS":
+                continue
+
+            document_frequencies[field] = gsis[field]["gsi"].document_frequencies
+            max_term_counts[field] = gsis[field]["gsi"].max_term_counts
+            field_document_counts[field] = field_manifest["documents"]
+            field_lengths[field] = field_manifest["length"]
+
+        return (
+            document_frequencies,
+            field_document_counts,
+            field_lengths,
+            max_term_counts,
+            dict(self.manifest["min_document_lengths"]),
+        )
+
+    def document_length_columns(self) -> dict:
+        """
+        Returns the length of every string field, indexed by ordinal.
+        """
+        return {
+            field: self.array(name)
+            for field, name in self.manifest["document_lengths"].items()
+        }
+
+    def doc_lengths(self) -> "SegmentDocumentLengths":
+        return SegmentDocumentLengths(self.documents(), self.document_length_columns())
+
+    def columns(self) -> dict:
+        """
+        Returns the column of every NUMERIC and DATE field in the segment.
+        """
+        return {
+            field: Column.from_arrays(
+                self.array(field_manifest["prefix"] + ".column.values"),
+                self.array(field_manifest["prefix"] + ".column.present"),
+                dates=field_manifest["strategy"] == "DATE",
+            )
+            for field, field_manifest in self.manifest["fields"].items()
+            if field_manifest.get("column")
+        }
+
+    def field_sketches(self) -> dict:
+        """
+        Returns the HyperLogLog sketch of the distinct values of every field in the segment.
+        """
+        return {
+            field: HyperLogLog(
+                field_manifest["sketch_precision"],
+                self.array(field_manifest["prefix"] + ".sketch"),
+            )
+            for field, field_manifest in self.manifest["fields"].items()
+            if "sketch_precision" in field_manifest
+        }
+
+    def gsis(self) -> dict:
+        gsis = {}
+
+        for field, field_manifest in self.manifest["fields"].items():
+            strategy = field_manifest["strategy"]
+            prefix = field_manifest["prefix"]
+
+            if strategy == "CONTAINS":
+                gsi = SegmentReverseIndex(self, prefix)
+            elif strategy in {"NUMERIC", "DATE"}:
+                gsi = SegmentSortedIndex(self, prefix)
+            elif strategy == "FLAT":
+                gsi = SegmentFlatIndex(self, prefix)
+            else:
+                gsis[field] = pickle.loads(_Blob(self, prefix + ".pickle")[0])
+                continue
+
+            gsis[field] = {"gsi": gsi, "strategy": strategy}
+
+        return gsis
@@ -0,0 +1,185 @@
+import hashlib
+import math
+
+import numpy
+
+# a sketch has 2 ** precision registers, for a relative error of about 1.04 / sqrt(registers)
+# the default of 14 uses 16 KB per field, for an error of about 0.8%
+HYPERLOGLOG_PRECISION = 14
+MINIMUM_HYPERLOGLOG_PRECISION = 4
+MAXIMUM_HYPERLOGLOG_PRECISION = 18
+
+# values are hashed to 64 bits, so no correction is needed for large cardinalities
+HASH_BITS = 64
+
+
+def hash_value(value) -> int:
+    """
+    Returns a 64-bit hash of a value.
+
+    Python's built-in `hash()` is randomized for every process, so sketches built with it
+    could not be merged across processes.
+    """
+    # 1 and 1.0 are the same value in a set, so they are hashed the same way
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+
+    return int.from_bytes(
+        hashlib.blake2b(repr(value).encode(), digest_size=8).digest(), "big"
+    )
+
+
+class HyperLogLog:
+    """
+    An approximate count of the distinct values added to it, in a fixed amount of memory.
+
+    Sketches with the same precision can be merged, so a sketch of every value in several
+    indexes or segments can be made from a sketch of each one. A sketch can also be reduced
+    to a lower precision, so sketches with different precisions can be merged too.
+
+    Values cannot be removed from a sketch.
+    """
+
+    def __init__(self, precision: int = HYPERLOGLOG_PRECISION, registers=None) -> None:
+        if not (
+            isinstance(precision, int)
+            and MINIMUM_HYPERLOGLOG_PRECISION
+            <= precision
+            <= MAXIMUM_HYPERLOGLOG_PRECISION
+        ):
+            raise ValueError(
+                f"HyperLogLog precision must be between {MINIMUM_HYPERLOGLOG_PRECISION} "
+                f"and {MAXIMUM_HYPERLOGLOG_PRECISION}."
+            )
+
+        self.precision = precision
+
+        if registers is None:
+            registers = numpy.zeros(1 << precision, dtype=numpy.uint8)
+
+        # each register holds the longest run of leading zeros, plus one, seen in the hashes
+        # of the values that were assigned to it
+        self.registers = registers
+
+    def _register(self, value) -> tuple:
+        """
+        Returns the register that a value is assigned to, and the rank of its hash.
+        """
+        value_hash = hash_value(value)
+        remaining_bits = HASH_BITS - self.precision
+        remainder = value_hash & ((1 << remaining_bits) - 1)
+
+        return value_hash >> remaining_bits, remaining_bits - remainder.bit_length() + 1
+
+    def add(self, value) -> None:
+        register, rank = self._register(value)
+
+        if rank > self.registers[register]:
+            self.registers[register] = rank
+
+    def update(self, values) -> None:
+        """
+        Adds every value in an iterable to the sketch.
+        """
+        assigned = [self._register(value) for value in values]
+
+        if assigned:
+            registers, ranks = zip(*assigned)
+            numpy.maximum.at(self.registers, list(registers), list(ranks))
+
+    def count(self) -> int:
+        """
+        Returns the estimated number of distinct values added to the sketch.
+        """
+        registers = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / registers)
+
+        estimate = (
+            alpha
+            * registers**2
+            / numpy.sum(numpy.ldexp(1.0, -self.registers.astype(numpy.int64)))
+        )
+
+        # small cardinalities are estimated more accurately from the number of empty registers
+        empty_registers = int(numpy.count_nonzero(self.registers == 0))
+
+        if estimate <= 2.5 * registers and empty_registers:
+            estimate = registers * math.log(registers / empty_registers)
+
+        return int(round(estimate))
+
+    def reduce(self, precision: int) -> "HyperLogLog":
+        """
+        Returns a copy of the sketch with a lower precision.
+
+        The registers that share the first `precision` bits of their index are folded into a
+        single register. The bits that are dropped from the index become the first bits of the
+        hash that the rank is counted from.
+        """
+        if precision > self.precision:
+            raise ValueError("A sketch cannot be converted to a higher precision.")
+
+        dropped_bits = self.precision - precision
+
+        if not dropped_bits:
+            return HyperLogLog(precision, self.registers.copy())
+
+        indexes = numpy.arange(len(self.registers))
+        dropped = indexes & ((1 << dropped_bits) - 1)
+
+        # the number of bits needed to represent each dropped value
+        dropped_lengths = numpy.zeros(len(dropped), dtype=numpy.int64)
+        nonzero = dropped > 0
+        dropped_lengths[nonzero] = numpy.floor(numpy.log2(dropped[nonzero])) + 1
+
+        ranks = numpy.where(
+            nonzero,
+            dropped_bits - dropped_lengths + 1,
+            self.registers.astype(numpy.int64) + dropped_bits,
+        )
+        ranks[self.registers == 0] = 0
+
+        registers = numpy.zeros(1 << precision, dtype=numpy.uint8)
+        numpy.maximum.at(registers, indexes >> dropped_bits, ranks.astype(numpy.uint8))
+
+        return HyperLogLog(precision, registers)
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        """
+        Returns a sketch of the values in both sketches, with the lower of their precisions.
+        """
+        precision = min(self.precision, other.precision)
+
+        return HyperLogLog(
+            precision,
+            numpy.maximum(
+                self.reduce(precision).registers, other.reduce(precision).registers
+            ),
+        )
+
+
+def document_sketches(documents, precision: int = HYPERLOGLOG_PRECISION) -> dict:
+    """
+    Returns a sketch of the distinct values of every field in an iterable of documents.
+    """
+    sketches = {}
+
+    for document in documents:
+        add_document_to_sketches(sketches, document, precision)
+
+    return sketches
+
+
+def add_document_to_sketches(sketches: dict, document: dict, precision: int) -> None:
+    """
+    Adds the value of every field in a document to the sketch of that field. The items of
+    list values are counted as separate values.
+    """
+    for key, value in document.items():
+        if key == "uuid":
+            continue
+
+        if key not in sketches:
+            sketches[key] = HyperLogLog(precision)
+
+        sketches[key].update(value if isinstance(value, list) else [value])
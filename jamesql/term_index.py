@@ -0,0 +1,278 @@
+import re
+from collections import Counter, defaultdict
+
+from jamesql.postings import doc_id_array, intersect, remove_doc_id
+
+# fuzzy queries and spelling corrections look up the terms one edit away from a word
+FUZZY_MAX_EDIT_DISTANCE = 1
+
+# wildcard patterns are matched against the terms that contain every 3-gram of the pattern
+# terms are wrapped in KGRAM_BOUNDARY, so the first and last characters of a term have 3-grams
+# that only match at the start or end of a term
+KGRAM_LENGTH = 3
+KGRAM_BOUNDARY = "$"
+
+
+def edit_distance(first: str, second: str, max_distance: int) -> int:
+    """
+    Returns the number of insertions, deletions, substitutions and transpositions of adjacent
+    characters needed to turn `first` into `second`, or `max_distance + 1` if more than
+    `max_distance` edits are needed.
+    """
+    if abs(len(first) - len(second)) > max_distance:
+        return max_distance + 1
+
+    before_previous_row = None
+    row = list(range(len(second) + 1))
+
+    for i in range(1, len(first) + 1):
+        previous_row, row = row, [i] + [0] * len(second)
+
+        for j in range(1, len(second) + 1):
+            cost = first[i - 1] != second[j - 1]
+
+            row[j] = min(
+                row[j - 1] + 1, previous_row[j] + 1, previous_row[j - 1] + cost
+            )
+
+            if (
+                i > 1
+                and j > 1
+                and first[i - 1] == second[j - 2]
+                and first[i - 2] == second[j - 1]
+            ):
+                row[j] = min(row[j], before_previous_row[j - 2] + 1)
+
+        # every later row is at least the minimum of this one
+        if min(row) > max_distance:
+            return max_distance + 1
+
+        before_previous_row = previous_row
+
+    return min(row[-1], max_distance + 1)
+
+
+def deletes(term: str, max_distance: int) -> set:
+    """
+    Returns every string that can be made by deleting up to `max_distance` characters from
+    a term, including the term itself.
+    """
+    results = {term}
+    current = {term}
+
+    for _ in range(max_distance):
+        current = {
+            variant[:i] + variant[i + 1 :]
+            for variant in current
+            for i in range(len(variant))
+        }
+        results |= current
+
+    return results
+
+
+class DeletionIndex:
+    """
+    A SymSpell index that finds every term within an edit distance of a word.
+
+    Every string that can be made by deleting up to `max_distance` characters from a term is
+    mapped to the term. Two strings are within `max_distance` edits of each other only if
+    they share such a deletion, so a word is looked up by its own deletions, instead of by
+    every string that could be made by editing it. The candidates that share a deletion are
+    then checked with `edit_distance`.
+
+    Terms are counted each time they are added, so a term added for several keys stays in
+    the index until it has been removed as many times.
+    """
+
+    def __init__(self, max_distance: int = FUZZY_MAX_EDIT_DISTANCE) -> None:
+        self.max_distance = max_distance
+        self.terms = Counter()
+        self.index = defaultdict(list)
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def __contains__(self, term: str) -> bool:
+        return term in self.terms
+
+    def add(self, term: str) -> None:
+        self.terms[term] += 1
+
+        if self.terms[term] > 1:
+            return
+
+        for deletion in deletes(term, self.max_distance):
+            self.index[deletion].append(term)
+
+    def update(self, terms) -> None:
+        for term in terms:
+            self.add(term)
+
+    def remove(self, term: str) -> None:
+        if term not in self.terms:
+            return
+
+        self.terms[term] -= 1
+
+        if self.terms[term] > 0:
+            return
+
+        del self.terms[term]
+
+        for deletion in deletes(term, self.max_distance):
+            terms = self.index[deletion]
+            terms.remove(term)
+
+            if not terms:
+                del self.index[deletion]
+
+    def search(self, word: str, max_distance: int = None) -> dict:
+        """
+        Returns every term within `max_distance` edits of a word, mapped to its distance.
+        """
+        if max_distance is None:
+            max_distance = self.max_distance
+
+        if max_distance > self.max_distance:
+            raise ValueError(
+                f"This index finds terms up to {self.max_distance} edits away."
+            )
+
+        results = {}
+
+        for deletion in deletes(word, max_distance):
+            for term in self.index.get(deletion, ()):
+                if term not in results:
+                    distance = edit_distance(word, term, max_distance)
+
+                    if distance <= max_distance:
+                        results[term] = distance
+
+        return results
+
+
+def kgrams(text: str, length: int = KGRAM_LENGTH) -> set:
+    """
+    Returns every substring of `length` characters in a string.
+    """
+    return {text[i : i + length] for i in range(len(text) - length + 1)}
+
+
+def wildcard_regex(pattern: str) -> re.Pattern:
+    """
+    Returns a regular expression that matches the same terms as a wildcard pattern. `*`
+    matches any number of characters, and `?` matches exactly one character.
+    """
+    return re.compile(
+        "".join(
+            (
+                ".*"
+                if character == "*"
+                else "." if character == "?" else re.escape(character)
+            )
+            for character in pattern
+        ),
+        re.DOTALL,
+    )
+
+
+class KGramIndex:
+    """
+    A k-gram index that finds every term that matches a wildcard pattern, such as "tol*te"
+    or "t?lerate", or that contains a substring.
+
+    Every term is mapped from each of its k-grams. The k-grams of the parts of a pattern
+    between its wildcards must all be in a matching term, so the terms that contain every
+    one of those k-grams are found by intersecting their posting lists. The k-grams of a
+    term can appear in a different order from the pattern, so each candidate is then checked
+    against the pattern. Substrings are looked up in the same way, without the boundaries.
+
+    Term ids are not reused, so the term of a removed id is None.
+    """
+
+    def __init__(self, length: int = KGRAM_LENGTH) -> None:
+        self.length = length
+        self.terms = []
+        self.term_ids = {}
+        # the ids of the terms that contain each k-gram, in increasing order
+        self.index = defaultdict(doc_id_array)
+
+    def __len__(self) -> int:
+        return len(self.term_ids)
+
+    def __contains__(self, term: str) -> bool:
+        return term in self.term_ids
+
+    def add(self, term: str) -> None:
+        if term in self.term_ids:
+            return
+
+        term_id = len(self.terms)
+
+        self.terms.append(term)
+        self.term_ids[term] = term_id
+
+        for kgram in kgrams(KGRAM_BOUNDARY + term + KGRAM_BOUNDARY, self.length):
+            self.index[kgram].append(term_id)
+
+    def update(self, terms) -> None:
+        for term in terms:
+            self.add(term)
+
+    def remove(self, term: str) -> None:
+        term_id = self.term_ids.pop(term, None)
+
+        if term_id is None:
+            return
+
+        self.terms[term_id] = None
+
+        for kgram in kgrams(KGRAM_BOUNDARY + term + KGRAM_BOUNDARY, self.length):
+            term_ids = self.index[kgram]
+
+            remove_doc_id(term_ids, term_id)
+
+            if not term_ids:
+                del self.index[kgram]
+
+    def _candidates(self, required_kgrams: set):
+        """
+        Returns the terms that contain every k-gram in a set, or every term if the set is
+        empty.
+        """
+        if not required_kgrams:
+            return [term for term in self.terms if term is not None]
+
+        postings = [self.index.get(kgram) for kgram in required_kgrams]
+
+        if any(posting is None for posting in postings):
+            return []
+
+        return [self.terms[i] for i in intersect(*postings).tolist()]
+
+    def search(self, pattern: str) -> list:
+        """
+        Returns every term that matches a wildcard pattern, in the order they were added.
+        """
+        regex = wildcard_regex(pattern)
+
+        pattern_kgrams = set()
+
+        for part in re.split(r"[*?]", KGRAM_BOUNDARY + pattern + KGRAM_BOUNDARY):
+            pattern_kgrams |= kgrams(part, self.length)
+
+        # patterns such as "*" or "t*" are too short to have a k-gram, so every term is checked
+        return [
+            term for term in self._candidates(pattern_kgrams) if regex.fullmatch(term)
+        ]
+
+    def containing(self, substring: str) -> list:
+        """
+        Returns every term that contains a substring, in the order they were added.
+        """
+        return [
+            term
+            for term in self._candidates(kgrams(substring, self.length))
+            if substring in term
+        ]
@@ -136,3 +136,188 @@ def test_search(
             response = large_index.search(query)
 
             assert float(response["query_time"]) < 0.06
+
+
+@pytest.fixture
+def create_aggregation_index():
+    with open("tests/fixtures/documents_with_categorical_and_numeric_values.json") as f:
+        documents = json.load(f)
+
+    index = JameSQL()
+
+    for document, published in zip(
+        documents, ["2023-12-31T23:00:00", "2024-01-15T12:00:00", "2024-03-01T00:00:00"]
+    ):
+        document["published"] = published
+        index.add(document)
+
+    index.create_gsi("title", strategy=GSI_INDEX_STRATEGIES.CONTAINS)
+    index.create_gsi("lyric", strategy=GSI_INDEX_STRATEGIES.CONTAINS)
+    index.create_gsi("listens", strategy=GSI_INDEX_STRATEGIES.NUMERIC)
+    index.create_gsi("category", strategy=GSI_INDEX_STRATEGIES.FLAT)
+    index.create_gsi("published", strategy=GSI_INDEX_STRATEGIES.DATE)
+
+    return index
+
+
+@pytest.mark.parametrize(
+    "query, aggregation, result",
+    [
+        (
+            "*",
+            {"terms": {"field": "category"}},
+            {
+                "buckets": [
+                    {"key": "pop", "doc_count": 2},
+                    {"key": "acoustic", "doc_count": 2},
+                ]
+            },
+        ),
+        (
+            {"lyric": {"contains": "sky"}},
+            {"terms": {"field": "category", "size": 1}},
+            {"buckets": [{"key": "pop", "doc_count": 2}]},
+        ),
+        (
+            {"lyric": {"contains": "kiss"}},
+            {"cardinality": {"field": "category"}},
+            {"value": 1},
+        ),
+        (
+            "*",
+            {"stats": {"field": "listens"}},
+            {"count": 3, "min": 100.0, "max": 300.0, "avg": 200.0, "sum": 600.0},
+        ),
+        (
+            {"lyric": {"contains": "sky"}},
+            {"avg": {"field": "listens"}},
+            {"value": 150.0},
+        ),
+        (
+            {"lyric": {"contains": "missing"}},
+            {"max": {"field": "listens"}},
+            {"value": None},
+        ),
+        (
+            "*",
+            {"histogram": {"field": "listens", "interval": 150}},
+            {
+                "buckets": [
+                    {"key": 0.0, "doc_count": 1},
+                    {"key": 150.0, "doc_count": 1},
+                    {"key": 300.0, "doc_count": 1},
+                ]
+            },
+        ),
+        (
+            "*",
+            {"range": {"field": "listens", "ranges": [{"to": 200}, {"from": 200}]}},
+            {"buckets": [{"to": 200, "doc_count": 1}, {"from": 200, "doc_count": 2}]},
+        ),
+        (
+            "*",
+            {"percentiles": {"field": "listens", "percents": [50, 75]}},
+            {"values": {"50.0": 200.0, "75.0": 250.0}},
+        ),
+        (
+            "*",
+            {"date_histogram": {"field": "published", "interval": "month"}},
+            {
+                "buckets": [
+                    {"key": "2023-12-01", "doc_count": 1},
+                    {"key": "2024-01-01", "doc_count": 1},
+                    {"key": "2024-03-01", "doc_count": 1},
+                ]
+            },
+        ),
+        (
+            "*",
+            {"date_histogram": {"field": "published", "interval": "week"}},
+            {
+                "buckets": [
+                    {"key": "2023-12-25", "doc_count": 1},
+                    {"key": "2024-01-15", "doc_count": 1},
+                    {"key": "2024-02-26", "doc_count": 1},
+                ]
+            },
+        ),
+        (
+            "*",
+            {"date_histogram": {"field": "published", "interval": "year"}},
+            {
+                "buckets": [
+                    {"key": "2023-01-01", "doc_count": 1},
+                    {"key": "2024-01-01", "doc_count": 2},
+                ]
+            },
+        ),
+        (
+            "*",
+            {
+                "range": {
+                    "field": "published",
+                    "ranges": [{"from": "2024-01-01", "to": "2024-02-01"}],
+                }
+            },
+            {"buckets": [{"from": "2024-01-01", "to": "2024-02-01", "doc_count": 1}]},
+        ),
+        (
+            "*",
+            {"min": {"field": "published"}},
+            {"value": "2023-12-31T23:00:00"},
+        ),
+    ],
+)
+def test_aggregations(create_aggregation_index, query, aggregation, result):
+    index = create_aggregation_index
+
+    response = index.search(
+        {"query": query, "limit": 1, "aggregations": {"result": aggregation}}
+    )
+
+    # aggregations are computed over every match, not only the returned documents
+    assert len(response["documents"]) <= 1
+    assert response["aggregations"] == {"result": result}
+
+
+@pytest.mark.parametrize(
+    "aggregation",
+    [
+        {"terms": {"field": "lyric"}},
+        {"stats": {"field": "category"}},
+        {"sum": {"field": "published"}},
+        {"histogram": {"field": "listens", "interval": 0}},
+        {"date_histogram": {"field": "published", "interval": "fortnight"}},
+        {"median": {"field": "listens"}},
+        {"stats": {"field": "missing"}},
+    ],
+)
+def test_invalid_aggregations(create_aggregation_index, aggregation):
+    index = create_aggregation_index
+
+    response = index.search({"query": "*", "aggregations": {"result": aggregation}})
+
+    assert "error" in response
+    assert response["documents"] == []
+
+
+def test_aggregations_are_updated_on_writes(create_aggregation_index):
+    index = create_aggregation_index
+
+    # no documents are returned, so the response only depends on the aggregated field
+    query = {
+        "query": {"category": {"equals": "pop"}},
+        "limit": 0,
+        "aggregations": {"listens": {"sum": {"field": "listens"}}},
+    }
+
+    assert index.search(query.copy())["aggregations"]["listens"] == {"value": 300.0}
+
+    document = index.search({"query": {"title": {"contains": "tolerate"}}})[
+        "documents"
+    ][0]
+    del document["_score"]
+    document["listens"] = 150
+    index.update(document["uuid"], document)
+
+    assert index.search(query.copy())["aggregations"]["listens"] == {"value": 350.0}
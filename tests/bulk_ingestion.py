@@ -0,0 +1,95 @@
+import json
+import os
+
+import pytest
+
+from jamesql import JameSQL
+from jamesql.index import GSI_INDEX_STRATEGIES
+
+
+@pytest.fixture
+def documents():
+    with open("tests/fixtures/documents_with_categorical_and_numeric_values.json") as f:
+        return json.load(f)
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, 1000])
+def test_add_many(documents, batch_size):
+    index = JameSQL()
+
+    added = index.add_many((document for document in documents), batch_size=batch_size)
+
+    assert added == len(documents)
+    assert len(index) == len(documents)
+    assert all(document.get("uuid") for document in index.global_index.values())
+    assert index.gsis["listens"]["strategy"] == GSI_INDEX_STRATEGIES.NUMERIC.name
+    assert index.gsis["category"]["strategy"] == GSI_INDEX_STRATEGIES.FLAT.name
+
+
+@pytest.mark.parametrize(
+    "query, number_of_documents_expected",
+    [
+        ({"query": {"lyric": {"contains": "sky"}}, "limit": 10}, 2),
+        ({"query": {"title": {"contains": "tolerate"}}, "limit": 10}, 1),
+        ({"query": {"category": {"equals": "acoustic"}}, "limit": 10}, 2),
+    ],
+)
+def test_add_many_into_existing_gsis(documents, query, number_of_documents_expected):
+    index = JameSQL()
+
+    index.add_many(documents[:1])
+
+    index.create_gsi("title", strategy=GSI_INDEX_STRATEGIES.CONTAINS)
+    index.create_gsi("lyric", strategy=GSI_INDEX_STRATEGIES.CONTAINS)
+    index.create_gsi("category", strategy=GSI_INDEX_STRATEGIES.FLAT)
+
+    index.add_many(documents[1:], batch_size=1)
+
+    response = index.search(query)
+
+    assert len(response["documents"]) == number_of_documents_expected
+
+
+def test_add_many_writes_index_data_file(documents, tmp_path, monkeypatch):
+    monkeypatch.setattr("jamesql.index.JOURNAL_FILE", str(tmp_path / "journal.jamesql"))
+    monkeypatch.setattr(
+        "jamesql.index.INDEX_DATA_FILE", str(tmp_path / "index.jamesql")
+    )
+
+    index = JameSQL()
+
+    index.add_many(documents, batch_size=2, write_to_journal=True)
+
+    with open(tmp_path / "index.jamesql") as f:
+        records = [json.loads(line) for line in f]
+
+    assert [record["title"] for record in records] == [
+        document["title"] for document in documents
+    ]
+    assert not os.path.exists(tmp_path / "journal.jamesql")
+
+
+@pytest.mark.parametrize("create_gsi", [True, False])
+def test_add_many_with_repeated_uuid(create_gsi):
+    index = JameSQL()
+
+    if create_gsi:
+        index.add({"uuid": "y", "lyric": "the sea"})
+        index.create_gsi("lyric", strategy=GSI_INDEX_STRATEGIES.CONTAINS)
+
+    index.add_many(
+        [{"uuid": "x", "lyric": "sky blue"}, {"uuid": "x", "lyric": "sea green"}]
+    )
+
+    # the second copy replaces the first, as it would with two calls to add()
+    assert index.search({"query": {"lyric": {"contains": "sky"}}})["documents"] == []
+    assert [
+        document["lyric"]
+        for document in index.search({"query": {"lyric": {"contains": "green"}}})[
+            "documents"
+        ]
+    ] == ["sea green"]
+    assert index.document_frequencies["lyric"]["sky"] == 0
+    assert index.document_frequencies["lyric"]["blue"] == 0
+    assert index.document_frequencies["lyric"]["sea"] == (2 if create_gsi else 1)
+    assert index.field_document_counts["lyric"] == (2 if create_gsi else 1)
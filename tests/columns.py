@@ -0,0 +1,189 @@
+import datetime
+import json
+
+import numpy
+import pytest
+
+from jamesql import JameSQL
+from jamesql.columns import Column, date_column_value
+from jamesql.index import GSI_INDEX_STRATEGIES
+
+
+@pytest.fixture
+def create_indices():
+    with open("tests/fixtures/documents_with_varied_data_types.json") as f:
+        documents = json.load(f)
+
+    index = JameSQL()
+
+    for document in documents:
+        index.add(document)
+
+    index.create_gsi("title", strategy=GSI_INDEX_STRATEGIES.CONTAINS)
+    index.create_gsi("listens", strategy=GSI_INDEX_STRATEGIES.NUMERIC)
+    index.create_gsi("rating", strategy=GSI_INDEX_STRATEGIES.NUMERIC)
+    index.create_gsi("record_last_updated", strategy=GSI_INDEX_STRATEGIES.DATE)
+
+    return index
+
+
+@pytest.mark.parametrize(
+    "value, timestamp",
+    [
+        ("1970-01-02", 86400),
+        ("2024-01-01T00:00:30", 1704067230),
+        (datetime.datetime(2024, 1, 1, 0, 0, 30), 1704067230),
+        (datetime.date(2024, 1, 1), 1704067200),
+        ("yesterday", None),
+        (20240101, None),
+        (None, None),
+    ],
+)
+def test_date_column_value(value, timestamp):
+    assert date_column_value(value) == timestamp
+
+
+def test_column():
+    column = Column()
+
+    for doc_id, value in enumerate([3, 1.5, 3, "3", 2, [1]]):
+        column.set(doc_id, value)
+
+    # strings and lists are not stored
+    assert len(column) == 4
+    assert column.take(numpy.array([0, 1, 4])).tolist() == [3.0, 1.5, 2.0]
+    assert column.take(numpy.array([0, 3])) is None
+    assert column.take(numpy.array([0, 2000])) is None
+
+    doc_ids = numpy.array([0, 1, 2, 4])
+
+    # documents with the same value stay in doc id order in both directions
+    assert column.argsort(doc_ids).tolist() == [1, 4, 0, 2]
+    assert column.argsort(doc_ids, reverse=True).tolist() == [0, 2, 4, 1]
+
+    column.remove(0)
+
+    assert column.argsort(doc_ids) is None
+
+
+def test_columns_are_kept_up_to_date(create_indices):
+    index = create_indices
+
+    assert set(index.columns) == {"listens", "rating", "record_last_updated"}
+    assert index.columns["record_last_updated"].dates
+
+    document = index.add(
+        {"title": "willow", "listens": 400, "record_last_updated": "2024-02-01"}
+    )
+    doc_id = index.uuids_to_position_in_global_index[document["uuid"]]
+
+    assert index.columns["listens"].take(numpy.array([doc_id])).tolist() == [400]
+
+    index.update(document["uuid"], {"title": "willow", "listens": 500})
+
+    # updated documents keep their doc id
+    assert index.uuids_to_position_in_global_index[document["uuid"]] == doc_id
+    assert index.columns["listens"].take(numpy.array([doc_id])).tolist() == [500]
+    assert index.columns["record_last_updated"].take(numpy.array([doc_id])) is None
+
+    index.create_gsi("listens", strategy=GSI_INDEX_STRATEGIES.FLAT)
+
+    assert "listens" not in index.columns
+
+
+@pytest.mark.parametrize(
+    "sort_by, sort_order, skip",
+    [
+        ("listens", "asc", 0),
+        ("listens", "desc", 0),
+        ("rating", "desc", 0),
+        ("rating", "asc", 1),
+        ("record_last_updated", "desc", 0),
+        ("record_last_updated", "asc", 2),
+    ],
+)
+def test_sort_by_column(create_indices, monkeypatch, sort_by, sort_order, skip):
+    index = create_indices
+
+    for i in range(10):
+        index.add({"title": f"song {i}", "listens": i, "rating": 1.0})
+
+    index.add({"title": "song", "listens": 5, "rating": 4.7})
+
+    # the results are not a large enough fraction of the index to be read from the GSI
+    for i in range(40):
+        index.add({"title": f"interlude {i}"})
+
+    sorted_by_column = []
+    sort_by_column = index._sort_by_column
+
+    def spy(*args):
+        sorted_by_column.append(args[1])
+
+        return sort_by_column(*args)
+
+    monkeypatch.setattr(index, "_sort_by_column", spy)
+
+    documents = [
+        document for document in index.global_index.values() if sort_by in document
+    ]
+
+    expected = sorted(
+        documents, key=lambda document: document[sort_by], reverse=sort_order != "asc"
+    )
+    query = {"title": {"contains": "song"}}
+
+    if sort_by == "record_last_updated":
+        query = {"record_last_updated": {"range": ["2000-01-01", "2100-01-01"]}}
+    else:
+        expected = [
+            document for document in expected if "song" in document["title"].lower()
+        ]
+
+    response = index.search(
+        {
+            "query": query,
+            "sort_by": sort_by,
+            "sort_order": sort_order,
+            "skip": skip,
+            "limit": 3,
+        }
+    )
+
+    assert [document["uuid"] for document in response["documents"]] == [
+        document["uuid"] for document in expected[skip : skip + 3]
+    ]
+    assert response["total_results"] == len(expected) - skip
+    assert sorted_by_column == [sort_by]
+
+
+def test_sort_by_column_with_missing_values(create_indices):
+    index = create_indices
+
+    index.add({"title": "willow"})
+
+    # documents without a value cannot be sorted, as before
+    with pytest.raises(KeyError):
+        index.search({"query": "*", "sort_by": "listens"})
+
+
+def test_query_score_reads_dates_from_column(create_indices):
+    index = create_indices
+
+    response = index.search(
+        {
+            "query": "*",
+            "query_score": "(listens * decay record_last_updated)",
+            "limit": 1,
+        }
+    )
+    document = response["documents"][0]
+
+    days_since_update = (
+        datetime.datetime.now()
+        - datetime.datetime.strptime(document["record_last_updated"], "%Y-%m-%d")
+    ).days
+
+    assert document["_score"] == pytest.approx(
+        document["listens"] * 1.1 ** (days_since_update / 30)
+    )
@@ -0,0 +1,181 @@
+import json
+import os
+import random
+import time
+
+import pytest
+
+from jamesql import JameSQL
+from jamesql.index import GSI_INDEX_STRATEGIES
+from jamesql.postings import VarintPostingList, decode_varints, encode_varints
+
+
+@pytest.fixture
+def documents():
+    with open("tests/fixtures/documents.json") as f:
+        return json.load(f)
+
+
+def create_index(documents, compression=None):
+    index = JameSQL()
+
+    for document in documents:
+        index.add(document.copy())
+
+    index.create_gsi(
+        "lyric", strategy=GSI_INDEX_STRATEGIES.CONTAINS, compression=compression
+    )
+    index.create_gsi(
+        "title", strategy=GSI_INDEX_STRATEGIES.CONTAINS, compression=compression
+    )
+
+    return index
+
+
+def test_varints():
+    values = [0, 1, 127, 128, 16383, 16384, 2**32 - 1]
+
+    assert decode_varints(encode_varints(values)).tolist() == values
+    assert decode_varints(encode_varints(values), limit=2).tolist() == values[:2]
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        {"query": {"lyric": {"contains": "sky"}}, "limit": 10},
+        {"query": {"lyric": {"contains": "my mural", "strict": True}}, "limit": 10},
+        {"query": {"title": {"equals": "tolerate it"}}, "limit": 10},
+        {
+            "query": {
+                "and": [
+                    {"lyric": {"contains": "my"}},
+                    {"title": {"contains": "tolerate"}},
+                ]
+            },
+            "limit": 10,
+        },
+    ],
+)
+def test_compressed_search(documents, query):
+    index = create_index(documents)
+    compressed_index = create_index(documents, compression="varint")
+
+    assert isinstance(compressed_index.gsis["lyric"]["gsi"]["sky"], VarintPostingList)
+
+    expected = index.search(query.copy())["documents"]
+    response = compressed_index.search(query.copy())["documents"]
+
+    assert [document["title"] for document in response] == [
+        document["title"] for document in expected
+    ]
+    assert [document["_score"] for document in response] == [
+        document["_score"] for document in expected
+    ]
+
+
+def test_compressed_writes(documents):
+    index = create_index(documents, compression="varint")
+
+    index.add({"title": "the 1", "lyric": "the sky is blue"})
+
+    response = index.search({"query": {"lyric": {"contains": "sky"}}, "limit": 10})
+
+    assert len(response["documents"]) == 3
+
+    index.remove(response["documents"][0]["uuid"])
+
+    response = index.search({"query": {"lyric": {"contains": "sky"}}, "limit": 10})
+
+    assert len(response["documents"]) == 2
+
+
+def test_compressed_code_search():
+    documents = []
+
+    for file in sorted(os.listdir("tests/fixtures/code")):
+        with open(os.path.join("tests/fixtures/code", file)) as f:
+            documents.append({"file_name": file, "code": f.read()})
+
+    results = []
+
+    for compression in [None, "varint"]:
+        index = JameSQL()
+
+        index.create_gsi("file_name", strategy=GSI_INDEX_STRATEGIES.PREFIX)
+        index.create_gsi(
+            "code", strategy=GSI_INDEX_STRATEGIES.TRIGRAM_CODE, compression=compression
+        )
+
+        for document in documents:
+            index.add(document.copy())
+
+        response = index.search({"query": {"code": {"contains": "def "}}, "limit": 10})
+
+        results.append(
+            sorted(document["file_name"] for document in response["documents"])
+        )
+
+    assert results[0] == results[1]
+    assert len(results[0]) == 3
+
+
+def test_invalid_compression(documents):
+    index = create_index(documents)
+
+    with pytest.raises(ValueError):
+        index.create_gsi(
+            "lyric", strategy=GSI_INDEX_STRATEGIES.CONTAINS, compression="zip"
+        )
+
+    with pytest.raises(ValueError):
+        index.create_gsi(
+            "title", strategy=GSI_INDEX_STRATEGIES.FLAT, compression="varint"
+        )
+
+
+def test_compression_benchmark(documents, request):
+    if not request.config.getoption("--benchmark"):
+        pytest.skip("run with --benchmark")
+
+    random.seed(0)
+
+    vocabulary = list(
+        {word.lower() for document in documents for word in document["lyric"].split()}
+    )
+    large_documents = [
+        {"title": str(i), "lyric": " ".join(random.choices(vocabulary, k=50))}
+        for i in range(100000)
+    ]
+
+    def measure(compression):
+        """
+        Returns the bytes per posting of the lyric GSI, and the mean query latency, of an
+        index built with `compression`.
+        """
+        index = JameSQL()
+        index.add_many(large_documents)
+        index.create_gsi(
+            "lyric", strategy=GSI_INDEX_STRATEGIES.CONTAINS, compression=compression
+        )
+
+        gsi = index.gsis["lyric"]["gsi"]
+        postings = sum(len(entry) for entry in gsi.values())
+        bytes_per_posting = sum(entry.nbytes() for entry in gsi.values()) / postings
+
+        start_time = time.time()
+
+        for word in vocabulary[:20]:
+            index.search({"query": {"lyric": {"contains": word}}, "limit": 10})
+            index.search(
+                {"query": {"lyric": {"contains": word + " sky", "strict": True}}}
+            )
+
+        return bytes_per_posting, (time.time() - start_time) / 40
+
+    uncompressed_bytes_per_posting, uncompressed_latency = measure(None)
+    compressed_bytes_per_posting, compressed_latency = measure("varint")
+
+    # compressed postings use several times less memory, in exchange for slower queries,
+    # which decode the blocks that can contain a match
+    assert compressed_bytes_per_posting * 3 < uncompressed_bytes_per_posting
+    assert uncompressed_latency < compressed_latency < uncompressed_latency * 10
@@ -40,3 +40,39 @@ def test_threading():
 
     assert len(index.global_index) == 301
     assert index.global_index["xyz"]["title"] == "teal"
+
+
+def test_concurrent_searches_do_not_share_scores():
+    with open("tests/fixtures/documents_with_categorical_and_numeric_values.json") as f:
+        documents = json.load(f)
+
+    index = JameSQL()
+
+    for document in documents:
+        index.add(document.copy())
+
+    stored_documents = [document.copy() for document in index.global_index.values()]
+    errors = []
+
+    def query(i):
+        # every thread scores documents with a different script
+        response = index.search(
+            {"query": "*", "query_score": f"(listens * {i + 1})", "limit": 10}
+        )
+
+        scores = sorted(document["_score"] for document in response["documents"])
+
+        if scores != [listens * (i + 1) for listens in [100, 200, 300]]:
+            errors.append(scores)
+
+    threads = [threading.Thread(target=query, args=(i,)) for i in range(50)]
+
+    for t in threads:
+        t.start()
+
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    # search results are copies, so stored documents never gain a "_score" key
+    assert list(index.global_index.values()) == stored_documents
@@ -0,0 +1,126 @@
+import json
+import math
+
+import pytest
+
+from jamesql import JameSQL
+from jamesql.index import GSI_INDEX_STRATEGIES
+
+
+@pytest.fixture
+def documents():
+    with open("tests/fixtures/documents.json") as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def index_with_gsis():
+    index = JameSQL()
+
+    index.create_gsi("title", strategy=GSI_INDEX_STRATEGIES.CONTAINS)
+    index.create_gsi("lyric", strategy=GSI_INDEX_STRATEGIES.CONTAINS)
+
+    return index
+
+
+def test_statistics_are_updated_on_add(index_with_gsis, documents):
+    index = index_with_gsis
+
+    for document in documents:
+        index.add(document)
+
+    statistics = (
+        dict(index.document_frequencies["lyric"]),
+        index.field_document_counts["lyric"],
+        index.field_lengths["lyric"],
+    )
+
+    # rebuilding the GSI from scratch should produce the same statistics
+    index.create_gsi("lyric", strategy=GSI_INDEX_STRATEGIES.CONTAINS)
+
+    assert statistics == (
+        dict(index.document_frequencies["lyric"]),
+        index.field_document_counts["lyric"],
+        index.field_lengths["lyric"],
+    )
+    assert index.document_frequencies["lyric"]["sky"] == 2
+    assert index.field_document_counts["lyric"] == 3
+
+
+def test_scores_are_computed_from_statistics(index_with_gsis, documents):
+    index = index_with_gsis
+
+    for document in documents:
+        index.add(document)
+
+    scores = index._term_scores("lyric", "my")
+
+    # "my" appears three times in one of three documents
+    expected_idf = math.log((3 - 1 + 0.5) / (1 + 0.5) + 1)
+
+    assert list(scores.values()) == [3 * expected_idf]
+
+    index.add({"title": "the 1", "lyric": "my my"})
+
+    # adding a document changes IDF without rebuilding the GSI
+    expected_idf = math.log((4 - 2 + 0.5) / (2 + 0.5) + 1)
+
+    assert sorted(index._term_scores("lyric", "my").values()) == [
+        2 * expected_idf,
+        3 * expected_idf,
+    ]
+
+
+def test_statistics_are_updated_on_remove(index_with_gsis, documents):
+    index = index_with_gsis
+
+    for document in documents:
+        index.add(document)
+
+    response = index.search({"query": {"lyric": {"contains": "kiss"}}, "limit": 10})
+
+    index.remove(response["documents"][0]["uuid"])
+
+    assert index.field_document_counts["lyric"] == 2
+    assert "kiss" not in index.document_frequencies["lyric"]
+    assert index.gsis["lyric"]["gsi"].get("kiss") is None
+
+    response = index.search({"query": {"lyric": {"contains": "kiss"}}, "limit": 10})
+
+    assert len(response["documents"]) == 0
+
+
+def test_statistics_are_updated_on_update(index_with_gsis, documents):
+    index = index_with_gsis
+
+    for document in documents:
+        index.add(document)
+
+    response = index.search({"query": {"lyric": {"contains": "kiss"}}, "limit": 10})
+    uuid = response["documents"][0]["uuid"]
+
+    index.update(uuid, {"title": "The Bolter", "lyric": "Started with a hug"})
+
+    assert index.document_frequencies["lyric"]["hug"] == 1
+    assert index.field_document_counts["lyric"] == 3
+
+    response = index.search({"query": {"lyric": {"contains": "kiss"}}, "limit": 10})
+
+    assert len(response["documents"]) == 0
+
+    response = index.search({"query": {"lyric": {"contains": "hug"}}, "limit": 10})
+
+    assert [document["uuid"] for document in response["documents"]] == [uuid]
+
+
+def test_document_lengths_match_field_lengths(index_with_gsis):
+    index = index_with_gsis
+
+    document = {"title": "the  1", "lyric": "kiss me\nunder  the light "}
+
+    index.add(document)
+
+    # document lengths count the same words as the reverse index
+    assert index.doc_lengths[document["uuid"]] == {"title": 2, "lyric": 5}
+    assert index.field_lengths["lyric"] == 5
+    assert index.field_min_lengths["lyric"] == 5
@@ -0,0 +1,89 @@
+import json
+
+import pytest
+
+from jamesql import JameSQL
+from jamesql.index import GSI_INDEX_STRATEGIES
+
+
+@pytest.fixture
+def create_indices(tmp_path):
+    with open("tests/fixtures/documents_with_categorical_and_numeric_values.json") as f:
+        documents = json.load(f)
+
+    index = JameSQL()
+
+    for document in documents:
+        index.add(document)
+
+    index.create_gsi("title", strategy=GSI_INDEX_STRATEGIES.CONTAINS)
+    index.create_gsi("lyric", strategy=GSI_INDEX_STRATEGIES.CONTAINS)
+    index.create_gsi("listens", strategy=GSI_INDEX_STRATEGIES.NUMERIC)
+    index.create_gsi("category", strategy=GSI_INDEX_STRATEGIES.FLAT)
+
+    path = str(tmp_path / "segment.jamesql")
+
+    index.save_segment(path)
+
+    return index, JameSQL.open_segment(path)
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        {"query": {"lyric": {"contains": "sky"}}, "limit": 10, "fields": ["title"]},
+        {
+            "query": "*",
+            "limit": 2,
+            "sort_by": "listens",
+            "fields": ["title", "listens"],
+        },
+        {"query": "*", "limit": 10, "fields": ["not-a-field"]},
+        {
+            "query": {"category": {"equals": "pop"}},
+            "limit": 10,
+            "fields": ["title"],
+            "group_by": "category",
+        },
+    ],
+)
+def test_field_projection(create_indices, query):
+    for index in create_indices:
+        expected = index.search({**query, "fields": None})
+        response = index.search(query.copy())
+
+        assert [document["uuid"] for document in response["documents"]] == [
+            document["uuid"] for document in expected["documents"]
+        ]
+
+        for document, full_document in zip(
+            response["documents"], expected["documents"]
+        ):
+            assert document == {
+                key: value
+                for key, value in full_document.items()
+                if key in query["fields"] + ["uuid", "_score"]
+            }
+
+        if query.get("group_by"):
+            assert sorted(response["groups"].keys()) == sorted(
+                expected["groups"].keys()
+            )
+            assert all(
+                set(document.keys()) <= {"title", "uuid", "_score"}
+                for documents in response["groups"].values()
+                for document in documents
+            )
+
+
+def test_documents_are_not_modified(create_indices):
+    index, _ = create_indices
+
+    response = index.search({"query": "*", "limit": 10, "fields": ["title"]})
+
+    response["documents"][0]["title"] = "changed"
+
+    assert "changed" not in [
+        document["title"] for document in index.global_index.values()
+    ]
+    assert all("lyric" in document for document in index.global_index.values())
@@ -153,3 +153,106 @@ def test_search(
             response = large_index.search(query)
 
             assert float(response["query_time"]) < 0.06
+
+
+@pytest.fixture
+def create_grouped_index():
+    with open("tests/fixtures/documents_with_categorical_and_numeric_values.json") as f:
+        documents = json.load(f)
+
+    index = JameSQL()
+
+    for document in documents:
+        index.add(document)
+
+    for i in range(20):
+        index.add(
+            {
+                "title": f"interlude {i}",
+                "lyric": "the sky",
+                "listens": i,
+                "category": ["ambient"] if i % 2 else ["ambient", "pop"],
+            }
+        )
+
+    index.create_gsi("title", strategy=GSI_INDEX_STRATEGIES.CONTAINS)
+    index.create_gsi("lyric", strategy=GSI_INDEX_STRATEGIES.CONTAINS)
+    index.create_gsi("listens", strategy=GSI_INDEX_STRATEGIES.NUMERIC)
+    index.create_gsi("category", strategy=GSI_INDEX_STRATEGIES.FLAT)
+
+    return index
+
+
+def test_group_by_counts_every_matching_document(create_grouped_index):
+    index = create_grouped_index
+
+    response = index.search(
+        {
+            "query": {"lyric": {"contains": "sky"}},
+            "limit": 1,
+            "group_by": {"field": "category", "size": 2, "limit": 3},
+            "sort_by": "listens",
+            "sort_order": "desc",
+        }
+    )
+
+    # groups are not limited to the documents on the page
+    assert len(response["documents"]) == 1
+    assert response["group_counts"] == {"ambient": 20, "pop": 12}
+    assert list(response["groups"]) == ["ambient", "pop"]
+    assert [document["listens"] for document in response["groups"]["ambient"]] == [
+        19,
+        18,
+        17,
+    ]
+    assert [document["listens"] for document in response["groups"]["pop"]] == [
+        200,
+        100,
+        18,
+    ]
+
+
+def test_group_by_field_without_flat_gsi(create_grouped_index):
+    index = create_grouped_index
+
+    query = {
+        "query": {"lyric": {"contains": "sky"}},
+        "group_by": {"field": "category", "size": 3, "top_hits": 2},
+    }
+
+    response = index.search(query)
+
+    index.create_gsi("category", strategy=GSI_INDEX_STRATEGIES.CONTAINS)
+
+    # fields without a FLAT, NUMERIC or DATE GSI are grouped from the stored documents
+    assert index.search(query)["groups"] == response["groups"]
+    assert response["group_counts"] == {"ambient": 20, "pop": 12, "acoustic": 1}
+
+
+def test_group_by_is_invalidated(create_grouped_index):
+    index = create_grouped_index
+
+    query = {"query": {"lyric": {"contains": "kiss"}}, "group_by": "category"}
+
+    assert index.search(query)["group_counts"] == {"acoustic": 1}
+
+    index.add({"title": "willow", "lyric": "a kiss", "category": ["folk"]})
+
+    assert index.search(query)["group_counts"] == {"acoustic": 1, "folk": 1}
+
+
+@pytest.mark.parametrize(
+    "group_by",
+    [
+        {"size": 2},
+        {"field": "category", "size": -1},
+        {"field": "category", "limit": "3"},
+    ],
+)
+def test_invalid_group_by(create_grouped_index, group_by):
+    index = create_grouped_index
+
+    response = index.search({"query": "*", "group_by": group_by})
+
+    assert response["documents"] == []
+    assert "error" in response
@@ -0,0 +1,185 @@
+import json
+
+import pytest
+
+from jamesql import JameSQL
+from jamesql.index import GSI_INDEX_STRATEGIES
+from jamesql.postings import (
+    PostingList,
+    difference,
+    doc_id_array,
+    insert_doc_id,
+    intersect,
+    remove_doc_id,
+    union,
+)
+
+
+@pytest.mark.parametrize(
+    "arrays, intersection, merged",
+    [
+        ([[1, 3, 5, 7], [3, 4, 5]], [3, 5], [1, 3, 4, 5, 7]),
+        ([[1, 2, 3], [4, 5, 6]], [], [1, 2, 3, 4, 5, 6]),
+        ([[2, 4, 6, 8], [4, 8], [8, 9]], [8], [2, 4, 6, 8, 9]),
+        ([[1, 2], []], [], [1, 2]),
+    ],
+)
+def test_merges(arrays, intersection, merged):
+    arrays = [doc_id_array(array) for array in arrays]
+
+    assert intersect(*arrays).tolist() == intersection
+    assert union(*arrays).tolist() == merged
+
+
+def test_difference():
+    assert difference(doc_id_array([1, 2, 3, 4]), doc_id_array([2, 4])).tolist() == [
+        1,
+        3,
+    ]
+    assert difference(doc_id_array([1, 2]), doc_id_array([])).tolist() == [1, 2]
+
+
+def test_insert_and_remove_doc_ids():
+    doc_ids = doc_id_array()
+
+    for doc_id in [1, 5, 3, 5]:
+        insert_doc_id(doc_ids, doc_id)
+
+    assert list(doc_ids) == [1, 3, 5]
+    assert remove_doc_id(doc_ids, 3)
+    assert not remove_doc_id(doc_ids, 3)
+    assert list(doc_ids) == [1, 5]
+
+
+def test_posting_list():
+    postings = PostingList()
+
+    postings.add(1, [0, 4], 2)
+    postings.add(7, [3], 1)
+    # out of order doc ids are inserted in place
+    postings.add(4, [1, 2, 6], 3)
+
+    assert postings.doc_ids().tolist() == [1, 4, 7]
+    assert postings.positions_of(4) == [1, 2, 6]
+    assert postings.positions_of(7) == [3]
+    assert postings.count == 6
+
+    assert postings.remove(4) == 3
+    assert postings.positions_of(7) == [3]
+    assert postings.positions_of(4) == []
+    assert list(postings.items()) == [(1, [0, 4]), (7, [3])]
+    assert postings.count == 3
+
+
+def test_gsis_store_doc_ids():
+    with open("tests/fixtures/documents_with_categorical_and_numeric_values.json") as f:
+        documents = json.load(f)
+
+    index = JameSQL()
+
+    for document in documents:
+        index.add(document)
+
+    index.create_gsi("lyric", strategy=GSI_INDEX_STRATEGIES.CONTAINS)
+    index.create_gsi("category", strategy=GSI_INDEX_STRATEGIES.FLAT)
+
+    uuid = index.search({"query": {"category": {"equals": "pop"}}, "limit": 1})[
+        "documents"
+    ][0]["uuid"]
+    doc_id = index.uuids_to_position_in_global_index[uuid]
+
+    assert doc_id in index.gsis["category"]["gsi"]["pop"]
+    assert index.doc_uuids[doc_id] == uuid
+
+    index.remove(uuid)
+
+    assert index.doc_uuids[doc_id] is None
+    assert doc_id not in index.gsis["category"]["gsi"].get("pop", [])
+    assert uuid not in [
+        document["uuid"]
+        for document in index.search({"query": "*", "limit": 10})["documents"]
+    ]
+
+
+def create_index(documents):
+    index = JameSQL()
+
+    for document in documents:
+        index.add(document)
+
+    index.create_gsi("title", strategy=GSI_INDEX_STRATEGIES.PREFIX)
+    index.create_gsi(
+        "lyric", strategy=GSI_INDEX_STRATEGIES.CONTAINS, compression="varint"
+    )
+    index.create_gsi("listens", strategy=GSI_INDEX_STRATEGIES.NUMERIC)
+    index.create_gsi("category", strategy=GSI_INDEX_STRATEGIES.FLAT)
+
+    return index
+
+
+def test_updates_remove_released_doc_ids():
+    with open("tests/fixtures/documents_with_categorical_and_numeric_values.json") as f:
+        documents = json.load(f)
+
+    index = create_index(documents)
+    uuid = documents[0]["uuid"]
+
+    for listens in range(5):
+        index.update(uuid, {**documents[0], "listens": listens})
+
+    prefix_postings = [list(doc_ids) for doc_ids in index.gsis["title"]["gsi"].values()]
+
+    assert sum(len(doc_ids) for doc_ids in prefix_postings) == len(documents)
+    assert (
+        index.uuids_to_position_in_global_index[uuid]
+        in index.gsis["title"]["gsi"]["tolerate it"]
+    )
+
+    index.update(uuid, {**documents[0], "title": "willow"})
+
+    assert "tolerate it" not in index.gsis["title"]["gsi"]
+
+
+def test_compact():
+    with open("tests/fixtures/documents_with_categorical_and_numeric_values.json") as f:
+        documents = json.load(f)
+
+    index = create_index(documents)
+
+    index.update(documents[0]["uuid"], {**documents[0], "listens": 400})
+    index.remove(documents[1]["uuid"])
+
+    queries = [
+        {"query": {"title": {"starts_with": "tol"}}},
+        {"query": {"lyric": {"contains": "my sky", "strict": True}}},
+        {"query": {"listens": {"greater_than": 200}}},
+        {"query": {"category": {"equals": "acoustic"}}},
+        {"query": "*", "sort_by": "listens"},
+    ]
+    expected = [index.search(query.copy())["documents"] for query in queries]
+
+    # the updated document kept its doc id, so only the removed document's id is reclaimed
+    assert index.compact() == 1
+    assert index.doc_uuids == [documents[0]["uuid"], documents[2]["uuid"]]
+    assert len(index.columns["listens"].values) == len(documents) - 1
+    assert index.compact() == 0
+
+    assert [index.search(query.copy())["documents"] for query in queries] == expected
+
+    # documents added after compaction get the next doc id
+    index.add({"title": "willow", "lyric": "the more that you say", "listens": 500})
+
+    assert index.uuids_to_position_in_global_index[index.doc_uuids[-1]] == 2
+
+
+def test_updates_remove_code_lines():
+    index = JameSQL()
+
+    index.create_gsi("file_name", strategy=GSI_INDEX_STRATEGIES.PREFIX)
+    index.create_gsi("code", strategy=GSI_INDEX_STRATEGIES.TRIGRAM_CODE)
+
+    document = index.add({"file_name": "app.py", "code": "import os\nimport sys"})
+    index.update(document["uuid"], {"file_name": "app.py", "code": "import os"})
+
+    assert index.gsis["code"]["id2line"] == {"app.py:0": "import os"}
+    assert index.gsis["code"]["doc_lengths"] == {"app.py": 1}
@@ -0,0 +1,209 @@
+import json
+import random
+import time
+
+import pytest
+
+from jamesql import JameSQL
+from jamesql.index import GSI_INDEX_STRATEGIES
+from jamesql.postings import POSITION_BITS, PostingList, VarintPostingList
+from jamesql.proximity import close_to, key_doc_ids, near, phrase
+
+
+@pytest.fixture
+def create_indices():
+    with open("tests/fixtures/documents.json") as f:
+        documents = json.load(f)
+
+    index = JameSQL()
+
+    for document in documents:
+        index.add(document)
+
+    index.create_gsi("title", strategy=GSI_INDEX_STRATEGIES.FLAT)
+    index.create_gsi("lyric", strategy=GSI_INDEX_STRATEGIES.CONTAINS)
+
+    return index
+
+
+def expected_matches(documents: dict, words: list, query_type: str, distance: int):
+    """
+    Returns the position keys that a query matches, found by checking every combination of
+    the positions of its words.
+    """
+    keys = set()
+
+    for doc_id, text in documents.items():
+        positions = [
+            [i for i, word in enumerate(text) if word == query_word]
+            for query_word in words
+        ]
+
+        def combinations(i, chosen):
+            if i == len(positions):
+                yield chosen
+                return
+
+            for position in positions[i]:
+                yield from combinations(i + 1, chosen + [position])
+
+        for chosen in combinations(0, []):
+            gaps = [second - first for first, second in zip(chosen, chosen[1:])]
+
+            if query_type == "phrase" and all(gap > 0 for gap in gaps):
+                if chosen[-1] - chosen[0] - (len(chosen) - 1) <= distance:
+                    keys.add((doc_id << POSITION_BITS) | chosen[0])
+            elif query_type == "near" and max(chosen) - min(chosen) <= distance:
+                keys.add((doc_id << POSITION_BITS) | min(chosen))
+            elif query_type == "close_to" and all(0 < gap <= distance for gap in gaps):
+                keys.add((doc_id << POSITION_BITS) | chosen[-1])
+
+    return sorted(keys)
+
+
+@pytest.mark.parametrize("posting_list", [PostingList, VarintPostingList])
+@pytest.mark.parametrize(
+    "query_type, method", [("phrase", phrase), ("near", near), ("close_to", close_to)]
+)
+def test_proximity_methods(posting_list, query_type, method):
+    random.seed(0)
+
+    documents = {
+        doc_id: random.choices("abcd", k=random.randint(1, 30))
+        for doc_id in random.sample(range(1000), 300)
+    }
+
+    index = {}
+
+    for doc_id in sorted(documents):
+        positions = {}
+
+        for position, word in enumerate(documents[doc_id]):
+            positions.setdefault(word, []).append(position)
+
+        for word, word_positions in positions.items():
+            index.setdefault(word, posting_list()).add(
+                doc_id, word_positions, len(word_positions)
+            )
+
+    for _ in range(100):
+        words = random.choices("abcd", k=random.randint(1, 3))
+        distance = random.randint(0, 4)
+
+        doc_ids = sorted(documents)
+        matches = method(
+            [index[word].position_keys(doc_ids) for word in words], distance
+        )
+
+        assert matches.tolist() == expected_matches(
+            documents, words, query_type, distance
+        )
+        assert key_doc_ids(matches).tolist() == sorted(
+            {key >> POSITION_BITS for key in matches.tolist()}
+        )
+
+
+@pytest.mark.parametrize(
+    "query, titles",
+    [
+        ({"lyric": {"phrase": "my mural"}}, ["tolerate it"]),
+        ({"lyric": {"phrase": "MY SKY"}}, ["tolerate it"]),
+        ({"lyric": {"phrase": "my the sky"}}, []),
+        ({"lyric": {"phrase": "made temple,"}}, []),
+        ({"lyric": {"phrase": "made temple,", "slop": 1}}, []),
+        ({"lyric": {"phrase": "made temple,", "slop": 2}}, ["tolerate it"]),
+        ({"lyric": {"phrase": "the sky", "slop": 3}}, ["my tears ricochet"]),
+        ({"lyric": {"near": "sky mural", "distance": 2}}, ["tolerate it"]),
+        ({"lyric": {"near": "sky mural", "distance": 1}}, []),
+        ({"lyric": {"near": "sky my"}}, ["tolerate it"]),
+        ({"lyric": {"close_to": "made temple, my", "distance": 3}}, ["tolerate it"]),
+        ({"lyric": {"close_to": "temple, made", "distance": 3}}, []),
+        (
+            {"close_to": [{"lyric": "made"}, {"lyric": "temple,"}], "distance": 7},
+            ["tolerate it"],
+        ),
+        ({"close_to": [{"lyric": "made", "distance": 2}, {"lyric": "temple,"}]}, []),
+        (
+            {
+                "and": [
+                    {"lyric": {"phrase": "at the sky"}},
+                    {"title": {"equals": "my tears ricochet"}},
+                ]
+            },
+            ["my tears ricochet"],
+        ),
+    ],
+)
+def test_proximity_queries(create_indices, query, titles):
+    index = create_indices
+
+    response = index.search({"query": query})
+
+    assert [document["title"] for document in response["documents"]] == titles
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        {"title": {"phrase": "tolerate it"}},
+        {"lyric": {"phrase": "my sky", "slop": -1}},
+        {"lyric": {"near": "my sky", "distance": "3"}},
+        {"close_to": [{"lyric": "made"}, {"title": "tolerate it"}]},
+    ],
+)
+def test_invalid_proximity_queries(create_indices, query):
+    index = create_indices
+
+    response = index.search({"query": query})
+
+    assert response["documents"] == []
+    assert "error" in response
+
+
+def test_phrase_queries_on_segments(create_indices, tmp_path):
+    index = create_indices
+
+    index.save_segment(str(tmp_path / "segment.jamesql"))
+
+    segment_index = JameSQL.open_segment(str(tmp_path / "segment.jamesql"))
+
+    for query in [
+        {"lyric": {"phrase": "my mural"}},
+        {"lyric": {"contains": "my mural", "strict": True}},
+    ]:
+        assert [
+            document["title"]
+            for document in segment_index.search({"query": query})["documents"]
+        ] == ["tolerate it"]
+
+
+def test_phrase_query_benchmark(request):
+    if not request.config.getoption("--benchmark"):
+        pytest.skip("run with --benchmark")
+
+    random.seed(0)
+
+    vocabulary = [f"word{i}" for i in range(50)]
+
+    for words_per_post in [1000, 4000]:
+        index = JameSQL()
+        index.add_many(
+            {"post": " ".join(random.choices(vocabulary, k=words_per_post))}
+            for _ in range(2000)
+        )
+        index.create_gsi("post", strategy=GSI_INDEX_STRATEGIES.CONTAINS)
+
+        postings = sum(
+            index.gsis["post"]["gsi"][word].count for word in ["word1", "word2"]
+        )
+
+        start_time = time.time()
+
+        index.search({"query": {"post": {"phrase": "word1 word2"}}})
+
+        latency = time.time() - start_time
+
+        print(
+            f"{words_per_post} words per post: {postings} postings, "
+            f"{latency * 1000:.2f}ms per phrase query"
+        )
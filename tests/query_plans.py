@@ -0,0 +1,250 @@
+import json
+
+import pytest
+
+from jamesql import JameSQL
+from jamesql.index import GSI_INDEX_STRATEGIES
+from jamesql.planner import BooleanQuery, QueryPlan, TermQuery
+
+
+@pytest.fixture
+def create_indices():
+    with open("tests/fixtures/documents_with_categorical_and_numeric_values.json") as f:
+        documents = json.load(f)
+
+    index = JameSQL()
+
+    for document in documents:
+        index.add(document)
+
+    index.create_gsi("title", strategy=GSI_INDEX_STRATEGIES.CONTAINS)
+    index.create_gsi("lyric", strategy=GSI_INDEX_STRATEGIES.CONTAINS)
+    index.create_gsi("listens", strategy=GSI_INDEX_STRATEGIES.NUMERIC)
+    index.create_gsi("category", strategy=GSI_INDEX_STRATEGIES.FLAT)
+
+    return index
+
+
+def test_compile_query(create_indices):
+    index = create_indices
+
+    plan = index._compile_query(
+        {
+            "and": [
+                {"lyric": {"contains": "sky", "boost": 2}},
+                {"listens": {"range": [100, 300]}},
+            ]
+        }
+    )
+
+    assert plan == QueryPlan(
+        BooleanQuery(
+            "and",
+            (
+                TermQuery(
+                    "lyric",
+                    "contains",
+                    ("sky",),
+                    GSI_INDEX_STRATEGIES.CONTAINS,
+                    boost=2.0,
+                ),
+                TermQuery(
+                    "listens", "range", ((100, 300),), GSI_INDEX_STRATEGIES.NUMERIC
+                ),
+            ),
+        ),
+        2,
+    )
+
+
+def test_compile_query_expands_terms(create_indices):
+    index = create_indices
+
+    fuzzy = index._compile_query({"title": {"contains": "tolerat", "fuzzy": True}})
+    wildcard = index._compile_query({"title": {"wildcard": "tolerat*"}})
+
+    # fuzzy terms are the indexed words one edit away, not every possible edit
+    assert fuzzy.root.terms == ("tolerat", "tolerate")
+    assert fuzzy.root.expanded
+    # wildcard terms are the indexed words that match the pattern
+    assert wildcard.root.terms == ("tolerate",)
+    assert wildcard.root.expanded
+
+
+def test_query_plans_are_cached(create_indices):
+    index = create_indices
+
+    query = {"query": {"lyric": {"contains": "sky"}}, "limit": 10}
+
+    first_response = index.search(query.copy())
+    plan = index._compile_query(query["query"])
+    second_response = index.search(query.copy())
+
+    assert len(index.query_plans) == 1
+    # the same plan object is returned for an equal query
+    assert index._compile_query({"lyric": {"contains": "sky"}}) is plan
+    assert first_response["documents"] == second_response["documents"]
+
+
+def test_query_plans_are_recompiled_after_create_gsi(create_indices):
+    index = create_indices
+
+    plan = index._compile_query({"title": {"equals": "tolerate it"}})
+
+    assert plan.root.strategy == GSI_INDEX_STRATEGIES.CONTAINS
+
+    index.create_gsi("title", strategy=GSI_INDEX_STRATEGIES.FLAT)
+
+    assert len(index.query_plans) == 0
+    assert (
+        index._compile_query({"title": {"equals": "tolerate it"}}).root.strategy
+        == GSI_INDEX_STRATEGIES.FLAT
+    )
+    assert (
+        index.search({"query": {"title": {"equals": "tolerate it"}}})["documents"][0][
+            "title"
+        ]
+        == "tolerate it"
+    )
+
+
+@pytest.fixture
+def large_index():
+    index = JameSQL()
+
+    for i in range(200):
+        index.add(
+            {
+                "title": f"song {i}",
+                "lyric": "common words" + (" rare" if i % 50 == 0 else ""),
+                "listens": i,
+                "category": ["pop"] if i % 2 else ["rock"],
+            }
+        )
+
+    index.create_gsi("lyric", strategy=GSI_INDEX_STRATEGIES.CONTAINS)
+    index.create_gsi("listens", strategy=GSI_INDEX_STRATEGIES.NUMERIC)
+    index.create_gsi("category", strategy=GSI_INDEX_STRATEGIES.FLAT)
+
+    return index
+
+
+@pytest.mark.parametrize(
+    "query_tree, cardinality",
+    [
+        ({"lyric": {"contains": "rare"}}, 4),
+        ({"lyric": {"contains": "common"}}, 200),
+        ({"lyric": {"contains": "missing"}}, 0),
+        ({"category": {"equals": "pop"}}, 100),
+        ({"listens": {"range": [0, 9]}}, 10),
+        ({"listens": {"greater_than": 189}}, 10),
+        (
+            {
+                "and": [
+                    {"lyric": {"contains": "common"}},
+                    {"lyric": {"contains": "rare"}},
+                ]
+            },
+            4,
+        ),
+        ({"not": [{"category": {"equals": "pop"}}]}, 100),
+    ],
+)
+def test_estimate_cardinality(large_index, query_tree, cardinality):
+    plan = large_index._compile_query(query_tree)
+
+    assert large_index._estimate_cardinality(plan.root) == cardinality
+
+
+@pytest.mark.parametrize(
+    "query_tree, expected_listens",
+    [
+        (
+            {
+                "and": [
+                    {"lyric": {"contains": "common"}},
+                    {"lyric": {"contains": "rare"}},
+                ]
+            },
+            [0, 50, 100, 150],
+        ),
+        (
+            {
+                "and": [
+                    {"listens": {"greater_than_or_equal": 10}},
+                    {"lyric": {"contains": "rare"}},
+                ]
+            },
+            [50, 100, 150],
+        ),
+        (
+            {
+                "and": [
+                    {"lyric": {"contains": "rare"}},
+                    {"not": [{"listens": {"range": [50, 100]}}]},
+                ]
+            },
+            [0, 150],
+        ),
+        (
+            {
+                "and": [
+                    {"listens": {"less_than": 120}},
+                    {
+                        "or": [
+                            {"lyric": {"contains": "rare"}},
+                            {"listens": {"equals": 1}},
+                        ]
+                    },
+                    {"category": {"equals": "rock"}},
+                ]
+            },
+            [0, 50, 100],
+        ),
+        (
+            {
+                "and": [
+                    {"lyric": {"contains": "rare"}},
+                    {"lyric": {"contains": "missing"}},
+                ]
+            },
+            [],
+        ),
+    ],
+)
+def test_and_queries_use_candidates(large_index, query_tree, expected_listens):
+    response = large_index.search(
+        {"query": query_tree, "limit": 200, "sort_by": "listens", "sort_order": "asc"}
+    )
+
+    assert [document["listens"] for document in response["documents"]] == (
+        expected_listens
+    )
+
+
+def test_range_queries_filter_candidates(large_index, monkeypatch):
+    filtered = []
+    filter_candidates = large_index._filter_candidates
+
+    def spy(query_field, query_type, query_term, candidates):
+        filtered.append(len(candidates))
+
+        return filter_candidates(query_field, query_type, query_term, candidates)
+
+    monkeypatch.setattr(large_index, "_filter_candidates", spy)
+
+    response = large_index.search(
+        {
+            "query": {
+                "and": [
+                    {"listens": {"range": [0, 120]}},
+                    {"lyric": {"contains": "rare"}},
+                ]
+            },
+            "limit": 10,
+        }
+    )
+
+    # the rare term is run first, so only its matches are checked against the range
+    assert filtered == [4]
+    assert response["total_results"] == 3
@@ -0,0 +1,224 @@
+import json
+import random
+import time
+
+import numpy
+import pytest
+
+from jamesql import JameSQL
+from jamesql.index import GSI_INDEX_STRATEGIES
+from jamesql.ranking import max_score_top_k, top_k
+
+
+@pytest.fixture
+def documents():
+    with open("tests/fixtures/documents.json") as f:
+        return json.load(f)
+
+
+def create_index(documents):
+    index = JameSQL()
+    index.enable_experimental_bm25_ranker = True
+
+    index.create_gsi("title", strategy=GSI_INDEX_STRATEGIES.CONTAINS)
+    index.create_gsi("lyric", strategy=GSI_INDEX_STRATEGIES.CONTAINS)
+
+    index.add_many(documents)
+
+    return index
+
+
+def expected_ranking(index, response_uuids, terms):
+    """
+    Scores every document in full and sorts them, as search() does without top-k ranking.
+    """
+    scores = []
+
+    for uuid in response_uuids:
+        score = 0
+
+        for term in terms:
+            for field in ["title", "lyric"]:
+                score += index._bm25_term_score(field, term, uuid)
+
+        scores.append((uuid, score))
+
+    return sorted(scores, key=lambda item: item[1], reverse=True)
+
+
+def scorer(doc_ids, scores, scored):
+    """
+    Returns a function that looks up the scores of a term, and records the doc ids it is
+    asked to score.
+    """
+
+    def score(positions):
+        scored.extend(doc_ids[positions].tolist())
+
+        return scores[positions]
+
+    return score
+
+
+@pytest.mark.parametrize("k", [1, 2, 3, 5, 10, 500])
+@pytest.mark.parametrize("slack", [0, 1])
+def test_max_score_top_k(k, slack):
+    random.seed(k)
+
+    postings = []
+
+    for size in [5, 30, 60, 150]:
+        doc_ids = numpy.array(
+            sorted(random.sample(range(200), size)), dtype=numpy.uint32
+        )
+        # integer scores so that there are many ties
+        scores = numpy.array([random.randint(1, 5) for _ in doc_ids], dtype=float)
+        postings.append((doc_ids, scores))
+
+    totals = {}
+
+    for doc_ids, scores in postings:
+        for doc_id, score in zip(doc_ids.tolist(), scores.tolist()):
+            totals[doc_id] = totals.get(doc_id, 0) + score
+
+    expected = sorted(sorted(totals.items()), key=lambda item: item[1], reverse=True)
+
+    # upper bounds computed from statistics can be higher than the highest score
+    doc_ids, scores = max_score_top_k(
+        [doc_ids for doc_ids, _ in postings],
+        [scores.max() + slack for _, scores in postings],
+        [scorer(doc_ids, scores, []) for doc_ids, scores in postings],
+        k,
+    )
+
+    assert list(zip(doc_ids.tolist(), scores.tolist())) == expected[:k]
+
+
+def test_max_score_top_k_skips_non_essential_postings():
+    rare_doc_ids = numpy.array([3, 7], dtype=numpy.uint32)
+    rare_scores = numpy.array([10.0, 8.0])
+    common_doc_ids = numpy.arange(100, dtype=numpy.uint32)
+    common_scores = numpy.ones(100)
+
+    rare_scored = []
+    common_scored = []
+
+    doc_ids, scores = max_score_top_k(
+        [rare_doc_ids, common_doc_ids],
+        [10.0, 1.0],
+        [
+            scorer(rare_doc_ids, rare_scores, rare_scored),
+            scorer(common_doc_ids, common_scores, common_scored),
+        ],
+        2,
+    )
+
+    assert doc_ids.tolist() == [3, 7]
+    assert scores.tolist() == [11.0, 9.0]
+    # the common term cannot lift a document into the top 2 on its own, so it is only
+    # scored for the documents that contain the rare term
+    assert sorted(common_scored) == [3, 7]
+
+
+def test_top_k():
+    doc_ids, scores = top_k(
+        numpy.array([1, 2, 3, 4, 5], dtype=numpy.uint32),
+        numpy.array([1.0, 3.0, 2.0, 3.0, 2.0]),
+        3,
+    )
+
+    assert doc_ids.tolist() == [2, 4, 3]
+    assert scores.tolist() == [3.0, 3.0, 2.0]
+
+
+@pytest.mark.parametrize(
+    "query, terms",
+    [
+        ({"query": {"lyric": {"contains": "my"}}, "limit": 2}, ["my"]),
+        (
+            {"query": {"lyric": {"contains": "my"}}, "limit": 1, "skip": 1},
+            ["my", "tolerate"],
+        ),
+        ({"query": "tolerate sky", "limit": 10}, ["tolerate", "sky"]),
+    ],
+)
+def test_top_k_search(documents, query, terms):
+    index = create_index(documents)
+
+    if isinstance(query["query"], str):
+        query, _ = index._compute_string_query(query["query"])
+
+    all_uuids = [
+        document["uuid"]
+        for document in index.search({"query": query["query"], "limit": 100})[
+            "documents"
+        ]
+    ]
+
+    response = index.search(query.copy(), term_queries=terms)
+    skip = query.get("skip", 0)
+    expected = expected_ranking(index, all_uuids, terms)[
+        skip : skip + query.get("limit", 10)
+    ]
+
+    assert [
+        (document["uuid"], document["_score"]) for document in response["documents"]
+    ] == expected
+    assert response["total_results"] == len(all_uuids) - skip
+
+
+@pytest.mark.parametrize("segment", [False, True])
+def test_bm25_upper_bounds(documents, segment, tmp_path):
+    index = create_index(documents)
+
+    index.remove(
+        index.search({"query": {"title": {"contains": "tolerate"}}})["documents"][0][
+            "uuid"
+        ]
+    )
+
+    if segment:
+        index.save_segment(str(tmp_path / "segment.jamesql"))
+        index = JameSQL.open_segment(str(tmp_path / "segment.jamesql"))
+
+    uuids = [
+        document["uuid"]
+        for document in index.search({"query": "*", "limit": 100})["documents"]
+    ]
+
+    for field in ["title", "lyric"]:
+        for term in index.document_frequencies[field]:
+            assert index._bm25_upper_bound(field, term) >= max(
+                index._bm25_term_score(field, term, uuid) for uuid in uuids
+            )
+
+
+def test_top_k_benchmark(documents, request):
+    if not request.config.getoption("--benchmark"):
+        pytest.skip("run with --benchmark")
+
+    random.seed(0)
+
+    vocabulary = list(
+        {word.lower() for document in documents for word in document["lyric"].split()}
+    )
+    large_documents = [
+        {"title": str(i), "lyric": " ".join(random.choices(vocabulary, k=50))}
+        for i in range(100000)
+    ]
+
+    index = create_index(large_documents)
+    index.match_limit_for_large_result_pages = len(large_documents)
+
+    for limit in [10, 1000, 100000]:
+        start_time = time.time()
+
+        for word in vocabulary[:20]:
+            index.search(
+                {"query": {"lyric": {"contains": word}}, "limit": limit},
+                term_queries=[word],
+            )
+
+        latency = (time.time() - start_time) / 20
+
+        print(f"limit={limit}: {latency * 1000:.2f}ms per query")
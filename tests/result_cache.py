@@ -0,0 +1,227 @@
+import json
+import time
+
+import pytest
+
+from jamesql import JameSQL
+from jamesql.cache import LRUCache
+from jamesql.index import GSI_INDEX_STRATEGIES
+
+
+@pytest.fixture
+def create_indices():
+    with open("tests/fixtures/documents_with_categorical_and_numeric_values.json") as f:
+        documents = json.load(f)
+
+    index = JameSQL()
+
+    for document in documents:
+        index.add(document)
+
+    index.create_gsi("title", strategy=GSI_INDEX_STRATEGIES.CONTAINS)
+    index.create_gsi("lyric", strategy=GSI_INDEX_STRATEGIES.CONTAINS)
+    index.create_gsi("listens", strategy=GSI_INDEX_STRATEGIES.NUMERIC)
+    index.create_gsi("category", strategy=GSI_INDEX_STRATEGIES.FLAT)
+
+    return index
+
+
+def titles(response):
+    return sorted(document["title"] for document in response["documents"])
+
+
+def test_repeated_searches_are_cached(create_indices):
+    index = create_indices
+
+    first_response = index.search({"query": {"lyric": {"contains": "sky"}}})
+    # options that are set to their defaults are normalized
+    second_response = index.search(
+        {"query": {"lyric": {"contains": "sky"}}, "limit": 10, "skip": 0}
+    )
+
+    assert index.result_cache.stats()["hits"] == 1
+    assert index.result_cache.stats()["misses"] == 1
+    assert second_response["documents"] == first_response["documents"]
+
+    # responses are copies, so modifying one does not modify the cache
+    second_response["documents"][0]["title"] = "modified"
+
+    assert titles(index.search({"query": {"lyric": {"contains": "sky"}}})) == titles(
+        first_response
+    )
+
+
+def test_writes_only_invalidate_dependent_responses(create_indices):
+    index = create_indices
+
+    query = {"query": {"lyric": {"contains": "sky"}}}
+
+    index.search(query.copy())
+
+    # the new document does not have a lyric, so it cannot match the query
+    index.add({"title": "willow", "listens": 400, "category": ["pop"]})
+    index.search(query.copy())
+
+    assert index.result_cache.stats()["hits"] == 1
+
+    # the title of The Bolter is not read by the query, and the document is not returned
+    bolter = index.search({"query": {"title": {"contains": "bolter"}}})["documents"][0]
+    index.update(
+        bolter["uuid"],
+        {"title": "the bolter", "lyric": bolter["lyric"], "listens": 300},
+    )
+    index.search(query.copy())
+
+    assert index.result_cache.stats()["hits"] == 2
+
+    index.add({"title": "cardigan", "lyric": "vintage tee, brand new sky"})
+
+    assert titles(index.search(query.copy())) == [
+        "cardigan",
+        "my tears ricochet",
+        "tolerate it",
+    ]
+    assert index.result_cache.stats()["hits"] == 2
+
+
+def test_updates_to_returned_documents_invalidate_responses(create_indices):
+    index = create_indices
+
+    query = {"query": {"lyric": {"contains": "kiss"}}}
+    document = index.search(query.copy())["documents"][0]
+
+    index.update(
+        document["uuid"],
+        {"title": "the bolter (live)", "lyric": document["lyric"], "listens": 300},
+    )
+
+    assert titles(index.search(query.copy())) == ["the bolter (live)"]
+
+    index.remove(document["uuid"])
+
+    assert index.search(query.copy())["documents"] == []
+    assert index.result_cache.stats()["hits"] == 0
+
+
+def test_all_query_is_invalidated_by_every_write(create_indices):
+    index = create_indices
+
+    assert index.search({"query": "*"})["total_results"] == 3
+
+    index.add({"title": "willow"})
+
+    assert index.search({"query": "*"})["total_results"] == 4
+    assert index.result_cache.stats()["hits"] == 0
+
+
+def test_string_query_search_is_cached(create_indices):
+    index = create_indices
+
+    first_response = index.string_query_search("sky")
+    second_response = index.string_query_search("sky")
+
+    assert index.result_cache.stats()["hits"] == 1
+    assert second_response["documents"] == first_response["documents"]
+
+    index.add({"title": "cardigan", "lyric": "vintage tee, brand new sky"})
+
+    assert "cardigan" in titles(index.string_query_search("sky"))
+
+
+def test_create_gsi_clears_result_cache(create_indices):
+    index = create_indices
+
+    index.search({"query": {"lyric": {"contains": "sky"}}})
+    index.create_gsi("title", strategy=GSI_INDEX_STRATEGIES.FLAT)
+
+    assert len(index.result_cache) == 0
+
+
+def test_lru_cache_evictions():
+    cache = LRUCache(maxsize=2)
+
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+
+    # "b" was the least recently used item
+    assert "b" not in cache
+    assert cache.get("a") == 1
+    assert cache.stats()["evictions"] == 1
+
+
+def test_lru_cache_ttl():
+    cache = LRUCache(ttl=0)
+
+    cache.put("a", 1)
+
+    assert cache.get("a") is None
+    assert cache.stats() == {
+        "size": 0,
+        "hits": 0,
+        "misses": 1,
+        "evictions": 1,
+        "invalidations": 0,
+    }
+
+
+def test_lru_cache_invalidation():
+    cache = LRUCache()
+
+    cache.put("a", 1, tags=["title"])
+    cache.put("b", 2, tags=["title", "lyric"])
+    cache.put("c", 3, tags=["listens"])
+
+    generation = cache.generation
+    cache.invalidate(["title"])
+
+    assert "a" not in cache and "b" not in cache
+    assert cache.get("c") == 3
+    assert cache.stats()["invalidations"] == 2
+
+    # values computed before an invalidation are not cached
+    cache.put("a", 1, generation=generation)
+
+    assert "a" not in cache
+
+
+def test_result_cache_size_and_ttl():
+    index = JameSQL(result_cache_size=1, result_cache_ttl=0.05)
+    index.add({"title": "tolerate it", "lyric": "i sit and watch you"})
+    index.create_gsi("lyric", strategy=GSI_INDEX_STRATEGIES.CONTAINS)
+
+    query = {"query": {"lyric": {"contains": "watch"}}}
+
+    index.search(query.copy())
+    index.search(query.copy())
+
+    assert index.result_cache.maxsize == 1
+    assert index.result_cache.stats()["hits"] == 1
+
+    time.sleep(0.1)
+
+    assert index.search(query.copy())["total_results"] == 1
+    assert index.result_cache.stats()["hits"] == 1
+    assert index.result_cache.stats()["evictions"] == 1
+
+
+def test_updates_keep_the_order_of_tied_results():
+    index = JameSQL()
+    index.create_gsi("category", strategy=GSI_INDEX_STRATEGIES.FLAT)
+
+    for i in range(6):
+        index.add({"title": f"t{i}", "category": "pop", "uuid": f"u{i}"})
+
+    query = {"query": {"category": {"equals": "pop"}}, "limit": 2, "skip": 2}
+
+    assert titles(index.search(query.copy())) == ["t2", "t3"]
+
+    # the update only changes a field the query does not read, so the cached page is kept
+    index.update("u0", {"title": "t0 (remix)", "category": "pop"})
+
+    cached = index.search(query.copy())
+
+    index.result_cache.clear()
+
+    assert titles(cached) == titles(index.search(query.copy())) == ["t2", "t3"]
@@ -1,3 +1,4 @@
+import datetime
 import json
 from contextlib import ExitStack as DoesNotRaise
 
@@ -6,7 +7,11 @@ from lark import Lark
 from pytest import raises
 
 from jamesql import JameSQL
-from jamesql.script_lang import JameSQLScriptTransformer, grammar
+from jamesql.script_lang import (
+    JameSQLScriptCompiler,
+    JameSQLScriptTransformer,
+    grammar,
+)
 
 
 @pytest.fixture
@@ -109,3 +114,82 @@ def test_script_score(
         transformer = JameSQLScriptTransformer(document_to_test)
 
         assert transformer.transform(tree) == result
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "(_score + 1)",
+        "((_score + 1) * 2)",
+        "((_score + _score) + _score)",
+        "(_score * listens)",
+        "log (((_score * listens) + 1))",
+        "(listens / 2.5)",
+        "(2 + 3)",
+    ],
+)
+def test_compiled_script_score(script_score_parser, query):
+    with open("tests/fixtures/documents.json") as f:
+        documents = json.load(f)
+
+    for position, document in enumerate(documents):
+        document["_score"] = position + 0.5
+        document["listens"] = position * 100
+
+    tree = script_score_parser.parse(query)
+    score_documents = JameSQLScriptCompiler().transform(tree)
+
+    scores = score_documents(
+        lambda field: [document[field] for document in documents], len(documents)
+    )
+
+    assert scores == pytest.approx(
+        [JameSQLScriptTransformer(document).transform(tree) for document in documents]
+    )
+
+
+def test_compiled_script_score_decay(script_score_parser):
+    now = datetime.datetime.now()
+    published = [
+        (now - datetime.timedelta(days=days)).strftime("%Y-%m-%dT%H:%M:%S")
+        for days in [0, 30, 60]
+    ]
+
+    score_documents = JameSQLScriptCompiler().transform(
+        script_score_parser.parse("decay published")
+    )
+
+    assert score_documents(lambda field: published, 3) == pytest.approx([1, 1.1, 1.21])
+
+
+def test_compiled_script_score_decay_matches_transformer(script_score_parser):
+    now = datetime.datetime.now()
+    published = [
+        (now - datetime.timedelta(hours=hours)).strftime("%Y-%m-%dT%H:%M:%S")
+        for hours in [0, 23, 36, 24 * 45 + 7]
+    ]
+
+    tree = script_score_parser.parse("decay published")
+    score_documents = JameSQLScriptCompiler().transform(tree)
+
+    scores = score_documents(lambda field: published, len(published))
+
+    assert scores == pytest.approx(
+        [
+            JameSQLScriptTransformer({"published": date}).transform(tree)
+            for date in published
+        ]
+    )
+    # decay is measured in whole days, so a document posted 23 hours ago scores the same
+    # as one posted now
+    assert scores[1] == scores[0]
+
+
+def test_compiled_script_score_division_by_zero(script_score_parser):
+    score_documents = JameSQLScriptCompiler().transform(
+        script_score_parser.parse("(_score / listens)")
+    )
+
+    columns = {"_score": [1, 2], "listens": [0, 2]}
+
+    assert score_documents(columns.get, 2) == [float("inf"), 1.0]
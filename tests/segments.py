@@ -0,0 +1,174 @@
+import json
+
+import pytest
+
+from jamesql import JameSQL
+from jamesql.index import GSI_INDEX_STRATEGIES
+
+
+@pytest.fixture
+def create_indices(tmp_path):
+    with open("tests/fixtures/documents_with_categorical_and_numeric_values.json") as f:
+        documents = json.load(f)
+
+    index = JameSQL()
+
+    for document in documents:
+        index.add(document)
+
+    index.create_gsi("title", strategy=GSI_INDEX_STRATEGIES.CONTAINS)
+    index.create_gsi("lyric", strategy=GSI_INDEX_STRATEGIES.CONTAINS)
+    index.create_gsi("listens", strategy=GSI_INDEX_STRATEGIES.NUMERIC)
+    index.create_gsi("category", strategy=GSI_INDEX_STRATEGIES.FLAT)
+
+    path = str(tmp_path / "segment.jamesql")
+
+    index.save_segment(path)
+
+    return index, JameSQL.open_segment(path)
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        {"query": {"lyric": {"contains": "sky"}}, "limit": 10},
+        {"query": {"title": {"equals": "tolerate it"}}, "limit": 10},
+        {"query": {"lyric": {"contains": "my mural", "strict": True}}, "limit": 10},
+        {"query": {"category": {"equals": "pop"}}, "limit": 10},
+        {
+            "query": {
+                "and": [
+                    {"lyric": {"contains": "sky"}},
+                    {"category": {"equals": "acoustic"}},
+                ]
+            },
+            "limit": 10,
+        },
+        {"query": "*", "limit": 10},
+    ],
+)
+def test_segment_search(create_indices, query):
+    index, segment_index = create_indices
+
+    expected = index.search(query.copy())["documents"]
+    response = segment_index.search(query.copy())["documents"]
+
+    assert sorted(document["uuid"] for document in response) == sorted(
+        document["uuid"] for document in expected
+    )
+
+
+def test_segment_numeric_gsi(create_indices):
+    index, segment_index = create_indices
+
+    gsi = index.gsis["listens"]["gsi"]
+    segment_gsi = segment_index.gsis["listens"]["gsi"]
+
+    assert list(segment_gsi.keys()) == list(gsi.keys())
+    assert [
+        list(doc_ids) for doc_ids in segment_gsi.values(min=100, excludemin=True)
+    ] == [list(doc_ids) for doc_ids in gsi.values(min=100, excludemin=True)]
+    assert [list(doc_ids) for doc_ids in segment_gsi.values(min=100, max=200)] == [
+        list(doc_ids) for doc_ids in gsi.values(min=100, max=200)
+    ]
+    assert list(segment_gsi.get(200)) == list(gsi.get(200))
+    assert segment_gsi.get(201) is None
+
+
+def test_segment_documents_and_word_counts(create_indices):
+    index, segment_index = create_indices
+
+    assert len(segment_index) == len(index)
+
+    for doc_uuid, document in index.global_index.items():
+        assert doc_uuid in segment_index.global_index
+        assert segment_index.global_index[doc_uuid]["title"] == document["title"]
+
+    assert segment_index.word_counts["sky"] == index.word_counts["sky"]
+    assert segment_index.word_counts["not-a-word"] == 0
+    assert segment_index.spelling_correction("skt") == index.spelling_correction("skt")
+
+
+def test_segment_stored_fields(create_indices):
+    index, segment_index = create_indices
+
+    documents = segment_index.segment.documents()
+
+    for doc_uuid, document in index.global_index.items():
+        ordinal = documents.ordinal(doc_uuid)
+
+        assert documents.document(ordinal) == document
+        assert documents.document(ordinal, ["title", "not-a-field"]) == {
+            "title": document["title"]
+        }
+
+
+def test_segment_is_read_only(create_indices):
+    _, segment_index = create_indices
+
+    with pytest.raises(ValueError):
+        segment_index.add({"title": "shake it off"})
+
+
+def test_invalid_segment(tmp_path):
+    path = tmp_path / "segment.jamesql"
+    path.write_bytes(b"not a segment at all, not even close")
+
+    with pytest.raises(ValueError):
+        JameSQL.open_segment(str(path))
+
+
+@pytest.mark.parametrize("terms", [["sky"], ["tolerate", "sky"], ["my", "mural"]])
+def test_segment_bm25_scores(create_indices, tmp_path, terms):
+    index, _ = create_indices
+
+    # removed documents leave gaps in the doc ids, which segments renumber
+    document = index.search({"query": {"title": {"contains": "bolter"}}})["documents"][
+        0
+    ]
+    index.remove(document["uuid"])
+
+    path = str(tmp_path / "bm25.jamesql")
+    index.save_segment(path)
+    segment_index = JameSQL.open_segment(path)
+
+    query = {
+        "query": {"or": [{"lyric": {"contains": term}} for term in terms]},
+        "limit": 10,
+    }
+    responses = []
+
+    for searched_index in (index, segment_index):
+        searched_index.enable_experimental_bm25_ranker = True
+
+        response = searched_index.search(query.copy(), term_queries=terms)
+        responses.append(
+            [
+                (document["uuid"], document["_score"])
+                for document in response["documents"]
+            ]
+        )
+
+    assert responses[0] and responses[1] == pytest.approx(responses[0])
+    assert all(score > 0 for _, score in responses[1])
+
+    for doc_uuid, _ in responses[0]:
+        for term in terms:
+            assert segment_index._bm25_term_score(
+                "lyric", term, doc_uuid
+            ) == pytest.approx(index._bm25_term_score("lyric", term, doc_uuid))
+
+
+def test_segment_columns(create_indices):
+    index, segment_index = create_indices
+
+    assert set(segment_index.columns) == {"listens"}
+    assert segment_index.doc_lengths == {
+        uuid: lengths for uuid, lengths in index.doc_lengths.items()
+    }
+
+    query = {"query": "*", "sort_by": "listens", "limit": 10}
+
+    assert [
+        document["uuid"] for document in segment_index.search(query.copy())["documents"]
+    ] == [document["uuid"] for document in index.search(query.copy())["documents"]]
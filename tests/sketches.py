@@ -0,0 +1,166 @@
+import json
+
+import numpy
+import pytest
+
+from jamesql import JameSQL
+from jamesql.index import GSI_INDEX_STRATEGIES
+from jamesql.sketches import HyperLogLog
+
+
+@pytest.fixture
+def create_indices():
+    with open("tests/fixtures/documents_with_categorical_and_numeric_values.json") as f:
+        documents = json.load(f)
+
+    index = JameSQL()
+
+    for document in documents:
+        index.add(document)
+
+    index.create_gsi("title", strategy=GSI_INDEX_STRATEGIES.CONTAINS)
+    index.create_gsi("lyric", strategy=GSI_INDEX_STRATEGIES.CONTAINS)
+    index.create_gsi("listens", strategy=GSI_INDEX_STRATEGIES.NUMERIC)
+    index.create_gsi("category", strategy=GSI_INDEX_STRATEGIES.FLAT)
+
+    return index
+
+
+@pytest.mark.parametrize("cardinality", [0, 1, 100, 10000, 200000])
+@pytest.mark.parametrize("precision", [10, 14])
+def test_hyperloglog_count(cardinality, precision):
+    sketch = HyperLogLog(precision)
+
+    sketch.update(f"https://example.com/{i}" for i in range(cardinality))
+    # values that were already added are not counted again
+    sketch.update(f"https://example.com/{i}" for i in range(cardinality // 2))
+
+    error = 1.04 / (2**precision) ** 0.5
+
+    assert sketch.count() == pytest.approx(cardinality, rel=4 * error, abs=1)
+
+
+def test_hyperloglog_merge_and_reduce():
+    first = HyperLogLog(14)
+    second = HyperLogLog(12)
+    both = HyperLogLog(12)
+
+    first.update(range(0, 60000))
+    second.update(range(40000, 100000))
+    both.update(range(0, 100000))
+
+    # reducing a sketch gives the same sketch as adding the values at the lower precision
+    reduced = HyperLogLog(12)
+    reduced.update(range(0, 60000))
+
+    assert numpy.array_equal(first.reduce(12).registers, reduced.registers)
+
+    merged = first.merge(second)
+
+    assert merged.precision == 12
+    assert numpy.array_equal(merged.registers, both.registers)
+
+    with pytest.raises(ValueError):
+        second.reduce(14)
+
+
+@pytest.mark.parametrize("precision", [3, 19, "14"])
+def test_hyperloglog_precision(precision):
+    with pytest.raises(ValueError):
+        HyperLogLog(precision)
+
+    with pytest.raises((ValueError, TypeError)):
+        JameSQL(sketch_precision=precision)
+
+
+@pytest.mark.parametrize(
+    "query",
+    ["*", {"lyric": {"contains": "sky"}}, {"category": {"equals": "acoustic"}}],
+)
+def test_approximate_aggregate(create_indices, query):
+    index = create_indices
+
+    exact = index.search({"query": query, "metrics": ["aggregate"]})
+    approximate = index.search({"query": query, "metrics": ["approximate_aggregate"]})
+
+    # the sketches are exact for so few values
+    assert approximate["metrics"] == exact["metrics"]
+
+
+def test_sketches_are_rebuilt_after_removals(create_indices):
+    index = create_indices
+
+    def unique_titles():
+        return index.search(
+            {"query": "*", "limit": 0, "metrics": ["approximate_aggregate"]}
+        )["metrics"]["unique_record_values"]["title"]
+
+    assert unique_titles() == 3
+
+    index.add({"title": "willow", "listens": 100})
+
+    assert "title" not in index.stale_sketches
+    assert unique_titles() == 4
+
+    document = index.search({"query": {"title": {"contains": "willow"}}})["documents"][
+        0
+    ]
+    index.remove(document["uuid"])
+
+    assert "title" in index.stale_sketches
+    assert unique_titles() == 3
+    assert "title" not in index.stale_sketches
+
+
+def test_approximate_cardinality_aggregation(create_indices):
+    index = create_indices
+
+    response = index.search(
+        {
+            "query": "*",
+            "aggregations": {
+                "titles": {"cardinality": {"field": "title", "precision": 10}},
+                "categories": {"cardinality": {"field": "category", "precision": 10}},
+            },
+        }
+    )
+
+    assert response["aggregations"] == {
+        "titles": {"value": 3},
+        "categories": {"value": 2},
+    }
+
+    response = index.search(
+        {
+            "query": {"lyric": {"contains": "sky"}},
+            "aggregations": {
+                "titles": {"cardinality": {"field": "title", "precision": 10}}
+            },
+        }
+    )
+
+    assert response["aggregations"] == {"titles": {"value": 2}}
+
+
+def test_segment_sketches(create_indices, tmp_path):
+    index = create_indices
+
+    document = index.search({"query": {"title": {"contains": "bolter"}}})["documents"][
+        0
+    ]
+    index.remove(document["uuid"])
+
+    index.save_segment(str(tmp_path / "segment.jamesql"))
+
+    segment_index = JameSQL.open_segment(str(tmp_path / "segment.jamesql"))
+
+    assert set(segment_index.field_sketches) == {
+        "title",
+        "lyric",
+        "listens",
+        "category",
+    }
+    # sketches are rebuilt when a segment is written, so removed documents are not counted
+    assert segment_index.search({"query": "*", "metrics": ["approximate_aggregate"]})[
+        "metrics"
+    ] == {"unique_record_values": {"title": 2, "lyric": 2, "listens": 2, "category": 2}}
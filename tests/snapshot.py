@@ -0,0 +1,98 @@
+import json
+from contextlib import ExitStack as DoesNotRaise
+
+import pytest
+
+from jamesql import JameSQL
+from jamesql.index import GSI_INDEX_STRATEGIES, SNAPSHOT_HEADER, SNAPSHOT_MAGIC
+
+
+@pytest.fixture
+def create_indices():
+    with open("tests/fixtures/documents_with_categorical_and_numeric_values.json") as f:
+        documents = json.load(f)
+
+    index = JameSQL()
+
+    for document in documents:
+        index.add(document)
+
+    index.create_gsi("title", strategy=GSI_INDEX_STRATEGIES.CONTAINS)
+    index.create_gsi("lyric", strategy=GSI_INDEX_STRATEGIES.CONTAINS)
+    index.create_gsi("listens", strategy=GSI_INDEX_STRATEGIES.NUMERIC)
+    index.enable_autosuggest("title")
+
+    return index
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        {"query": {"lyric": {"contains": "sky"}}, "limit": 10},
+        {"query": {"title": {"equals": "tolerate it"}}, "limit": 10},
+        {"query": {"lyric": {"contains": "my mural", "strict": True}}, "limit": 10},
+    ],
+)
+def test_snapshot_round_trip(create_indices, tmp_path, query):
+    index = create_indices
+    path = str(tmp_path / "snapshot.jamesql")
+
+    index.save_snapshot(path)
+
+    loaded_index = JameSQL.load_snapshot(path)
+
+    assert len(loaded_index) == len(index)
+    assert loaded_index.gsis.keys() == index.gsis.keys()
+
+    expected = index.search(query.copy())["documents"]
+    response = loaded_index.search(query.copy())["documents"]
+
+    assert [document["uuid"] for document in response] == [
+        document["uuid"] for document in expected
+    ]
+
+
+def test_snapshot_restores_autosuggest_and_accepts_writes(create_indices, tmp_path):
+    index = create_indices
+    path = str(tmp_path / "snapshot.jamesql")
+
+    index.save_snapshot(path)
+
+    loaded_index = JameSQL.load_snapshot(path)
+
+    assert loaded_index.autosuggest("tolerate") == index.autosuggest("tolerate")
+
+    loaded_index.add({"title": "shake it off", "lyric": "I stay out too late"})
+
+    loaded_index.create_gsi("title", strategy=GSI_INDEX_STRATEGIES.CONTAINS)
+
+    response = loaded_index.search(
+        {"query": {"title": {"equals": "shake it off"}}, "limit": 10}
+    )
+
+    assert len(response["documents"]) == 1
+
+
+@pytest.mark.parametrize(
+    "header, raises_exception",
+    [
+        (b"not a snapshot", pytest.raises(ValueError)),
+        (SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, 999, 0, 0), pytest.raises(ValueError)),
+        (SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, 1, 100, 0), pytest.raises(ValueError)),
+    ],
+)
+def test_invalid_snapshot(tmp_path, header, raises_exception):
+    path = tmp_path / "snapshot.jamesql"
+    path.write_bytes(header)
+
+    with raises_exception:
+        JameSQL.load_snapshot(str(path))
+
+
+def test_valid_snapshot_does_not_raise(create_indices, tmp_path):
+    path = str(tmp_path / "snapshot.jamesql")
+
+    create_indices.save_snapshot(path)
+
+    with DoesNotRaise():
+        JameSQL.load_snapshot(path)
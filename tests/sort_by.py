@@ -183,3 +183,73 @@ def test_search(
             response = large_index.search(query)
 
             assert float(response["query_time"]) < 0.06
+
+
+@pytest.fixture
+def numeric_index():
+    index = JameSQL()
+
+    index.create_gsi("listens", strategy=GSI_INDEX_STRATEGIES.NUMERIC)
+    index.create_gsi("category", strategy=GSI_INDEX_STRATEGIES.FLAT)
+
+    for i in range(50):
+        # repeated values so that documents tie on the sort key
+        index.add(
+            {
+                "title": str(i),
+                "listens": (i * 7) % 13,
+                "category": ["pop" if i % 2 else "rock"],
+            }
+        )
+
+    return index
+
+
+@pytest.mark.parametrize("sort_order", ["asc", "desc"])
+@pytest.mark.parametrize("skip", [0, 3, 48, 60])
+@pytest.mark.parametrize(
+    "query",
+    ["*", {"category": {"equals": "pop"}}, {"not": {"category": {"equals": "pop"}}}],
+)
+def test_sort_by_numeric_index(numeric_index, query, skip, sort_order):
+    all_documents = numeric_index.search({"query": query, "limit": 100})["documents"]
+    expected = sorted(
+        all_documents, key=lambda d: d["listens"], reverse=sort_order == "desc"
+    )
+
+    response = numeric_index.search(
+        {
+            "query": query,
+            "limit": 5,
+            "skip": skip,
+            "sort_by": "listens",
+            "sort_order": sort_order,
+        }
+    )
+
+    assert [document["title"] for document in response["documents"]] == [
+        document["title"] for document in expected[skip : skip + 5]
+    ]
+    assert response["total_results"] == max(len(all_documents) - skip, 0)
+
+
+@pytest.mark.parametrize("sort_order", ["asc", "desc"])
+def test_sort_by_text_field_with_limit(numeric_index, sort_order):
+    all_documents = numeric_index.search({"query": "*", "limit": 100})["documents"]
+    expected = sorted(
+        all_documents, key=lambda d: d["title"], reverse=sort_order == "desc"
+    )
+
+    response = numeric_index.search(
+        {
+            "query": "*",
+            "limit": 4,
+            "skip": 2,
+            "sort_by": "title",
+            "sort_order": sort_order,
+        }
+    )
+
+    assert [document["title"] for document in response["documents"]] == [
+        document["title"] for document in expected[2:6]
+    ]
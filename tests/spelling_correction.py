@@ -1,5 +1,7 @@
+import gc
 import json
 import sys
+import weakref
 from contextlib import ExitStack as DoesNotRaise
 
 import pytest
@@ -78,3 +80,63 @@ def test_spelling_correction(create_indices, query, corrected_query):
 
     if large_index:
         assert large_index.spelling_correction(query) == corrected_query
+
+
+def test_spelling_corrections_are_cached():
+    index = JameSQL(spelling_cache_size=2)
+    index.create_gsi("title", strategy=GSI_INDEX_STRATEGIES.CONTAINS)
+
+    index.add({"title": "tolerate it"})
+
+    assert index.spelling_correction("tolerat") == "tolerate"
+    assert index.spelling_correction("tolerat") == "tolerate"
+    assert index.spelling_cache.stats()["hits"] == 1
+
+    # a value without words leaves the word counts unchanged, so corrections are kept
+    index.add({"title": " "})
+    index.remove(index.add({"title": "\n"})["uuid"])
+
+    assert index.spelling_correction("tolerat") == "tolerate"
+    assert index.spelling_cache.stats()["hits"] == 2
+
+    # corrections are made again when the words in the index change
+    index.add({"title": "toleran"})
+    index.add({"title": "toleran"})
+
+    assert index.spelling_correction("tolerat") == "toleran"
+    assert index.spelling_cache.stats()["misses"] == 2
+
+    for word in ["a", "b", "c"]:
+        index.spelling_correction(word)
+
+    assert len(index.spelling_cache) == 2
+
+
+def test_string_query_corrects_each_word_once():
+    index = JameSQL()
+    index.create_gsi("title", strategy=GSI_INDEX_STRATEGIES.CONTAINS)
+
+    index.add({"title": "tolerate it"})
+    index.add({"title": "tolerate it"})
+
+    response = index.string_query_search("tolerat")
+
+    assert response["spelling_substitutions"] == {"tolerat": "tolerate"}
+    assert index.spelling_cache.stats() == {
+        "size": 1,
+        "hits": 0,
+        "misses": 1,
+        "evictions": 0,
+        "invalidations": 0,
+    }
+
+
+def test_spelling_cache_does_not_keep_index_alive():
+    index = JameSQL()
+    index.spelling_correction("tolerat")
+
+    reference = weakref.ref(index)
+    del index
+    gc.collect()
+
+    assert reference() is None
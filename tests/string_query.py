@@ -1,12 +1,15 @@
 import json
 import sys
+import time
 from contextlib import ExitStack as DoesNotRaise
 
 import pytest
 from deepdiff import DeepDiff
+from lark import Lark
 
 from jamesql import JameSQL
 from jamesql.index import GSI_INDEX_STRATEGIES
+from jamesql.rewriter import STRING_QUERY_PARSER, grammar, rewrite_string_query
 
 
 def pytest_addoption(parser):
@@ -317,3 +320,76 @@ def test_search(
                 response = large_index.string_query_search(query)
 
                 assert float(response["query_time"]) < 0.06
+
+
+def test_string_query_rewrites_are_cached(create_indices):
+    index, _ = create_indices
+
+    rewrite_string_query.cache_clear()
+
+    first_query, _ = index._compute_string_query("tolerate it")
+    # search() modifies the query it is given, which must not change the cached query
+    first_query["skip"] = 10
+    second_query, _ = index._compute_string_query("tolerate it")
+
+    assert rewrite_string_query.cache_info().hits == 1
+    assert "skip" not in second_query
+
+    index._compute_string_query("tolerate it", boosts={"title": 2})
+
+    assert rewrite_string_query.cache_info().misses == 2
+
+
+# string queries from the tests and documentation, used to compare parsers
+STRING_QUERY_CORPUS = [
+    "tolerate it",
+    "title:tolerate",
+    "title:'tolerate it'",
+    'title:"tolerate it" mural',
+    "'tolerate'",
+    "St*rted",
+    "-started -with mural",
+    "title:tolerate lyric:I",
+    "I -still",
+    "-started -mural -title:'The'",
+    "listens>100",
+    "listens<=101",
+    "listens[200, 300] category:'pop'",
+    "listens>=101 sky",
+    "category:'pop' category:'acoustic'",
+    "sky OR mural sky",
+    "sky OR sky OR sky",
+    "sky AND mural OR tears",
+    "-lyric:sky lyric:sky",
+    "sky^2 mural",
+    "sky sort:listens DESC",
+    "rock and roll",
+    "sky or",
+]
+
+
+def test_lalr_parser_matches_earley():
+    earley_parser = Lark(grammar, parser="earley")
+
+    for query in STRING_QUERY_CORPUS:
+        assert STRING_QUERY_PARSER.parse(query) == earley_parser.parse(query)
+
+
+def test_string_query_parser_benchmark(request):
+    if not request.config.getoption("--benchmark"):
+        pytest.skip("run with --benchmark")
+
+    queries = STRING_QUERY_CORPUS * 50
+
+    for name, parser in [
+        ("earley", Lark(grammar, parser="earley")),
+        ("lalr", STRING_QUERY_PARSER),
+    ]:
+        start_time = time.time()
+
+        for query in queries:
+            parser.parse(query)
+
+        throughput = len(queries) / (time.time() - start_time)
+
+        print(f"{name}: {throughput:.0f} queries per second")
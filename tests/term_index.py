@@ -0,0 +1,470 @@
+import fnmatch
+import json
+import random
+import time
+
+import pybmoore
+import pytest
+
+from jamesql import JameSQL
+from jamesql.index import GSI_INDEX_STRATEGIES
+from jamesql.term_index import DeletionIndex, KGramIndex, edit_distance
+
+
+@pytest.fixture
+def create_indices():
+    with open("tests/fixtures/documents.json") as f:
+        documents = json.load(f)
+
+    index = JameSQL()
+
+    for document in documents:
+        index.add(document)
+
+    index.create_gsi("title", strategy=GSI_INDEX_STRATEGIES.CONTAINS)
+    index.create_gsi("lyric", strategy=GSI_INDEX_STRATEGIES.CONTAINS)
+
+    return index
+
+
+@pytest.mark.parametrize(
+    "first, second, distance",
+    [
+        ("tolerate", "tolerate", 0),
+        ("tolerat", "tolerate", 1),
+        ("tolerate", "toelrate", 1),  # adjacent letters swapped
+        ("murap", "mural", 1),
+        ("sky", "sly", 1),
+        ("kiss", "kites", 2),
+        ("toler", "tolerate", 3),
+    ],
+)
+def test_edit_distance(first, second, distance):
+    assert edit_distance(first, second, 3) == distance
+    assert edit_distance(first, second, 1) == min(distance, 2)
+
+
+@pytest.mark.parametrize("max_distance", [1, 2])
+def test_deletion_index_finds_every_term_within_distance(max_distance):
+    random.seed(0)
+
+    terms = {
+        "".join(random.choice("abcd") for _ in range(random.randint(1, 6)))
+        for _ in range(500)
+    }
+
+    index = DeletionIndex(max_distance)
+    index.update(terms)
+
+    for _ in range(200):
+        word = "".join(random.choice("abcd") for _ in range(random.randint(1, 6)))
+
+        expected = {
+            term: edit_distance(word, term, max_distance)
+            for term in terms
+            if edit_distance(word, term, max_distance) <= max_distance
+        }
+
+        assert index.search(word) == expected
+
+    with pytest.raises(ValueError):
+        index.search("abc", max_distance + 1)
+
+
+def test_deletion_index_removes_terms():
+    index = DeletionIndex()
+    index.update(["willow", "willow", "pillow"])
+
+    index.remove("willow")
+
+    # "willow" was added twice, so it is kept until it is removed twice
+    assert index.search("wilow") == {"willow": 1}
+
+    index.remove("willow")
+    index.remove("not indexed")
+
+    assert "willow" not in index
+    assert index.search("wilow") == {}
+    assert index.search("pilow") == {"pillow": 1}
+
+
+def test_fuzzy_query_finds_new_words(create_indices):
+    index = create_indices
+
+    query = {"query": {"lyric": {"contains": "wilow", "fuzzy": True}}}
+
+    assert index.search(query)["documents"] == []
+
+    index.add({"title": "willow", "lyric": "Wreck my plans, that's my man, willow"})
+
+    # the plan of the first search is recompiled, because a new word was indexed
+    assert [document["title"] for document in index.search(query)["documents"]] == [
+        "willow"
+    ]
+
+
+def test_fuzzy_terms_skip_removed_words(create_indices):
+    index = create_indices
+
+    document = index.add({"title": "willow", "lyric": "life was a willow"})
+
+    assert "willow" in index._fuzzy_terms("wilow")
+
+    index.remove(document["uuid"])
+
+    assert "willow" in index.term_index
+    assert "willow" not in index._fuzzy_terms("wilow")
+
+
+def test_kgram_index_finds_every_matching_term():
+    random.seed(0)
+
+    terms = list(
+        {
+            "".join(random.choice("abc$") for _ in range(random.randint(1, 7)))
+            for _ in range(2000)
+        }
+    )
+
+    index = KGramIndex()
+    index.update(terms)
+
+    for _ in range(500):
+        pattern = "".join(random.choice("abc$*?") for _ in range(random.randint(1, 6)))
+
+        assert index.search(pattern) == [
+            term for term in terms if fnmatch.fnmatchcase(term, pattern)
+        ]
+
+
+@pytest.mark.parametrize(
+    "query, titles",
+    [
+        ({"lyric": {"wildcard": "scr*ing"}}, ["my tears ricochet"]),
+        ({"lyric": {"wildcard": "m?ral"}}, ["tolerate it"]),
+        ({"lyric": {"wildcard": "*iss"}}, ["The Bolter"]),
+        ({"title": {"wildcard": "TOL*"}}, ["tolerate it"]),
+        ({"lyric": {"wildcard": "my m*", "strict": True}}, ["tolerate it"]),
+        ({"lyric": {"wildcard": "m?ral my", "strict": True}}, ["tolerate it"]),
+        ({"lyric": {"wildcard": "my m?ral sky", "strict": True}}, []),
+        ({"lyric": {"wildcard": "m??ral"}}, []),
+    ],
+)
+def test_wildcard_queries(create_indices, query, titles):
+    index = create_indices
+
+    response = index.search({"query": query, "sort_by": "title"})
+
+    assert [document["title"] for document in response["documents"]] == titles
+
+
+def test_wildcard_query_finds_new_words(create_indices):
+    index = create_indices
+
+    query = {"query": {"title": {"wildcard": "wil*"}}}
+
+    assert index.search(query)["documents"] == []
+
+    # "willow" is already a word in another field, but not in the title GSI
+    index.add({"title": "tolerate it", "lyric": "willow"})
+    index.add({"title": "willow", "lyric": "Wreck my plans"})
+
+    assert [document["title"] for document in index.search(query)["documents"]] == [
+        "willow"
+    ]
+
+
+def test_kgram_index_finds_every_term_containing_substring():
+    random.seed(0)
+
+    terms = list(
+        {
+            "".join(random.choice("abc ") for _ in range(random.randint(1, 9)))
+            for _ in range(2000)
+        }
+    )
+
+    index = KGramIndex()
+    index.update(terms)
+
+    for _ in range(500):
+        substring = "".join(random.choice("abc ") for _ in range(random.randint(0, 5)))
+
+        assert index.containing(substring) == [
+            term for term in terms if substring in term
+        ]
+
+
+def test_kgram_index_removes_terms():
+    random.seed(0)
+
+    terms = list(
+        {
+            "".join(random.choice("abc") for _ in range(random.randint(1, 7)))
+            for _ in range(500)
+        }
+    )
+
+    index = KGramIndex()
+    index.update(terms)
+
+    removed = set(random.sample(terms, 250))
+
+    for term in removed:
+        index.remove(term)
+
+    index.remove("not indexed")
+
+    remaining = [term for term in terms if term not in removed]
+
+    assert len(index) == len(remaining)
+    assert index.search("*") == remaining
+    assert index.containing("ab") == [term for term in remaining if "ab" in term]
+
+    # a removed term can be added again
+    index.add(terms[0])
+
+    assert terms[0] in index
+
+
+@pytest.fixture
+def create_short_string_indices():
+    with open("tests/fixtures/documents_with_categorical_and_numeric_values.json") as f:
+        documents = json.load(f)
+
+    index = JameSQL()
+
+    for document in documents:
+        index.add(document)
+
+    index.create_gsi("title", strategy=GSI_INDEX_STRATEGIES.PREFIX)
+    index.create_gsi("category", strategy=GSI_INDEX_STRATEGIES.FLAT)
+
+    return index
+
+
+@pytest.mark.parametrize(
+    "query, titles",
+    [
+        ({"title": {"contains": "ricochet"}}, ["my tears ricochet"]),
+        (
+            {"title": {"contains": "e"}},
+            ["The Bolter", "my tears ricochet", "tolerate it"],
+        ),
+        ({"title": {"contains": "rate i"}}, ["tolerate it"]),
+        ({"title": {"contains": "willow"}}, []),
+        ({"category": {"contains": "ous"}}, ["The Bolter", "my tears ricochet"]),
+        ({"category": {"contains": "po"}}, ["my tears ricochet", "tolerate it"]),
+        ({"category": {"starts_with": "aco"}}, ["The Bolter", "my tears ricochet"]),
+        ({"category": {"starts_with": "ous"}}, []),
+    ],
+)
+def test_substring_queries(create_short_string_indices, query, titles):
+    index = create_short_string_indices
+
+    response = index.search({"query": query})
+
+    assert sorted(document["title"] for document in response["documents"]) == titles
+
+
+def test_substring_query_finds_new_keys(create_short_string_indices):
+    index = create_short_string_indices
+
+    query = {"query": {"title": {"contains": "illo"}}}
+
+    assert index.search(query)["documents"] == []
+
+    index.add({"title": "willow", "category": ["folk"]})
+
+    assert [document["title"] for document in index.search(query)["documents"]] == [
+        "willow"
+    ]
+    assert [
+        document["title"]
+        for document in index.search({"query": {"category": {"contains": "ol"}}})[
+            "documents"
+        ]
+    ] == ["willow"]
+
+
+@pytest.mark.parametrize("operation", ["update", "remove"])
+@pytest.mark.parametrize("search_first", [True, False])
+def test_prefix_queries_after_keys_are_removed(operation, search_first):
+    index = JameSQL()
+    index.create_gsi("title", strategy=GSI_INDEX_STRATEGIES.PREFIX)
+    index.add({"title": "zebra", "uuid": "a"})
+    index.add({"title": "yak", "uuid": "b"})
+
+    queries = [
+        {"query": {"title": {"contains": "ebr"}}},
+        {"query": {"title": {"contains": "zebr", "fuzzy": True}}},
+    ]
+
+    if search_first:
+        # the key and fuzzy indexes are built by the first search
+        for query in queries:
+            assert [
+                document["uuid"] for document in index.search(query)["documents"]
+            ] == ["a"]
+
+    if operation == "update":
+        index.update("a", {"title": "horse"})
+    else:
+        index.remove("a")
+
+    for query in queries:
+        assert index.search(query)["documents"] == []
+
+    if search_first:
+        assert "zebra" not in index.key_indexes["title"]
+        assert "zebra" not in index.fuzzy_indexes["title"]
+        assert "yak" in index.fuzzy_indexes["title"]
+
+
+def test_removed_keys_leave_the_key_index(create_short_string_indices):
+    index = create_short_string_indices
+
+    document = index.add({"title": "willow", "category": ["folk"]})
+
+    assert index.search({"query": {"category": {"contains": "ol"}}})["documents"]
+
+    index.remove(document["uuid"])
+
+    assert "folk" not in index.key_indexes["category"]
+    assert index.search({"query": {"category": {"contains": "ol"}}})["documents"] == []
+
+
+@pytest.mark.parametrize(
+    "query, titles",
+    [
+        ({"title": {"wildcard": "tol*"}}, ["tolerate it"]),
+        ({"title": {"wildcard": "*it"}}, ["tolerate it"]),
+        ({"title": {"wildcard": "my tears ric?chet"}}, ["my tears ricochet"]),
+        (
+            {"title": {"wildcard": "*e*"}},
+            ["The Bolter", "my tears ricochet", "tolerate it"],
+        ),
+        ({"title": {"wildcard": "tol"}}, []),
+        (
+            {"category": {"wildcard": "*o*"}},
+            ["The Bolter", "my tears ricochet", "tolerate it"],
+        ),
+        ({"category": {"wildcard": "p?p"}}, ["my tears ricochet", "tolerate it"]),
+        ({"category": {"wildcard": "*ous"}}, []),
+    ],
+)
+def test_wildcard_queries_on_prefix_and_flat_fields(
+    create_short_string_indices, query, titles
+):
+    index = create_short_string_indices
+
+    response = index.search({"query": query})
+
+    assert sorted(document["title"] for document in response["documents"]) == titles
+
+
+def test_wildcard_query_on_flat_field_finds_new_keys(create_short_string_indices):
+    index = create_short_string_indices
+
+    query = {"query": {"category": {"wildcard": "f*k"}}}
+
+    assert index.search(query)["documents"] == []
+
+    index.add({"title": "willow", "category": ["folk"]})
+
+    assert [document["title"] for document in index.search(query)["documents"]] == [
+        "willow"
+    ]
+
+
+@pytest.mark.parametrize(
+    "query, titles",
+    [
+        ({"title": {"equals": "toelrate it", "fuzzy": True}}, ["tolerate it"]),
+        ({"title": {"starts_with": "my tars", "fuzzy": True}}, ["my tears ricochet"]),
+        ({"title": {"contains": "Bolte", "fuzzy": True}}, ["The Bolter"]),
+        ({"title": {"equals": "toelrate it"}}, []),
+        (
+            {"category": {"equals": "accoustic", "fuzzy": True}},
+            ["The Bolter", "my tears ricochet"],
+        ),
+        (
+            {"category": {"equals": "pip", "fuzzy": True}},
+            ["my tears ricochet", "tolerate it"],
+        ),
+        ({"category": {"equals": "acustik", "fuzzy": True}}, []),
+    ],
+)
+def test_fuzzy_queries_on_prefix_and_flat_fields(
+    create_short_string_indices, query, titles
+):
+    index = create_short_string_indices
+
+    response = index.search({"query": query})
+
+    assert sorted(document["title"] for document in response["documents"]) == titles
+
+
+def test_fuzzy_query_finds_new_keys(create_short_string_indices):
+    index = create_short_string_indices
+
+    query = {"query": {"category": {"equals": "flk", "fuzzy": True}}}
+
+    assert index.search(query)["documents"] == []
+
+    index.add({"title": "willow", "category": ["folk"]})
+
+    assert "folk" in index.fuzzy_indexes["category"]
+
+    # the plan of the first search is recompiled, because a new key was indexed
+    assert [document["title"] for document in index.search(query)["documents"]] == [
+        "willow"
+    ]
+
+
+def test_substring_index_benchmark(request):
+    if not request.config.getoption("--benchmark"):
+        pytest.skip("run with --benchmark")
+
+    random.seed(0)
+
+    words = [
+        "".join(random.choices("abcdefghijklmnopqrstuvwxyz", k=6)) for _ in range(5000)
+    ]
+    keys = list(
+        dict.fromkeys(" ".join(random.choices(words, k=3)) for _ in range(1000000))
+    )
+    substrings = [word[1:5] for word in random.sample(words, 20)]
+
+    start_time = time.time()
+
+    index = KGramIndex()
+    index.update(keys)
+
+    print(
+        f"built a k-gram index of {len(keys)} keys in {time.time() - start_time:.2f}s"
+    )
+
+    start_time = time.time()
+
+    for substring in substrings:
+        [key for key in keys if pybmoore.search(substring, key)]
+
+    scan_latency = (time.time() - start_time) / len(substrings)
+
+    start_time = time.time()
+
+    index_results = [index.containing(substring) for substring in substrings]
+
+    index_latency = (time.time() - start_time) / len(substrings)
+
+    print(
+        f"Boyer-Moore scan: {scan_latency * 1000:.2f}ms per query, "
+        f"k-gram index: {index_latency * 1000:.2f}ms per query"
+    )
+
+    # pybmoore misses some matches, so the results are checked against the in operator
+    assert index_results == [
+        [key for key in keys if substring in key] for substring in substrings
+    ]
+    assert index_latency < scan_latency